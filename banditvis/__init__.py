@@ -9,7 +9,7 @@ Simulate and visualize Bandit algorithms.
 
 __version__ = '0.8'
 
-from banditvis.core import StoBandit, LinBandit, Algorithm
+from banditvis.core import StoBandit, BatchStoBandit, LinBandit, AdvBandit, BatchAdvBandit, Algorithm
 from banditvis.algorithms import *
-from banditvis.arms import BernoulliArm, NormalArm, LinearArm
+from banditvis.arms import BernoulliArm, NormalArm, LinearArm, GeneralArm, ArmSet
 from banditvis.simulation import Simulation
@@ -4,7 +4,9 @@ Entry point for the banditvis script installed along with this package.
 
 Usage:
     banditvis [options] input
+    banditvis [options] --resume=<directory>
     banditvis --default=<source>
+    banditvis bench [--quick] [--only=<text>] [--compare=<file>] [--out=<file>]
 
     banditvis -h | --help
     banditvis -V | --version
@@ -18,10 +20,23 @@ Optional:
                           current directory.
   --out=<directory>     The path to the output location, defaults to the
                           current directory.
+  --seed=<int>          Seed the random number generators, overriding any Seed
+                          declared in the input file.
+  --resume=<directory>  Resume the interrupted Histogram or Variable run whose
+                          data directory is given, running only the missing work.
+  --profile             Time each phase of every simulation, and write a
+                          report next to its data files.
   -v, --verbose         Display additional information.
 
 Other:
   --default=<source>    Source defaults from a specified file.
+
+Bench:
+  --quick               Only benchmark a few numbers of arms and one horizon.
+  --only=<text>         Only run the cases whose name contains the text.
+  --budget=<seconds>    The time each case may run for, defaults to 1.
+  --compare=<file>      Compare with the results of an earlier run.
+  --out=<file>          The path of the JSON results, defaults to bench.json.
 """
 from . import __version__
 from .manager import run
@@ -50,8 +65,14 @@ def get_args():
         help="The path to the output location, defaults to the current directory.")
     parser.add_argument("-D", "--delete", action='store_true',
         help="Delete intermediate data files.")
+    parser.add_argument("--seed", nargs='?', type=int,
+        help="Seed the random number generators, overriding any Seed declared in the input file.")
+    parser.add_argument("--resume", nargs='?',
+        help="Resume the interrupted Histogram or Variable run whose data directory is given.")
     parser.add_argument("--default", nargs='?',
         help="Source defaults from a specified file.")
+    parser.add_argument("--profile", action='store_true',
+        help="Time each phase of every simulation, and write a report next to its data files.")
     parser.add_argument("-v","--verbose", action='store_true',
         help="Display additional information.")
 
@@ -89,6 +110,9 @@ def get_args():
         return args
 
 def main():
+    if sys.argv[1:2] == ['bench']:
+        from . import bench
+        sys.exit(bench.main(sys.argv[2:]))
     run(**get_args())
 
 if __name__ == "__main__":
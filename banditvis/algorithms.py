@@ -9,10 +9,20 @@ Returns:
     * index of chosen arm
 
 There are also indices, denoted b{1...9}, to be used with certain algorithms.
+
+The stochastic algorithms and indices operate along the last axis of the bandit state, so they accept
+both a StoBandit and a BatchStoBandit; for the latter they return one arm index per replicate. In the
+same way, exp accepts both an AdvBandit and a BatchAdvBandit.
+
+Randomized algorithms draw from bandit.rng, the numpy Generator shared by the bandit and its arms.
 """
 
 import numpy as np
-from numpy.linalg import inv
+
+# the number of timesteps between exact recomputations of the Exp3 normalizer
+RENORMALIZE = 1024
+# the largest number of Newton iterations UCB_KL runs per timestep
+NEWTON_ITERATIONS = 100
 
 __all__ = [
     'random', 'greedy', 'greedy_ep',
@@ -34,7 +44,7 @@ def random(bandit, var_dict):
         * index of chosen arm
     """
     bandit.U_conf = bandit.U
-    return np.random.randint(bandit.n_arms)
+    return bandit.rng.integers(bandit.n_arms, size=bandit.U.shape[:-1])
 
 
 def greedy(bandit, var_dict):
@@ -48,7 +58,7 @@ def greedy(bandit, var_dict):
         * index of chosen arm
     """
     bandit.U_conf = bandit.U
-    return np.argmax(bandit.U)
+    return np.argmax(bandit.U, axis=-1)
 
 
 def greedy_ep(bandit, var_dict):
@@ -61,10 +71,8 @@ def greedy_ep(bandit, var_dict):
     Returns:
         * index of chosen arm
     """
-    if np.random.random() < var_dict['epsilon']:
-        return random(bandit, var_dict)
-    else:
-        return greedy(bandit, var_dict)
+    explore = bandit.rng.random(bandit.U.shape[:-1]) < var_dict['epsilon']
+    return np.where(explore, random(bandit, var_dict), greedy(bandit, var_dict))
 
 
 
@@ -83,7 +91,7 @@ def UCB(bandit, var_dict):
 
     # now everything is a vector, and numpy does the operations to all of them at the same time
     bandit.U_conf = bandit.U + np.sqrt(alpha / bandit.T * np.log(index_type(bandit)))
-    return(np.argmax(bandit.U_conf))
+    return(np.argmax(bandit.U_conf, axis=-1))
 
 
 
@@ -91,54 +99,78 @@ def UCB_KL(bandit, var_dict):
     """
     KL Upper Confidence Bound algorithm.
 
+    The index of every arm is the root of kl(U, q) = log(index) / T, solved for
+    all the arms at once with Newton's method starting from the previous
+    U_conf. Steps which would move more than halfway to 1 halve the distance
+    to 1 instead, and arms drop out of the iteration as soon as their last
+    step is within precision. Arms whose log(index) is not positive (eg. B8
+    once K T > horizon) have the empirical mean as their root and are not
+    iterated at all, arms whose step is NaN keep their last value, and
+    at most NEWTON_ITERATIONS iterations are run.
+
     Positional Arguments:
         * bandit instance
         * variable dictionary
     Returns:
         * index of chosen arm
     """
+    def entropy(p):  # clipped so that the limits at p = 0 and p = 1 evaluate to 0
+        tiny = np.finfo(float).tiny
+        return -p * np.log(np.maximum(p, tiny)) - (1-p) * np.log(np.maximum(1-p, tiny))
 
-    # TODO find a way to vectorize this...
-    # def v_f(x):  # vector version of f(x)
-    #   zero_index = bandit.U == 0
-    #   x[zero_index] = np.log(1/(1-x))
-    #   x[invert(zero_index)] = bandit.U * np.log(bandit.U/x) + (1-bandit.U) * np.log((1-bandit.U)/(1-x)) - target
-    #   return x
-    def kl( p,q ):  # the KL entropy form; specified for p = 0 since numpy cannot properly evaluate the limit
-        if p == 0:
-            return( np.log(1/(1-q)))
-        else:
-            return( p * np.log(p/q) + (1-p) * np.log((1-p)/(1-q)) )
+    def cross_entropy(p, q):  # kl(p, q) = cross_entropy(p, q) - entropy(p)
+        return -p * np.log(q) - (1-p) * np.log(1-q)
 
-    def dkl( p,q ):  # the derivative of the KL entropy form with respect to q
-        return( (q - p) / (q * (1-q)) )
+    def dkl(p, q):  # the derivative of the KL entropy form with respect to q
+        return (q - p) / (q * (1-q))
 
     index_type = var_dict['incr']
     precision = 1.0/bandit.horizon[0]
 
-    for i, (num, pulls, index) in enumerate(zip(bandit.U, bandit.T, index_type(bandit))):
-        target = 1.0/pulls * np.log(index)
-        if num == 1:
-            bandit.U_conf[i] = 1
-        else:
-            if bandit.U_conf[i] == 1:
-                bandit.U_conf[i] = num
-            while True:
-                if kl(num, bandit.U_conf[i]) < target:
-                    bandit.U_conf[i] = (bandit.U_conf[i] + 1) * 0.5
-                else:
-                    break
-            n = 1
-            while n > precision:
-                n = (kl(num, bandit.U_conf[i]) - target)/dkl(num, bandit.U_conf[i])
-                bandit.U_conf[i] = bandit.U_conf[i] - n
-    return np.argmax(bandit.U_conf)
+    num = bandit.U
+    log_index = np.log(index_type(bandit))
+    # kl(num, q) = target is solved as cross_entropy(num, q) = target + entropy(num), since the
+    # entropy term does not change between iterations
+    target = 1.0/bandit.T * log_index + entropy(num)
+
+    # restart from the empirical mean when the previous index is pinned at 1 or fell below the mean
+    conf = np.where((bandit.U_conf == 1) | (bandit.U_conf < num), num, bandit.U_conf)
+    # kl(num, q) <= 0 only has the root q = num
+    settled = np.broadcast_to(log_index <= 0, num.shape)
+    conf[settled] = num[settled]
+    conf[num == 1] = 1
+
+    # Newton's method, keeping a mask of the arms which have not converged
+    active = (num != 1) & np.invert(settled)
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        for iteration in range(NEWTON_ITERATIONS):
+            if not active.any():
+                break
+            p = num[active]
+            q = conf[active]
+            n = (cross_entropy(p, q) - target[active])/dkl(p, q)
+            step = q - n
+            halved = np.invert(step < (q + 1) * 0.5)
+            step[halved] = (q[halved] + 1) * 0.5
+            # an infinite n (from q = p) is halved towards 1, but a NaN one has no direction
+            stuck = np.isnan(n) | np.invert(np.isfinite(step))
+            conf[active] = np.where(stuck, q, step)
+            active[active] = np.invert(stuck) & (halved | (np.abs(n) > precision))
+
+    bandit.U_conf = conf
+    return np.argmax(bandit.U_conf, axis=-1)
 
 
 def Bayes_Gauss(bandit, var_dict):
     """
     Bayes Gaussian Algorithm
 
+    The index of every arm is the 1 - 1/index quantile of its posterior. Since
+    the posterior of each arm is a normal distribution with mean U and
+    standard deviation sqrt(1/T), the quantile is solved once per index value
+    for the standard normal using Newton's method, then shifted and scaled for
+    each arm.
+
     Note: for precision reasons, only accurate to a horizon of 5000!
 
     Positional Arguments:
@@ -147,30 +179,28 @@ def Bayes_Gauss(bandit, var_dict):
     Returns:
         * index of chosen arm
     """
-    def npdf(x, mu, sigma):
-        return 0.39894228 / sigma * 0.60653066**(((x-mu)/(sigma))**2)
-    def ncdf(x, mu, sigma):
-        return(1.0 / (1+np.e**(-0.07056*((x-mu)/(sigma))**3 - 1.5976*((x-mu)/(sigma)))))
+    def npdf(z):
+        return 0.39894228 * np.exp(-0.5 * z**2)
+    def ncdf(z):
+        return(1.0 / (1+np.exp(-0.07056*z**3 - 1.5976*z)))
     index_type = var_dict['incr']
 
     precision = 1.0 / bandit.horizon[0]
-    for i, (num, pulls, index) in enumerate(zip(bandit.U, bandit.T, index_type(bandit))):
-
-        if pulls == 0:
-            bandit.U_conf[i] = 100000
-
-        init = num
-        mu = num
-        sigma = np.sqrt(1.0/pulls)
-
-        n = 1
-        while n > precision or n * (-1) > precision:
-            n = (ncdf(init, mu, sigma) - (1-1/index))/npdf(init, mu, sigma)
-            init = init - n
-
-        bandit.U_conf[i] = init
-
-    return np.argmax(bandit.U_conf)
+    level = 1 - 1/np.asarray(index_type(bandit), dtype=float)
+
+    # Newton's method, keeping a mask of the quantiles which have not converged
+    z = np.zeros(level.shape)
+    active = np.ones(level.shape, dtype=bool)
+    while active.any():
+        n = (ncdf(z[active]) - level[active])/npdf(z[active])
+        z[active] = z[active] - n
+        active[active] = np.abs(n) > precision
+
+    # unpulled arms are always chosen first
+    with np.errstate(divide='ignore', invalid='ignore'):
+        bandit.U_conf = bandit.U + np.sqrt(1.0/bandit.T) * z
+    bandit.U_conf[bandit.T == 0] = 100000
+    return np.argmax(bandit.U_conf, axis=-1)
 
 def TS_Beta(bandit, var_dict):
     """
@@ -182,7 +212,7 @@ def TS_Beta(bandit, var_dict):
     Returns:
         * index of chosen arm
     """
-    return np.argmax(np.random.beta(bandit.arm_reward + 1, bandit.T - bandit.arm_reward + 1))
+    return np.argmax(bandit.rng.beta(bandit.arm_reward + 1, bandit.T - bandit.arm_reward + 1), axis=-1)
 
 def TS_Gauss(bandit, var_dict):
     """
@@ -195,11 +225,12 @@ def TS_Gauss(bandit, var_dict):
         * index of chosen arm
     """
     mask = bandit.T == 0
+    pulled = np.invert(mask)
     bandit.U_conf[mask] += 100000
-    bandit.U_conf[np.invert(mask)] = np.random.normal(
-        bandit.U,
-        np.sqrt(1.0/bandit.T))
-    return np.argmax(bandit.U_conf)
+    bandit.U_conf[pulled] = bandit.rng.normal(
+        bandit.U[pulled],
+        np.sqrt(1.0/bandit.T[pulled]))
+    return np.argmax(bandit.U_conf, axis=-1)
 
 
 def UCB_Lin(bandit, var_dict):
@@ -216,14 +247,14 @@ def UCB_Lin(bandit, var_dict):
     bandit.U_conf = (np.inner(bandit.arm_vecs, bandit.U)
         + np.sqrt(rho * np.einsum('ij,ij->i',
             np.inner(bandit.arm_vecs,
-            inv(bandit.G)), bandit.arm_vecs)))
+            bandit.G_inv), bandit.arm_vecs)))
 
     return np.argmax(bandit.U_conf)
 
 def TS_Lin(bandit, var_dict):
     """
     Does Thompson Sampling from the multivariate distribution with mean
-    bandit.U and covariance inv(bandit.G)
+    bandit.U and covariance inv(bandit.G), which the bandit keeps as bandit.G_inv
 
     Positional Arguments:
         * bandit instance
@@ -232,23 +263,59 @@ def TS_Lin(bandit, var_dict):
         * index of chosen arm
     """
     bandit.U_conf = np.einsum('ij,ij->i',
-        np.random.multivariate_normal(
+        bandit.rng.multivariate_normal(
             bandit.U,
-            inv(bandit.G),
+            bandit.G_inv,
             bandit.n_arms),
         bandit.arm_vecs)
 
     return np.argmax(bandit.U_conf)
 
 def exp(bandit, var_dict):
-    # first make the probability distribution
-    nu = var_dict['nu']
-    p_dist = bandit.W/np.sum(bandit.W)
-    # then draw from it
-    arm_chosen = np.argmax(np.random.multinomial(1, p_dist))
-    # update the weights
-    bandit.W[arm_chosen] *= np.exp(-nu * bandit.seq[arm_chosen][bandit.timestep[0]-1]/p_dist[arm_chosen])
-    return arm_chosen
+    """
+    Exp3, for adversarial bandits (AdvBandit or BatchAdvBandit).
+
+    The weights are kept in log space (bandit.logW) along with a running log
+    normalizer (bandit.log_norm), so they never underflow however long the
+    horizon. Changing the weight of one arm by delta changes the normalizer by
+    log1p(p * expm1(delta)), so the normalizer is updated in constant time. It
+    is recomputed exactly when the chosen arm holds most of the weight, where
+    that update loses precision, and every RENORMALIZE timesteps to stop
+    rounding errors from building up. The chosen arm's loss at the current timestep is
+    importance-weighted by its probability.
+
+    Positional Arguments:
+        * bandit instance
+        * variable dictionary
+    Keyword Arguments (in the variable dictionary):
+        * nu: the learning rate, defaults to sqrt(2 log K / (K horizon))
+    Returns:
+        * index of chosen arm
+    """
+    n_arms = bandit.logW.shape[-1]
+    nu = var_dict.get('nu', np.sqrt(2 * np.log(n_arms) / (n_arms * bandit.horizon[0])))
+    t = bandit.timestep[0]
+
+    if t % RENORMALIZE == 0:
+        bandit.log_norm[...] = np.logaddexp.reduce(bandit.logW, axis=-1)
+    p_dist = np.exp(bandit.logW - bandit.log_norm[..., None])
+
+    # inverse-cdf sampling, which also absorbs any drift of the normalizer
+    cdf = np.cumsum(p_dist, axis=-1)
+    u = bandit.rng.random(size=bandit.logW.shape[:-1] + (1,)) * cdf[..., -1:]
+    arm = np.minimum(np.sum(cdf <= u, axis=-1), n_arms - 1)
+
+    p = np.take_along_axis(p_dist, arm[..., None], axis=-1)[..., 0]
+    delta = -nu * bandit.seq[arm, t] / (p / cdf[..., -1])
+    np.put_along_axis(bandit.logW, arm[..., None],
+        np.take_along_axis(bandit.logW, arm[..., None], axis=-1) + delta[..., None], axis=-1)
+
+    # the constant-time update cancels badly when the chosen arm holds most of the weight
+    dominant = p > 0.5
+    bandit.log_norm += np.log1p(np.where(dominant, 0, p * np.expm1(delta)))
+    if np.any(dominant):
+        bandit.log_norm[dominant] = np.logaddexp.reduce(bandit.logW[dominant], axis=-1)
+    return arm
 
 def B1(bandit):
     return bandit.timestep
@@ -265,35 +332,71 @@ def B4(bandit):
 def B5(bandit):
     return bandit.horizon / bandit.T
 
+def _min_sums(bandit):
+    """
+    The sum of min(T_n, T_m) over every arm n, for every arm m, which is T_m times the column sum
+    of min(1, T_n / T_m) used by B6 and B7.
+
+    With the pull counts sorted, the j^th smallest count s_j gives the sum s_1 + ... + s_j +
+    s_j (K - j), so every sum is found with a sort and a cumulative sum. The sums are then kept
+    on the bandit (bandit.min_sums, along with the counts they were computed from) and updated as
+    the counts change: when a pull takes an arm from c to c + 1 pulls, the sum of every other arm
+    with at least c + 1 pulls grows by 1, and that of the pulled arm by the number of arms with at
+    least c + 1 pulls (itself included), which is O(K) per pull. On a BatchStoBandit, every
+    replicate is updated in this way. Counts which changed in any other way (eg. after a reset)
+    are sorted again.
+    """
+    T = bandit.T
+    cached = getattr(bandit, 'min_sums', None)
+    if cached is not None and cached[0].shape == T.shape:
+        counts, sums = cached
+        if T.ndim == 1:
+            # a single bandit is updated with scalar indexing, which is much cheaper
+            changed = np.flatnonzero(T != counts)
+            if not len(changed):
+                return sums
+            arm = changed[0]
+            if len(changed) == 1 and T[arm] == counts[arm] + 1:
+                above = T >= T[arm]
+                sums += above
+                sums[arm] += np.count_nonzero(above) - 1
+                counts[arm] += 1
+                return sums
+        else:
+            delta = T - counts
+            rows, arm = np.nonzero(delta)
+            if (delta[rows, arm] == 1).all() and (np.diff(rows) > 0).all():
+                above = T[rows] >= T[rows, arm, np.newaxis]
+                sums[rows] += above
+                sums[rows, arm] += np.count_nonzero(above, axis=1) - 1
+                counts[rows, arm] += 1
+                return sums
+
+    order = np.argsort(T, axis=-1)
+    ordered = np.take_along_axis(T, order, axis=-1)
+    sums = np.empty_like(T)
+    np.put_along_axis(sums, order, np.cumsum(ordered, axis=-1)
+        + ordered * np.arange(T.shape[-1] - 1, -1, -1), axis=-1)
+    bandit.min_sums = (T.copy(), sums)
+    return sums
+
 def B6(bandit):
     """
-    * Makes a n * m matrix with every element sqrt(T_n / T_m)
-    * Takes the minimum of that matrix and a matric of ones, element by element
-    * Takes the sum down columns
+    * Sums min(1, T_n / T_m) over n for every arm m (see _min_sums)
     * Multiplies by original T element by element across rows
     * Divides the timestep by each element
     * adds 1
     """
-    return 1 + bandit.timestep / (bandit.T * np.sum(
-        np.minimum(
-            np.ones((bandit.n_arms, bandit.n_arms)),
-            (np.tile(np.array([bandit.T]).T, (1, bandit.n_arms))/bandit.T)),
-        0))
+    return 1 + bandit.timestep / _min_sums(bandit)
 
 def B7(bandit):
     """
-    * Makes a n * m matrix with every element sqrt(T_n / T_m)
-    * Takes the minimum of that matrix and a matric of ones, element by element
-    * Takes the sum down columns
+    * Sums min(1, T_n / T_m) over n for every arm m (see _min_sums)
     * Multiplies by original T element by element across rows
     * Divides the timestep by each element
     * Takes the maximum of each element with respect to e
     """
-    return np.maximum(np.e, bandit.timestep / (bandit.T * np.sum(
-        np.minimum(
-            np.ones((bandit.n_arms, bandit.n_arms)),
-            (np.tile(np.array([bandit.T]).T, (1, bandit.n_arms))/bandit.T)),
-        0)))
+    return np.maximum(np.e, bandit.timestep / _min_sums(bandit))
 
 def B8(bandit):
     return bandit.horizon / (bandit.n_arms * bandit.T)
@@ -1,23 +1,42 @@
 import copy
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading as th
+from types import SimpleNamespace
 
 import numpy as np
 import matplotlib as mpl
 import matplotlib.pyplot as plt
 import matplotlib.animation as animation
 import matplotlib.patches as mpatches
+import matplotlib.lines as mlines
+from matplotlib.collections import LineCollection, PolyCollection
 from scipy.stats import beta
+from PIL import Image
 
 from .simulation import ReMapSim
 from .formatting import cmap_colors, mpl_defaults
+from .store import ResultTail, result_path
+from .trajectory import TrajectoryStats, HISTOGRAM_BINS, histogram_range
+from .timeline import Timeline, timeline_frames
+from .helper import safe_save
 
 import time
 
 def HistAnimation(core_dict):
     """
-    Makes an animation of a Histogram.
+    Makes a live animation of the Histogram of every simulation.
+
+    The data files are followed with a ResultTail each, so every frame only
+    reads the results appended since the previous frame, adds them to the bin
+    counts of a TrajectoryStats, and sets the heights of the existing bars and
+    the position of the mean lines; nothing is reloaded or redrawn from
+    scratch, so frame time does not grow with the number of cycles.
 
     TODO
-    * fix bins
     * custom user labels
     """
 
@@ -29,9 +48,9 @@ def HistAnimation(core_dict):
     plt.rcParams['axes.labelsize'] = 13
 
     # plot variables
-    cmap1 = plt.cm.get_cmap('BuGn')
-    cmap2 = plt.cm.get_cmap('Blues')
-    bins = np.linspace(0,core_dict['bins'][0],100)
+    lower, upper = histogram_range(core_dict)
+    bins = np.linspace(lower, upper, HISTOGRAM_BINS + 1)
+    widths = np.diff(bins)
 
     # formatting
     plt.tick_params(
@@ -47,295 +66,278 @@ def HistAnimation(core_dict):
     ax.spines['top'].set_color('none')
     ax.spines['left'].set_color('none')
 
-    # load data
-    data = np.loadtxt(core_dict['DataFolder'] + "/data0.txt", float)
-
-    # update function used by the animation
-    def _update(num, data):
-        nonlocal cmap1, bins, ax
-
-        # clear axes, load data to refresh
-        plt.cla()
-        data = np.loadtxt(core_dict['DataFolder'] + "/data0.txt", float)
-
-        # plots
-        plt.axvline(x = np.average(data),
-            color = cmap1(0.5),
-            ls="--" ,
-            linewidth=1.7)
-        plt.hist(data, bins,
+    # the bars and mean line of every simulation, drawn once and updated in place
+    tails, stats, bars, lines = [], [], [], []
+    for i, sim_dict in enumerate(core_dict['sim']):
+        cmap = cmap_colors.sequential1[i]
+        tails.append(ResultTail(result_path(core_dict['DataFolder'], i)))
+        stats.append(TrajectoryStats([sim_dict['horizon']], lower, upper, HISTOGRAM_BINS))
+        bars.append(ax.bar(bins[:-1], np.zeros(HISTOGRAM_BINS), widths,
+            align='edge',
             alpha=0.6,
-            normed=1,
-            facecolor=cmap1(0.8),
-            label="X ~ Beta(2,5)")
+            color=cmap(0.8),
+            label=sim_dict['label']))
+        lines.append(ax.axvline(x=0,
+            color=cmap(0.5),
+            ls="--",
+            linewidth=1.7,
+            visible=False))
+
+    # labels
+    legend = plt.legend(loc='upper right', framealpha = 1.0)
+    legend.get_frame().set_linewidth(1)
+    plt.title(core_dict['PlotTitle'], style='italic')
+    plt.xlabel('Regret')
+    plt.ylabel('Frequency')
+    ax.set_xlim([lower, upper])
+    ax.set_ylim([0, 0.2])
 
-        # labels
-        legend = plt.legend(loc='upper right', framealpha = 1.0)
-        legend.get_frame().set_linewidth(1)
-        plt.title(core_dict['PlotTitle'], style='italic')
+    # update function used by the animation
+    def _update(num):
+        top = 0
+        for i in range(len(tails)):
+            new = tails[i].read()
+            if len(new):
+                stats[i].add(new, 0)
+            count = stats[i].count[0]
+            if count == 0:
+                continue
+            heights = stats[i].hist[0] / (count * widths)
+            for rect, height in zip(bars[i], heights):
+                rect.set_height(height)
+            lines[i].set_xdata([stats[i].mean[0]] * 2)
+            lines[i].set_visible(True)
+            top = max(top, np.amax(heights))
+
+        # the y axis only grows, so that it does not jump around between frames
+        if top > ax.get_ylim()[1]:
+            ax.set_ylim([0, 1.1 * top])
 
-        plt.xlabel('Regret')
-        plt.ylabel('Frequency')
-        ax.set_ylim([0,0.2])
     # build the animation and run it
     my_ani = animation.FuncAnimation(fig, _update,
-        fargs=(data, ),
         interval=1000/core_dict['FPS'])
     plt.show()
 
 
-def ConfAnimation(core_dict):
-    """
-    Animates the confidence intervals.
+# arms past this number are drawn without their pull counts, tick labels and bar edges
+LABELLED_ARMS = 20
+# the radii of the level curves drawn by EllipseAnimation with LevelCurves
+LEVELS = [33, 29, 25, 21, 17, 13, 9, 5, 1]
+# the factor the y limit of DistAnimation grows by once a pdf outgrows it
+Y_GROWTH = 1.5
 
-    Since only one cycle is run at a given time, the bandit algorithm is run at
-    the same time as the animation rather than using an external data source.
 
-    TODO
-    * y limits might not be correct in some cases; specify
+def _state(bandit):
     """
+    The quantities of a bandit drawn by the animation views, as read by their update(state).
+    """
+    return SimpleNamespace(
+        T=bandit.T,
+        U=bandit.U,
+        U_conf=bandit.U_conf,
+        arm_reward=getattr(bandit, 'arm_reward', None),
+        G_inv=getattr(bandit, 'G_inv', None),
+        regret=bandit.giveRegret(),
+        timestep=int(bandit.timestep[0]))
 
-    # defaults
-    fig, ax = mpl_defaults.ani()
 
-    # map the core_dict to actual objects
-    ReMapSim(core_dict['sim'][0])
+def _info(ax):
+    """
+    The text box in the upper left of ax which shows the regret and the timestep.
+    """
+    return ax.text(0.02, 0.97, "",
+        transform=ax.transAxes,
+        va='top',
+        ha='left',
+        bbox=dict(facecolor='white', edgecolor='#cccccc', boxstyle='round'))
 
-    # plot variables
-    sim = core_dict['sim'][0]['Simulation']
-    arms = sim.bandit.n_arms
-    title = "Upper Confidence Animation\n"
-    not_picked_color = plt.cm.get_cmap('BuGn')(0.6)
-    picked_color = plt.cm.get_cmap('OrRd')(0.6)
-    bar_width = 0.45
 
-    # simulation variables
-    horizon = core_dict['horizon']
-    confidence = sim.bandit.U_conf
-    index = np.arange(arms)
+def _info_text(state):
+    return 'Regret: {:04.2f}\nTimestep: {:2d}'.format(state.regret, state.timestep)
 
-    # initialize the bandit
-    for i in range(arms):
-        sim.bandit.pullArm(i)
 
-    pause = False
-    # the animation update function
-    def _update(num, confidence):
-        nonlocal ax, pause
+def _ellipse(rho, cov):
+    """
+    The width, height and angle (in degrees) of the ellipse of radius rho of the 2x2 covariance
+    matrix cov; width and height are full widths, not radii.
+    """
+    vals, vecs = np.linalg.eigh(cov)
+    order = vals.argsort()[::-1]
+    vals, vecs = vals[order], vecs[:,order]
+    width, height = 2 * np.sqrt(rho * vals)
+    return width, height, np.degrees(np.arctan2(*vecs[:,0][::-1]))
 
-        # ste bandit 1 timestep
-        if not pause:
-            sim.runStep(1, horizon)
-        confidence = sim.bandit.U_conf
-        max_confidence = np.amax(sim.bandit.U_conf)
-
-        # clear plot to redraw
-        plt.cla()
-        x_labels = ["Pulls: "+str(item) for item in sim.bandit.T]
-        # make a bar plot
-        bar_list = plt.bar(index, confidence, bar_width,
-            align='center',
-            color=not_picked_color,
-            edgecolor='#e6e6e6')
-
-        # add a maximum line
-        plt.axhline(y=max_confidence,
+
+class _ConfView:
+    """
+    The artists of ConfAnimation.
+
+    Every artist is created once, and update(state) only changes their data, so a frame costs a
+    few array assignments no matter the number of arms.
+
+    Positional Arguments:
+        * ax: the axes to draw on
+        * sim: the Simulation being animated
+        * core_dict: the core dictionary of the run
+    Attributes:
+        * artists: the artists which change between frames, in drawing order
+    Methods:
+        * update(state): sets the artists to a state (see _state) and returns them
+    """
+    # the milliseconds between two frames at 1 FPS
+    interval = 1000
+
+    def __init__(self, ax, sim, core_dict):
+        n_arms = sim.bandit.n_arms
+        index = np.arange(n_arms)
+        bar_width = 0.45
+        self.picked_color = plt.cm.get_cmap('OrRd')(0.6)
+        self.not_picked_color = plt.cm.get_cmap('BuGn')(0.6)
+        self.picked = 0
+
+        # the bars are a single PolyCollection of rectangles, drawn in one call
+        self.left = index - bar_width/2
+        self.right = index + bar_width/2
+        self.colors = np.tile(mpl.colors.to_rgba(self.not_picked_color), (n_arms, 1))
+        self.bars = PolyCollection(self._boxes(np.zeros(n_arms)),
+            facecolors=self.colors,
+            edgecolors='#e6e6e6' if n_arms <= LABELLED_ARMS else 'none')
+        ax.add_collection(self.bars)
+        self.max_line = ax.axhline(y=0,
             ls='dashdot',
-            xmin=0.0,
-            xmax=1.0,
             linewidth=2.0,
             color='#434343')
 
-        # change the colour of the best arm (the picked arm)
-        bar_list[np.argmax(confidence)].set_facecolor(picked_color)
+        # the mean markers of every arm are a single LineCollection of horizontal segments
+        true_means = LineCollection(self._segments(sim.bandit.mean_list),
+            linewidths=2,
+            colors='#000000',
+            linestyles='dashed')
+        self.means = LineCollection(self._segments(np.zeros(n_arms)),
+            linewidths=1,
+            colors='#000000')
+        ax.add_collection(true_means)
+        ax.add_collection(self.means)
+
+        # pull counts are only readable for a few arms
+        self.pulls = []
+        if n_arms <= LABELLED_ARMS:
+            self.pulls = [ax.text(i, 0.01, "",
+                ha='center',
+                va='bottom',
+                weight='bold',
+                fontsize='small') for i in index]
+            ax.set_xticks(index)
+            ax.set_xticklabels(["Arm {}".format(i+1) for i in index])
+        else:
+            ax.set_xticks([])
 
-        # add dashed lines for the actual mean of each arm
-        for i in range(sim.bandit.n_arms):
-            x = [i - bar_width/2, i + bar_width/2]
-            y = [sim.bandit.mean_list[i], sim.bandit.mean_list[i]]
-            plt.plot(x,y,'--',
-                linewidth = 2,
-                color='#000000',
-                ls='dashed',
-                mfc='white')
-
-        # add dotted lines for the empirical mean of each arm
-        for i in range(sim.bandit.n_arms):
-            x = [i - bar_width/2, i + bar_width/2]
-            y = [sim.bandit.U[i], sim.bandit.U[i]]
-            plt.plot(x,y,'--',
-                linewidth = 1,
-                color='#000000',
-                ls='-',
-                mfc='white')
-
-        # add x labels
-        plt.xticks(index, x_labels, weight='bold')
-
-        # add two legends:
-        #   * a real legend
-        #   * one to display interesting information
         picked_color_path = mpatches.Patch(
-            color=picked_color,
+            color=self.picked_color,
             label='Arm chosen')
         not_picked_color_path = mpatches.Patch(
-            color=not_picked_color,
+            color=self.not_picked_color,
             label='Arm(s) not chosen')
-        dash_label, = plt.plot([], [],
+        dash_label = mlines.Line2D([], [],
             ls="dashed",
             label="Actual Mean",
             color='black')
-        dashdot_label, = plt.plot([], [],
+        solid_label = mlines.Line2D([], [],
             ls="-",
             linewidth=1.0,
             label="Empirical Mean",
             color='black')
-        legend_1 = plt.legend(
-            handles=[picked_color_path, not_picked_color_path, dash_label, dashdot_label],
+        legend = ax.legend(
+            handles=[picked_color_path, not_picked_color_path, dash_label, solid_label],
             loc='upper right')
-        plt.gca().add_artist(legend_1)  # prevent legend_2 from overwriting
-        legend_1.get_frame().set_linewidth(1)
-
-        blank_path_1 = mpatches.Patch(
-            label='Regret: {:04.2f}'.format(sim.bandit.giveRegret()))
-        blank_path_2 = mpatches.Patch(
-            label='Timestep: {:2d}'.format(sim.bandit.timestep[0]))
-        legend_2 = plt.legend(
-            handles=[blank_path_1, blank_path_2],
-            loc='upper left',
-            handlelength=0,
-            handletextpad=0)
-        legend_2.get_frame().set_linewidth(1)
+        legend.get_frame().set_linewidth(1)
+        self.info = _info(ax)
 
         # formatting
         ax.grid(False)  # resets grid default
+        ax.set_xlim([-0.5, n_arms - 0.5])
         ax.set_ylim([0,1.2])
         ax.yaxis.grid(True)  # turns horizontal grid on
-
-        plt.title(title)
-
-    def onClick(event):
-        nonlocal pause
-        pause ^= True
-    fig.canvas.mpl_connect('button_press_event', onClick)
-    # the animation declaration
-    my_ani = animation.FuncAnimation(fig, _update,
-        fargs=(sim.bandit.U_conf, ),
-        interval=1000/core_dict['FPS'])  # fargs is used as the data required in update_hist
-
-    plt.show()
-
-
-def EllipseAnimation(core_dict):
+        ax.set_title("Upper Confidence Animation\n")
+
+        # the true means and the legend are redrawn so they stay on top of the bars
+        self.artists = [self.bars, self.max_line, true_means, self.means] + self.pulls \
+            + [legend, self.info]
+
+    def _segments(self, values):
+        values = np.asarray(values, dtype=float)
+        return np.stack([np.stack([self.left, values], axis=1),
+            np.stack([self.right, values], axis=1)], axis=1)
+
+    def _boxes(self, heights):
+        heights = np.asarray(heights, dtype=float)
+        bottom = np.zeros_like(heights)
+        return np.stack([np.stack([self.left, bottom], axis=1),
+            np.stack([self.left, heights], axis=1),
+            np.stack([self.right, heights], axis=1),
+            np.stack([self.right, bottom], axis=1)], axis=1)
+
+    def update(self, state):
+        confidence = state.U_conf
+        picked = np.argmax(confidence)
+        self.bars.set_verts(self._boxes(confidence))
+        self.colors[self.picked] = mpl.colors.to_rgba(self.not_picked_color)
+        self.colors[picked] = mpl.colors.to_rgba(self.picked_color)
+        self.bars.set_facecolor(self.colors)
+        self.picked = picked
+        self.max_line.set_ydata([confidence[picked]] * 2)
+        self.means.set_segments(self._segments(state.U))
+        for text, pulls in zip(self.pulls, state.T):
+            text.set_text("Pulls: {:d}".format(int(pulls)))
+        self.info.set_text(_info_text(state))
+        return self.artists
+
+
+class _EllipseView:
     """
-    Animates the confidence intervals.
-
-    Since only one cycle is run at a given time, the bandit algorithm is run at
-    the same time as the animation rather than using an external data source.
-
-    TODO
-    * y limits might not be correct in some cases; specify
+    The artists of EllipseAnimation.
+
+    The axes, arm vectors, projection lines and true mean are drawn once as the background; each
+    frame only moves and reshapes the confidence ellipse(s), the approximated mean and the chosen
+    arm marker.
+
+    Positional Arguments:
+        * ax: the axes to draw on
+        * sim: the Simulation being animated
+        * core_dict: the core dictionary of the run
+    Attributes:
+        * artists: the artists which change between frames, in drawing order
+    Methods:
+        * update(state): sets the artists to a state (see _state) and returns them
     """
-
-    # defaults
-    fig, ax = mpl_defaults.ani()
-    ax.set_aspect('equal')
-    # map the core_dict sim to actual objects
-    ReMapSim(core_dict['sim'][0])
-
-    # simulation variables
-    sim = core_dict['sim'][0]['Simulation']
-    sim_dict = core_dict['sim'][0]
-    arms = sim.bandit.arm_vecs
-    mean = np.array(sim.bandit.mean)
-    horizon = core_dict['horizon']
-    title = "2D Confidence Ellipse Animation\n"
-
-    # the locations of the perpindicular projection of the arm vector onto the
-    # mean vector
-    projs = np.array(
-        [mean / np.linalg.norm(mean)**2 * np.inner(arm, mean) for arm in arms])
-    cmap1 = plt.cm.get_cmap('BuGn')
-    cmap2 = plt.cm.get_cmap('Reds')
-
-    # establish plot boundaries
-    all_points = np.vstack((arms, mean))
-    x_max = np.amax(all_points[:,0])
-    x_min = np.amin(all_points[:,0])
-    y_max = np.amax(all_points[:,1])
-    y_min = np.amin(all_points[:,1])
-    x_margin = (x_max-x_min)
-    y_margin = (y_max-y_min)
-    x_max += x_margin/3
-    x_min -= x_margin/5  # less margin on left
-    y_max += y_margin/3
-    y_min -= y_margin/5  # less margin at bottom
-
-    # set up the figure and axes
-
-    # initialize the bandit
-    for i in range(sim.bandit.n_arms):
-        sim.bandit.pullArm(i)
-
-
-    def plot_ellipse(rho, cov, pos, ax=None, **kwargs):
-        """
-        Plots an ellipse based on the specified covariance on the parameter rho
-        matrix (`cov`). Additional keyword arguments are passed on to the
-        ellipse patch artist.
-
-        Parameters
-        ----------
-            rho : the radius of the ellipse
-            cov : The 2x2 covariance matrix to base the ellipse on
-            pos : The location of the center of the ellipse. Expects a 2-element
-                sequence of [x0, y0].
-            ax : The axis that the ellipse will be plotted on. Defaults to the
-                current axis.
-            Additional keyword arguments are pass on to the ellipse patch.
-
-        Returns
-        -------
-            A matplotlib ellipse artist
-        """
-        def eigsorted(cov):
-            vals, vecs = np.linalg.eigh(cov)
-            order = vals.argsort()[::-1]
-            return vals[order], vecs[:,order]
-
-        if ax is None:
-            ax = plt.gca()
-
-        vals, vecs = eigsorted(cov)
-        theta = np.degrees(np.arctan2(*vecs[:,0][::-1]))
-
-        # width and height are full width, not radius
-        width, height = 2 * np.sqrt(rho * vals)
-        ellip = mpatches.Ellipse(
-            xy=pos,
-            width=width,
-            height=height,
-            angle=theta,
-            **kwargs)
-        ax.add_artist(ellip)
-        return ellip
-
-    # the animation update function
-    
-    pause = False
-    def _update(num, confidence):
-        nonlocal ax, pause
-
-        # step the bandit
-        if not pause:
-            sim.runStep(1, horizon)
-        rho = sim.bandit.dim * np.log(sim.bandit.timestep[0])
-        G_inv = np.linalg.inv(sim.bandit.G)
-        bandit_mean = sim.bandit.U
-        chosen_arm = sim.bandit.arm_vecs[np.argmax(sim.bandit.U_conf)]
-
-        # clear plot to redraw
-        plt.cla()
+    # the milliseconds between two frames at 1 FPS
+    interval = 1000
+
+    def __init__(self, ax, sim, core_dict):
+        sim_dict = core_dict['sim'][0]
+        self.arms = np.array(sim.bandit.arm_vecs)
+        self.dim = sim.bandit.dim
+        mean = np.array(sim.bandit.mean)
+        cmap1 = plt.cm.get_cmap('BuGn')
+        cmap2 = plt.cm.get_cmap('Reds')
+
+        # the locations of the perpindicular projection of the arm vector onto the
+        # mean vector
+        projs = np.array(
+            [mean / np.linalg.norm(mean)**2 * np.inner(arm, mean) for arm in self.arms])
+
+        # establish plot boundaries
+        all_points = np.vstack((self.arms, mean))
+        x_max = np.amax(all_points[:,0])
+        x_min = np.amin(all_points[:,0])
+        y_max = np.amax(all_points[:,1])
+        y_min = np.amin(all_points[:,1])
+        x_margin = (x_max-x_min)
+        y_margin = (y_max-y_min)
+        x_max += x_margin/3
+        x_min -= x_margin/5  # less margin on left
+        y_max += y_margin/3
+        y_min -= y_margin/5  # less margin at bottom
 
         # general formatting
         ax.grid(True)
@@ -348,7 +350,7 @@ def EllipseAnimation(core_dict):
                 edgecolor='None',
                 alpha=0.65 ))
 
-            # format the axes
+        # format the axes
         ax.spines['left'].set_visible(True)
         ax.xaxis.set_ticks_position('bottom')
         ax.spines['bottom'].set_position(('data',0))
@@ -369,202 +371,489 @@ def EllipseAnimation(core_dict):
                 alpha=0.2,
                 facecolor='none'))
 
-            # position of mean vector
+        # position of mean vector
         labelstr = 'True Mean'
         if sim_dict['Normalized']:
             labelstr = 'Normalized Mean'
-        plt.plot([mean[0]],[mean[1]], "o",
-                color='black',
-                label=labelstr)
-
-        # plot the ellipse and the mean; checks for LevelCurves option
-        if (sim.alg.var_dict['algtype'].__name__ == "TS_Lin"
-                and core_dict['LevelCurves'] == True):
-            for i in [33, 29, 25, 21, 17, 13, 9, 5, 1]:
-                plot_ellipse(i, G_inv, bandit_mean,
-                        alpha=0.1,
-                        ls='dashed',
-                        facecolor=cmap1(0.2),
-                        edgecolor='black')
+        ax.plot([mean[0]],[mean[1]], "o",
+            color='black',
+            label=labelstr)
+
+        # the ellipse and the mean; checks for LevelCurves option
+        self.level_curves = (sim.alg.var_dict['algtype'].__name__ == "TS_Lin"
+            and core_dict['LevelCurves'] == True)
+        if self.level_curves:
+            self.radii = LEVELS
+            self.ellipses = [mpatches.Ellipse((0, 0), 0, 0,
+                alpha=0.1,
+                ls='dashed',
+                facecolor=cmap1(0.2),
+                edgecolor='black') for r in self.radii]
+            self.approx = None
         else:
-            plot_ellipse(rho, G_inv, bandit_mean,
-                    alpha=0.2,
-                    facecolor=cmap1(0.5),
-                    edgecolor=cmap1(1.0))
-            plt.plot([sim.bandit.U[0]], [sim.bandit.U[1]], "o",
-                    markerfacecolor=cmap2(0.5),
-                    markeredgecolor=cmap2(1.0),
-                    label='Approximated Mean')
-
-            # HelpLines: dashed projection lines to show reward value
+            self.radii = [None]
+            self.ellipses = [mpatches.Ellipse((0, 0), 0, 0,
+                alpha=0.2,
+                facecolor=cmap1(0.5),
+                edgecolor=cmap1(1.0))]
+            self.approx, = ax.plot([], [], "o",
+                markerfacecolor=cmap2(0.5),
+                markeredgecolor=cmap2(1.0),
+                label='Approximated Mean')
+        for ellipse in self.ellipses:
+            ax.add_patch(ellipse)
+
+        # HelpLines: dashed projection lines to show reward value
         if core_dict['HelpLines']:
-            for proj, arm in zip(projs, arms):
-                plt.plot([proj[0], arm[0]], [proj[1], arm[1]],
-                        color='black',
-                        linestyle='dashdot',
-                        linewidth=0.8)
-                plt.plot([-mean[0]*50,mean[0]*50],[-mean[1]*50,mean[1]*50], "--",
-                        linewidth=0.5,
-                        markersize=3,
-                        color='black')
-
-                # arm vector points
-        plt.plot([arm[0] for arm in sim.bandit.arm_vecs],
-                [arm[1] for arm in sim.bandit.arm_vecs], "o",
-                markersize=5,
-                markerfacecolor=cmap1(0.5),
-                markeredgecolor=cmap1(1.0),
-                label='Arm Vectors')
+            for proj, arm in zip(projs, self.arms):
+                ax.plot([proj[0], arm[0]], [proj[1], arm[1]],
+                    color='black',
+                    linestyle='dashdot',
+                    linewidth=0.8)
+            ax.plot([-mean[0]*50,mean[0]*50],[-mean[1]*50,mean[1]*50], "--",
+                linewidth=0.5,
+                markersize=3,
+                color='black')
+
+        # arm vector points
+        ax.plot(self.arms[:,0], self.arms[:,1], "o",
+            markersize=5,
+            markerfacecolor=cmap1(0.5),
+            markeredgecolor=cmap1(1.0),
+            label='Arm Vectors')
 
         # chosen arm; draws a red circle around it
-        plt.plot(chosen_arm[0],chosen_arm[1], "or",
-                markersize=10,
-                markerfacecolor='none',
-                markeredgecolor='red',
-                markeredgewidth=2,
-                label='Chosen Arm')
+        self.chosen, = ax.plot([], [], "or",
+            markersize=10,
+            markerfacecolor='none',
+            markeredgecolor='red',
+            markeredgewidth=2,
+            label='Chosen Arm')
 
         # legend and title
-        legend = plt.legend(loc='upper right')
-        plt.gca().add_artist(legend)
+        legend = ax.legend(loc='upper right')
         legend.get_frame().set_linewidth(1)
+        self.info = _info(ax)
+        ax.set_title("2D Confidence Ellipse Animation\n")
+
+        markers = [self.chosen] if self.approx is None else [self.approx, self.chosen]
+        self.artists = self.ellipses + markers + [legend, self.info]
+
+    def update(self, state):
+        rho = self.dim * np.log(state.timestep)
+        for radius, ellipse in zip(self.radii, self.ellipses):
+            width, height, angle = _ellipse(rho if radius is None else radius, state.G_inv)
+            ellipse.set_center((state.U[0], state.U[1]))
+            ellipse.set_width(width)
+            ellipse.set_height(height)
+            ellipse.set_angle(angle)
+        if self.approx is not None:
+            self.approx.set_data([state.U[0]], [state.U[1]])
+        chosen_arm = self.arms[np.argmax(state.U_conf)]
+        self.chosen.set_data([chosen_arm[0]], [chosen_arm[1]])
+        self.info.set_text(_info_text(state))
+        return self.artists
+
+
+class _DistView:
+    """
+    The artists of DistAnimation.
+
+    Each arm has a pdf line, its filled area and a line at its empirical mean, all updated in
+    place. The y limit only grows (by Y_GROWTH at a time), so the background, whose ticks depend on
+    it, is rarely redrawn; since the limit depends on every earlier frame, a render which starts at
+    a later frame sets it with set_ylim(ymax) first.
+
+    Positional Arguments:
+        * ax: the axes to draw on
+        * sim: the Simulation being animated
+        * core_dict: the core dictionary of the run
+    Attributes:
+        * artists: the artists which change between frames, in drawing order
+    Methods:
+        * update(state): sets the artists to a state (see _state) and returns them
+        * needed(state): the smallest y limit which fits every pdf of a state
+        * grown(ymax, needed): (staticmethod) the y limit after a frame which needs needed
+        * set_ylim(ymax): sets the y limit
+    """
+    # the number of points each pdf is evaluated at
+    samples = 500
+    # the milliseconds between two frames at 1 FPS
+    interval = 2000
+    # the y limit of the first frame
+    ymax = 3
+
+    def __init__(self, ax, sim, core_dict):
+        self.ax = ax
+        n_arms = sim.bandit.n_arms
+        self.gauss = sim.alg.var_dict['algtype'].__name__[-5:] == 'Gauss'
+        if self.gauss:
+            xlims = [np.amin(sim.bandit.mean_list) - 1.5,np.amax(sim.bandit.mean_list) + 1.5]
+        elif sim.alg.var_dict['algtype'].__name__[-4:] == 'Beta':
+            xlims = [0,1]
+        self.xdata = np.linspace(xlims[0], xlims[1], self.samples)
 
-        # additional information legend
-        blank_path_1 = mpatches.Patch(
-                label='Regret: {:04.2f}'.format(sim.bandit.giveRegret()))
-        blank_path_2 = mpatches.Patch(
-                label='Timestep: {:2d}'.format(sim.bandit.timestep[0]))
-        legend_2 = plt.legend(
-                handles=[blank_path_1, blank_path_2],
-                loc='upper left',
-                handlelength=0,
-                handletextpad=0)
-        legend_2.get_frame().set_linewidth(1)
+        self.curves, self.fills, self.means = [], [], []
+        for i in range(n_arms):
+            cmap = cmap_colors.sequential1[i % len(cmap_colors.sequential1)]
+            curve, = ax.plot([], [], "-", color=cmap(0.5))
+            fill = mpatches.Polygon(np.zeros((0, 2)),
+                closed=True,
+                color=cmap(0.5),
+                alpha=0.2,
+                linewidth=0.5,
+                label="Arm {}".format(i+1))
+            ax.add_patch(fill)
+            self.curves.append(curve)
+            self.fills.append(fill)
+            self.means.append(ax.axvline(0,
+                ls='dashed',
+                color=cmap(0.8)))
+            ax.axvline(sim.bandit.mean_list[i],
+                ymax=1,
+                ls='dashdot',
+                alpha=0.6,
+                color=cmap(0.8))
+
+        # general formatting
+        ax.grid(True)
+        ax.set_ylim([0, self.ymax])
+        ax.set_xlim(xlims)
 
-        plt.title(title)
+        self.legend = ax.legend(loc='upper right')
+        self.legend.get_frame().set_linewidth(1)
+        self.info = _info(ax)
+        ax.set_title("Distribution Animation\n")
+
+        self.artists = self.fills + self.curves + self.means + [self.legend, self.info]
+
+    def _pdfs(self, state):
+        x = self.xdata[None,:]
+        if self.gauss:
+            mu = state.U[:,None]
+            sigma = np.sqrt(1.0/np.asarray(state.T, dtype=float))[:,None]
+            return 0.39894228 / sigma * 0.60653066**(((x-mu)/(sigma))**2)
+        return beta.pdf(x,
+            (state.arm_reward + 1)[:,None],
+            (state.T - state.arm_reward + 1)[:,None])
+
+    def needed(self, state):
+        return np.amax(self._pdfs(state))*1.1
+
+    @staticmethod
+    def grown(ymax, needed):
+        return max(needed, ymax * Y_GROWTH) if needed > ymax else ymax
+
+    def set_ylim(self, ymax):
+        self.ymax = ymax
+        self.ax.set_ylim([0, ymax])
+        return None
+
+    def update(self, state):
+        ydata = self._pdfs(state)
+        ydata_max = np.amax(ydata, axis=1)
+
+        # a taller pdf grows the y limit, which changes the ticks, so the whole figure is redrawn
+        ymax = self.grown(self.ymax, np.amax(ydata_max)*1.1)
+        if ymax != self.ymax:
+            self.set_ylim(ymax)
+            self.ax.figure.canvas.draw()
+
+        v_line_max = np.minimum(ydata_max/self.ymax, 1)
+        edge = [[self.xdata[0], 0]]
+        for i, (curve, fill, line) in enumerate(zip(self.curves, self.fills, self.means)):
+            curve.set_data(self.xdata, ydata[i])
+            fill.set_xy(np.concatenate([edge, np.stack([self.xdata, ydata[i]], axis=1),
+                [[self.xdata[-1], 0]]]))
+            line.set_data([state.U[i]] * 2, [0, v_line_max[i]])
+        for text, pulls, i in zip(self.legend.get_texts(), state.T, range(len(state.T))):
+            text.set_text("Arm {}: Pulls: {:d}".format(i+1, int(pulls)))
+        self.info.set_text(_info_text(state))
+        return self.artists
+
+
+def _animate(fig, view, sim, horizon, interval, steps=1):
+    """
+    Runs a blitted animation of view, stepping sim by steps timesteps per frame; clicking the
+    figure or pressing space pauses and unpauses it.
+    """
+    pause = False
+    def _update(num):
+        if not pause:
+            sim.runStep(steps, horizon)
+        return view.update(_state(sim.bandit))
 
     def onClick(event):
         nonlocal pause
         pause ^= True
+    def onKey(event):
+        if event.key == ' ':
+            onClick(event)
     fig.canvas.mpl_connect('button_press_event', onClick)
-    # the animation declaration
+    fig.canvas.mpl_connect('key_press_event', onKey)
+    # the animation declaration; the first frame is drawn without stepping the bandit
     my_ani = animation.FuncAnimation(fig, _update,
-        fargs=(sim.bandit.U_conf, ),
-        interval=1000/core_dict['FPS'])  # fargs is used as the data required in update_hist
+        init_func=lambda: view.update(_state(sim.bandit)),
+        interval=interval,
+        blit=True,
+        cache_frame_data=False)
 
     plt.show()
 
 
-def DistAnimation(core_dict):
+def _replay(fig, view, sim, horizon, interval, steps=1):
     """
-    Creates an animation of the distributions used for beta and gaussian
-    random sampling and confidence algorithms.
+    Runs a blitted animation of view which plays a Timeline of sim, recorded every steps timesteps
+    by a background thread while it plays; it waits at the latest frame until the next one is
+    recorded. Since every frame is kept, the animation can be moved to any recorded frame:
+        * space or a click: pause and unpause
+        * right / left: one frame forward / back
+        * up / down: a tenth of the horizon forward / back
+        * home / end: the first / the latest frame
+        * 0 to 9: that many tenths of the horizon
     """
-    # defaults
-    fig, ax = mpl_defaults.ani()
+    timeline = Timeline.empty(sim.bandit, timeline_frames(sim.bandit.n_arms, horizon, steps))
+    timeline.fill(sim, horizon, steps, stop=1)
+    th.Thread(target=timeline.fill, args=(sim, horizon, steps), daemon=True).start()
+
+    position = 0
+    pause = False
+    def _update(num):
+        nonlocal position
+        if not pause:
+            position = min(position + 1, timeline.count - 1)
+        return view.update(timeline.state(position))
 
-    ReMapSim(core_dict['sim'][0])
+    def onClick(event):
+        nonlocal pause
+        pause ^= True
+    def onKey(event):
+        nonlocal position
+        if event.key == ' ':
+            onClick(event)
+        elif event.key in ('right', 'left'):
+            position += 1 if event.key == 'right' else -1
+        elif event.key in ('up', 'down'):
+            position += max(len(timeline) // 10, 1) * (1 if event.key == 'up' else -1)
+        elif event.key == 'home':
+            position = 0
+        elif event.key == 'end':
+            position = timeline.count - 1
+        elif event.key is not None and event.key.isdigit():
+            position = int(event.key) * len(timeline) // 10
+        position = max(0, min(position, timeline.count - 1))
+    fig.canvas.mpl_connect('button_press_event', onClick)
+    fig.canvas.mpl_connect('key_press_event', onKey)
+    my_ani = animation.FuncAnimation(fig, _update,
+        init_func=lambda: view.update(timeline.state(position)),
+        interval=interval,
+        blit=True,
+        cache_frame_data=False)
 
-    # simulation variables
+    plt.show()
+
+
+def _simulation(core_dict):
+    """
+    Maps the simulation of an animation to objects and pulls every arm once.
+    """
+    ReMapSim(core_dict['sim'][0], core_dict['Seed'])
     sim = core_dict['sim'][0]['Simulation']
-    sim_dict = core_dict['sim'][0]
-    horizon = core_dict['horizon']
-    n_arms = sim.bandit.n_arms
-    title = "Distribution Animation\n"
-    if sim.alg.var_dict['algtype'].__name__[-5:] == 'Gauss':
-        xlims = [np.amin(sim.bandit.mean_list) - 1.5,np.amax(sim.bandit.mean_list) + 1.5]
-    elif sim.alg.var_dict['algtype'].__name__[-4:] == 'Beta':
-        xlims = [0,1]
 
+    # initialize the bandit
     for i in range(sim.bandit.n_arms):
         sim.bandit.pullArm(i)
+    return sim
 
-    # distribution function
-    def npdf(x, mu, sigma):
-        return 0.39894228 / sigma * 0.60653066**(((x-mu)/(sigma))**2)
 
-    pause = False
-    # the animation update function
-    def _update(num, confidence):
-        nonlocal ax, xlims, pause
-        plt.cla()
+def _setup(core_dict, view_class):
+    """
+    Maps the simulation of an animation to objects, pulls every arm once and builds its view.
+    """
+    fig, ax = mpl_defaults.ani()
+    sim = _simulation(core_dict)
+    return fig, sim, view_class(ax, sim, core_dict)
 
-        # step the bandit
-        if not pause:
-            sim.runStep(1, horizon)
-        samples = 500
-        xdata = np.tile(np.linspace(xlims[0], xlims[1], samples), (n_arms,1))
-        if sim.alg.var_dict['algtype'].__name__[-5:] == 'Gauss':
-            mu = np.tile(
-                sim.bandit.U.reshape(n_arms,1),
-                (1,samples))
-            sigma = np.tile(
-                np.sqrt(1.0/sim.bandit.T).reshape(n_arms,1),
-                (1,samples))
-            ydata = npdf(xdata, mu, sigma)
 
-        elif sim.alg.var_dict['algtype'].__name__[-4:] == 'Beta':
-            beta_a = np.tile(
-                (sim.bandit.arm_reward+1).reshape(n_arms,1),
-                (1,samples))
-            beta_b = np.tile(
-                (sim.bandit.T - sim.bandit.arm_reward + 1).reshape(n_arms,1),
-                (1,samples))
-            ydata = beta.pdf(xdata, beta_a, beta_b)
+def _play(core_dict, view_class):
+    """
+    Shows the animation of a view, either stepping the simulation as it plays, or, with
+    Precompute, playing back a Timeline recorded in the background.
+    """
+    fig, sim, view = _setup(core_dict, view_class)
+    play = _replay if core_dict['Precompute'] else _animate
+    play(fig, view, sim, core_dict['horizon'], view_class.interval/core_dict['FPS'],
+        core_dict['StepsPerFrame'])
 
-        ydata_max = np.amax(ydata, axis=1)
-        ymax = np.maximum(3, np.amax(ydata_max)*1.1)
-        v_line_max = np.minimum(ydata_max/ymax, 1)
 
-        for i in range(n_arms):
-            cmap = cmap_colors.sequential1[i]
-            plt.plot(xdata[i], ydata[i], "-", color=cmap(0.5))
-            ax.fill_between(xdata[i], 0, ydata[i],
-                color=cmap(0.5),
-                alpha=0.2,
-                linewidth=0.5,
-                label="Arm {}: Pulls: {}".format(i+1, sim.bandit.T[i]))
-            plt.axvline(sim.bandit.U[i],
-                ymax=v_line_max[i],
-                ls='dashed',
-                color=cmap(0.8))
-            plt.axvline(sim.bandit.mean_list[i],
-                ymax=1,
-                ls='dashdot',
-                alpha=0.6,
-                color=cmap(0.8))
+def ConfAnimation(core_dict):
+    """
+    Animates the confidence intervals.
 
-        ylims = [0, ymax]
-        # general formatting
-        ax.grid(True)
-        ax.set_ylim(ylims)
-        ax.set_xlim(xlims)
+    Since only one cycle is run at a given time, the bandit algorithm is run at
+    the same time as the animation rather than using an external data source.
+    The artists are created once and blitted (see _ConfView).
+    """
+    _play(core_dict, _ConfView)
 
-        legend = plt.legend(loc='upper right')
-        plt.gca().add_artist(legend)
-        legend.get_frame().set_linewidth(1)
 
-        # additional information legend
-        blank_path_1 = mpatches.Patch(
-            label='Regret: {:04.2f}'.format(sim.bandit.giveRegret()))
-        blank_path_2 = mpatches.Patch(
-            label='Timestep: {:2d}'.format(sim.bandit.timestep[0]))
-        legend_2 = plt.legend(
-            handles=[blank_path_1, blank_path_2],
-            loc='upper left',
-            handlelength=0,
-            handletextpad=0)
-        legend_2.get_frame().set_linewidth(1)
+def EllipseAnimation(core_dict):
+    """
+    Animates the confidence ellipses of a 2D linear bandit.
 
-        plt.title(title)
+    Since only one cycle is run at a given time, the bandit algorithm is run at
+    the same time as the animation rather than using an external data source.
+    The artists are created once and blitted (see _EllipseView).
+    """
+    _play(core_dict, _EllipseView)
 
-    def onClick(event):
-        nonlocal pause
-        pause ^= True
-    fig.canvas.mpl_connect('button_press_event', onClick)
-    # the animation declaration
-    my_ani = animation.FuncAnimation(fig, _update,
-        fargs=(sim.bandit.U_conf, ),
-        interval=2000/(core_dict['FPS']))  # fargs is used as the data required in update_hist
 
-    plt.show()
+def DistAnimation(core_dict):
+    """
+    Creates an animation of the distributions used for beta and gaussian
+    random sampling and confidence algorithms.
+
+    The artists are created once and blitted (see _DistView).
+    """
+    _play(core_dict, _DistView)
+
+
+# the view of each visual
+VIEWS = {
+    'confidence': _ConfView,
+    'ellipse': _EllipseView,
+    'distribution': _DistView
+}
+# the number of frames each process renders at a time
+RENDER_CHUNK = 200
+# the file endings of the videos RenderAnimation can stitch; anything else is a folder of frames
+VIDEO_FORMATS = ('.mp4', '.gif')
+
+
+def frame_path(folder, k):
+    return "{}/frame{:06d}.png".format(folder, k)
+
+
+def _render_needed(job):
+    """
+    The y limit needed by each frame of a Timeline of a DistAnimation.
+    """
+    core_dict, view_class, timeline = job
+    plt.switch_backend('agg')
+    fig, ax = mpl_defaults.ani()
+    view = view_class(ax, _simulation(core_dict), core_dict)
+    plt.close(fig)
+    return np.array([view.needed(timeline.state(k)) for k in range(len(timeline))])
+
+
+def _render_frames(job):
+    """
+    Draws every frame of a Timeline on an Agg figure and writes them as PNG files, numbered from
+    first; with palette set, the frames are reduced to 256 colours, as a GIF needs. As in a
+    blitted animation, the background is only drawn again when the limits of the axes change.
+    """
+    core_dict, view_class, timeline, first, folder, ymax, palette = job
+    plt.switch_backend('agg')
+    fig, ax = mpl_defaults.ani()
+    view = view_class(ax, _simulation(core_dict), core_dict)
+    if ymax is not None:
+        view.set_ylim(ymax)
+    for artist in view.artists:
+        artist.set_animated(True)
+
+    limits = None
+    for k in range(len(timeline)):
+        artists = view.update(timeline.state(k))
+        if ax.viewLim.bounds != limits:
+            fig.canvas.draw()
+            background = fig.canvas.copy_from_bbox(fig.bbox)
+            limits = ax.viewLim.bounds
+        else:
+            fig.canvas.restore_region(background)
+        for artist in artists:
+            fig.draw_artist(artist)
+        image = Image.fromarray(np.asarray(fig.canvas.buffer_rgba())[:,:,:3])
+        if palette:
+            image = image.quantize(256, method=Image.Quantize.FASTOCTREE)
+        # a low compression level, since encoding the frames takes longer than drawing them
+        image.save(frame_path(folder, first + k), compress_level=1)
+    plt.close(fig)
+    return len(timeline)
+
+
+def _stitch(folder, frames, path, fps):
+    """
+    Stitches the PNG frames of a folder into a video: with ffmpeg for '.mp4', with Pillow for
+    '.gif'.
+    """
+    if path.endswith('.mp4'):
+        subprocess.run([mpl.rcParams['animation.ffmpeg_path'], '-y', '-loglevel', 'error',
+            '-framerate', str(fps),
+            '-i', "{}/frame%06d.png".format(folder),
+            '-vf', 'pad=ceil(iw/2)*2:ceil(ih/2)*2',  # yuv420p needs an even width and height
+            '-pix_fmt', 'yuv420p',
+            path], check=True)
+    else:
+        first = Image.open(frame_path(folder, 0))
+        first.save(path,
+            save_all=True,
+            append_images=(Image.open(frame_path(folder, k)) for k in range(1, frames)),
+            duration=1000/fps,
+            loop=0)
+    return None
+
+
+def RenderAnimation(pool, core_dict):
+    """
+    Renders a Visualize animation to PlotSave without showing it: a '.mp4' or '.gif' video, or a
+    folder of numbered PNG frames (frame{k}.png) for any other name.
+
+    The cycle is run first, recording a Timeline with one snapshot every StepsPerFrame timesteps
+    up to the horizon.
+    The frames are then drawn in ranges of RENDER_CHUNK by the processes of pool, each on its own
+    Agg figure, and the PNG files they write are stitched into the video. Since the y limit of a
+    distribution animation depends on every earlier frame, the limit each range starts at is worked
+    out from the timeline before any frame is drawn.
+    """
+    view_class = VIEWS[core_dict['visual']]
+    job_dict = copy.deepcopy(core_dict)  # every process maps its own copy of the simulation
+    sim = _simulation(core_dict)
+    frames = timeline_frames(sim.bandit.n_arms, core_dict['horizon'], core_dict['StepsPerFrame'])
+    timeline = Timeline.record(sim, frames, core_dict['horizon'], core_dict['StepsPerFrame'])
+    ranges = [(start, min(start + RENDER_CHUNK, frames)) for start in range(0, frames, RENDER_CHUNK)]
+
+    ylims = [None] * len(ranges)
+    if view_class is _DistView:
+        needed = np.concatenate(pool.map(_render_needed,
+            [(job_dict, view_class, timeline.part(start, stop)) for start, stop in ranges]))
+        ymax = _DistView.ymax
+        for i, (start, stop) in enumerate(ranges):
+            ylims[i] = ymax
+            for value in needed[start:stop]:
+                ymax = _DistView.grown(ymax, value)
+
+    path = core_dict['PlotSave']
+    video = path.endswith(VIDEO_FORMATS)
+    if video:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        path = safe_save(path)
+        folder = tempfile.mkdtemp(dir=os.path.dirname(path) or ".")
+    else:
+        folder = path.rstrip("/")
+        os.makedirs(folder, exist_ok=True)
+    try:
+        jobs = [(job_dict, view_class, timeline.part(start, stop), start, folder, ylim,
+            path.endswith('.gif')) for (start, stop), ylim in zip(ranges, ylims)]
+        done = 0
+        for count in pool.imap_unordered(_render_frames, jobs):
+            done += count
+            sys.stdout.write("\r" + " {:2.0f} % of {} frames rendered ".format(
+                done * 100 / frames, frames).center(100, "-"))
+            sys.stdout.flush()
+        if video:
+            _stitch(folder, frames, path, core_dict['FPS'] * 1000 / view_class.interval)
+    finally:
+        if video:
+            shutil.rmtree(folder)
+    core_dict['PlotSave'] = path
+    return None
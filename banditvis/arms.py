@@ -4,20 +4,65 @@ Contains all the arm classes.
 Methods:
     * pull(): returns info about the arm
     * info(): pulls the arm
+
+Random arms draw from their rng attribute, a numpy Generator. A bandit replaces the rng of each of
+its arms with its own, so that a whole simulation draws from a single stream.
+
+Stochastic bandits keep their Bernoulli and Normal arms in an ArmSet, which stores the parameters
+of every arm in arrays rather than one object per arm, so that bandits with millions of arms fit in
+memory. An ArmSet is built from arm objects, from the ArmList of a Bandit sub-dictionary, or from
+a .npy file (see arm_family).
 """
 
 import numpy as np
 
-__all__ = ['BernoulliArm', 'NormalArm', 'LinearArm', 'GeneralArm']
+__all__ = ['BernoulliArm', 'NormalArm', 'LinearArm', 'GeneralArm', 'ArmSet', 'arm_family']
+
+# the largest number of rewards that an arm draws ahead of time
+BLOCK_SIZE = 4096
+
 
-class BernoulliArm:
+class _BlockArm:
+    """
+    Base class for arms which draw their rewards in blocks.
+
+    Rather than calling the rng once per pull, rewards are drawn ahead of
+    time and popped off a buffer which is refilled once it runs out. The block
+    size starts small and doubles with every refill up to BLOCK_SIZE, so arms
+    which are rarely pulled never hold a large buffer.
+
+    Subclasses implement _draw(size), which returns an array of size rewards.
+    """
+    _buffer = ()
+    _block = 8
+
+    def pull(self):
+        if not self._buffer:
+            self._block = min(2 * self._block, BLOCK_SIZE)
+            self._buffer = self._draw(self._block).tolist()
+        return self._buffer.pop()
+
+    def discard(self):
+        """
+        Drops the rewards drawn ahead of time, eg. after the parameters or the
+        rng of the arm change. The next pull starts again from a small block.
+        """
+        self.__dict__.pop('_buffer', None)
+        self.__dict__.pop('_block', None)
+        return None
+
+
+class BernoulliArm(_BlockArm):
     """
     Arm with reward probabilty from a Bernoulli distribution.
 
     Positional Arguments:
         * attribute list [mean]
+    Keyword Arguments:
+        * rng: a numpy Generator, or a seed to build one from
     Attributes:
         * mean: the mean of the random distribution
+        * rng: the numpy Generator used to draw rewards
     Methods:
         * info(): returns info about the arm
         * pull(): pulls the arm
@@ -30,27 +75,29 @@ class BernoulliArm:
     >>> arm.mean
     0.7
     """
-    def __init__(self, attr_list):
+    def __init__(self, attr_list, rng=None):
         self.mean = attr_list[0]
+        self.rng = np.random.default_rng(rng)
 
     def info(self):
         return ["Bernoulli", self.mean]
 
-    def pull(self):
-        if np.random.random() > self.mean:
-            return 0
-        return 1
+    def _draw(self, size):
+        return (self.rng.random(size) <= self.mean).astype(int)
 
 
-class NormalArm:
+class NormalArm(_BlockArm):
     """
     A NormalArm selects rewards from a normal distribution.
 
     Positional Arguments:
         * attribute list [mean, variance]
+    Keyword Arguments:
+        * rng: a numpy Generator, or a seed to build one from
     Attributes:
         * mean: the mean of the random distribution
         * variance: the variance of the random distribution
+        * rng: the numpy Generator used to draw rewards
     Methods:
         * info(): returns info about the arm
         * pull(): pulls the arm
@@ -65,15 +112,16 @@ class NormalArm:
     >>> arm.variance
     1
     """
-    def __init__(self, attr_list):
+    def __init__(self, attr_list, rng=None):
         self.mean = attr_list[0]
         self.variance = attr_list[1]
+        self.rng = np.random.default_rng(rng)
 
     def info(self):
         return ["Normal", self.mean, self.variance]
 
-    def pull(self):
-        return np.random.normal(self.mean, np.sqrt(self.variance))
+    def _draw(self, size):
+        return self.rng.normal(self.mean, np.sqrt(self.variance), size)
 
 
 class LinearArm:
@@ -82,9 +130,12 @@ class LinearArm:
 
     Positional Arguments:
         * arm_vector
+    Keyword Arguments:
+        * rng: a numpy Generator, or a seed to build one from
     Attributes:
         * arm_vec: the arm vector
         * dim: dimension
+        * rng: the numpy Generator used to draw the noise
     Methods:
         * info(): returns info about the arm
         * pull(): pulls the arm
@@ -109,15 +160,16 @@ class LinearArm:
     >>> arm.dim
     3
     """
-    def __init__(self, arm_vector):
+    def __init__(self, arm_vector, rng=None):
         self.arm_vec = arm_vector
         self.dim = len(arm_vector)
+        self.rng = np.random.default_rng(rng)
 
     def info(self):
         return ["Linear", self.arm_vec, self.mean_vec]
 
     def pull(self):
-        return np.inner(self.arm_vec, self.mean_vec) + np.random.normal(0,1)
+        return np.inner(self.arm_vec, self.mean_vec) + self.rng.normal(0,1)
 
 class GeneralArm:
     def __init__(self, reward_vec):
@@ -130,3 +182,153 @@ class GeneralArm:
     def pull(self, timestep):
         # fixes indexing
         return self.reward_vec[timestep-1]
+
+
+def arm_family(bandit_dict):
+    """
+    The type of the arms of a Bandit sub-dictionary: that of its first arm, or the family of its
+    ArmFile, which is declared as [family, path] where family is Bernoulli or Normal.
+    """
+    if 'ArmFile' in bandit_dict:
+        return bandit_dict['ArmFile'][0]
+    return bandit_dict['ArmList'][0][0]
+
+
+class _Draws(_BlockArm):
+    """
+    Standard uniform (or normal) draws taken in blocks from the rng of an ArmSet, which turns them
+    into the rewards of its Bernoulli (or Normal) arms.
+    """
+    def __init__(self, arm_set, normal):
+        self.arm_set = arm_set
+        self.normal = normal
+
+    def _draw(self, size):
+        if self.normal:
+            return self.arm_set.rng.standard_normal(size)
+        return self.arm_set.rng.random(size)
+
+
+class _ArmView:
+    """
+    One arm of an ArmSet. Its mean and variance are read from and written to the arrays of the
+    set, so code written for arm objects (eg. rebinding a sweep point) works on an ArmSet.
+    """
+    __slots__ = ('arm_set', 'index')
+
+    def __init__(self, arm_set, index):
+        self.arm_set = arm_set
+        self.index = index
+
+    @property
+    def mean(self):
+        return self.arm_set.mean[self.index].item()
+
+    @mean.setter
+    def mean(self, value):
+        self.arm_set.mean[self.index] = value
+
+    @property
+    def variance(self):
+        return self.arm_set.variance[self.index].item()
+
+    @variance.setter
+    def variance(self, value):
+        self.arm_set.variance[self.index] = value
+        self.arm_set.sd[self.index] = np.sqrt(value)
+
+    def info(self):
+        if self.arm_set.bernoulli[self.index]:
+            return ["Bernoulli", self.mean]
+        return ["Normal", self.mean, self.variance]
+
+    def pull(self):
+        return self.arm_set.pull(self.index)
+
+
+class ArmSet:
+    """
+    A population of Bernoulli and Normal arms, stored as arrays.
+
+    Rewards are drawn by arm index from blocks of standard uniform and normal draws shared by every
+    arm, so a pull costs the same however many arms there are, and no arm holds a buffer of its
+    own. Indexing or iterating an ArmSet gives views of single arms, with the mean, variance,
+    info() and pull() of an arm object.
+
+    Positional Arguments:
+        * mean: the mean of every arm
+    Keyword Arguments:
+        * variance: the variance of every arm (ignored for Bernoulli arms), defaults to 0
+        * bernoulli: whether each arm is a Bernoulli arm rather than a Normal arm, defaults to True
+            for every arm
+        * rng: a numpy Generator, or a seed to build one from
+    Attributes:
+        * mean, variance, sd: float arrays of the mean, variance and standard deviation of each arm
+        * bernoulli: a bool array of which arms are Bernoulli arms
+        * n_arms: the number of arms
+        * rng: the numpy Generator used to draw rewards
+    Methods:
+        * from_arms(arm_object_list): (classmethod) the ArmSet of BernoulliArm and NormalArm objects
+        * from_list(arm_list): (classmethod) the ArmSet of an ArmList, eg. [['Bernoulli', [0.3]]]
+        * load(family, path): (classmethod) the ArmSet of a .npy file, which holds the mean of
+            every arm for Bernoulli arms, and a row of [mean, variance] per arm for Normal arms
+        * pull(arm): draws a reward from the arm^th arm
+        * discard(): drops the draws taken ahead of time
+
+    Examples:
+
+    >>> arms = banditvis.ArmSet.from_list([['Bernoulli', [0.7]], ['Normal', [0.2, 1]]])
+    >>> arms.n_arms
+    2
+    >>> arms[1].info()
+    ['Normal', 0.2, 1.0]
+    """
+    def __init__(self, mean, variance=0, bernoulli=True, rng=None):
+        self.mean = np.array(mean, dtype=float)
+        self.n_arms = len(self.mean)
+        self.variance = np.array(np.broadcast_to(variance, self.n_arms), dtype=float)
+        self.sd = np.sqrt(self.variance)
+        self.bernoulli = np.array(np.broadcast_to(bernoulli, self.n_arms), dtype=bool)
+        self.rng = np.random.default_rng(rng)
+        self.discard()
+
+    @classmethod
+    def from_arms(cls, arm_object_list, rng=None):
+        return cls([arm.mean for arm in arm_object_list],
+            [getattr(arm, 'variance', 0) for arm in arm_object_list],
+            [arm.info()[0] == 'Bernoulli' for arm in arm_object_list], rng)
+
+    @classmethod
+    def from_list(cls, arm_list, rng=None):
+        return cls([arm[1][0] for arm in arm_list],
+            [arm[1][1] if arm[0] == 'Normal' else 0 for arm in arm_list],
+            [arm[0] == 'Bernoulli' for arm in arm_list], rng)
+
+    @classmethod
+    def load(cls, family, path, rng=None):
+        values = np.load(path)
+        if family == 'Bernoulli' and values.ndim == 1:
+            return cls(values, rng=rng)
+        if family == 'Normal' and values.ndim == 2 and values.shape[1] == 2:
+            return cls(values[:, 0], values[:, 1], False, rng)
+        raise ValueError("'{}' must hold {}, not an array of shape {}.".format(path,
+            "one mean per arm" if family == 'Bernoulli' else "one [mean, variance] row per arm",
+            values.shape))
+
+    def __len__(self):
+        return self.n_arms
+
+    def __getitem__(self, index):
+        if not -self.n_arms <= index < self.n_arms:
+            raise IndexError("arm index out of range")
+        return _ArmView(self, index % self.n_arms)
+
+    def pull(self, arm):
+        if self.bernoulli[arm]:
+            return int(self._uniform.pull() <= self.mean[arm])
+        return float(self.mean[arm] + self.sd[arm] * self._normal.pull())
+
+    def discard(self):
+        self._uniform = _Draws(self, False)
+        self._normal = _Draws(self, True)
+        return None
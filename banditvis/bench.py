@@ -0,0 +1,290 @@
+"""
+Microbenchmarks of the algorithms, arms and bandits, run with `banditvis bench`.
+
+Every case builds one Simulation (an algorithm, an arm family, a number of arms, a dimension for
+linear arms and a horizon) and times its decision loop, the pullArm(giveArm()) steps that follow
+the initial pull of every arm:
+    * single: one cycle, as run by animations and unbatched simulations
+    * batch: BENCH_CYCLES replicates advanced together, as runBatch does, for the simulations
+        which can be batched
+Each path runs until the horizon or until it has used its time budget, whichever comes first, and
+reports its steps per second (replicate steps for the batch path). The peak memory allocated while
+building the simulation and running a few steps is measured separately with tracemalloc, since
+tracing slows every allocation down.
+
+The results are written as JSON. Given the results of an earlier run, every case is compared with
+it, so that a change to a code path shows up as the ratio of its speed before and after.
+
+Methods:
+    * bench_cases(arms, dims, horizons): every case of a benchmark grid
+    * run_case(case, budget): the results of a single case
+    * compare(results, previous): the lines of a comparison between two result files
+    * main(argv): the `banditvis bench` command
+"""
+
+import argparse
+import json
+import platform
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+
+from . import __version__
+from .core import BatchStoBandit, BatchAdvBandit, AdvBandit
+from .helper import safe_save
+from .simulation import ReMapSim
+
+# every benchmarked algorithm, with its extra arguments and the arm families it is run on
+BENCH_ALGORITHMS = [
+    ('random', {}, ('Bernoulli', 'Normal')),
+    ('greedy', {}, ('Bernoulli', 'Normal')),
+    ('greedy_ep', {'epsilon': 0.1}, ('Bernoulli', 'Normal')),
+    ('UCB', {'incr': 'B1', 'alpha': 2}, ('Bernoulli', 'Normal')),
+    ('UCB', {'incr': 'B6', 'alpha': 2}, ('Bernoulli',)),
+    ('UCB_KL', {'incr': 'B7'}, ('Bernoulli',)),
+    ('Bayes_Gauss', {'incr': 'B1'}, ('Normal',)),
+    ('TS_Beta', {}, ('Bernoulli',)),
+    ('TS_Gauss', {}, ('Normal',)),
+    ('UCB_Lin', {}, ('Linear',)),
+    ('TS_Lin', {}, ('Linear',)),
+    ('exp', {}, ('General',)),
+]
+# the numbers of arms, dimensions of linear arms and horizons of the full grid, and of --quick
+BENCH_ARMS = (2, 10, 100, 1000, 10000)
+BENCH_DIMS = (2, 10)
+BENCH_HORIZONS = (1000, 100000)
+QUICK_ARMS = (2, 100)
+QUICK_HORIZONS = (1000,)
+# the seconds each path of a case may run for
+BENCH_BUDGET = 1.0
+# the number of replicates of the batch path
+BENCH_CYCLES = 100
+# the number of decision steps traced to measure peak memory
+MEMORY_STEPS = 10
+# the largest memory (in bytes) a case may be expected to need; larger cases are skipped
+MEMORY_LIMIT = 2**30
+
+
+def bench_cases(arms=BENCH_ARMS, dims=BENCH_DIMS, horizons=BENCH_HORIZONS):
+    """
+    Every case of the grid: each algorithm of BENCH_ALGORITHMS on each of its arm families, with
+    each number of arms, dimension (linear arms only) and horizon.
+    """
+    cases = []
+    for algtype, extra, families in BENCH_ALGORITHMS:
+        for family in families:
+            for n_arms in arms:
+                for dim in (dims if family == 'Linear' else [None]):
+                    for horizon in horizons:
+                        cases.append({'algtype': algtype, 'extra': extra, 'family': family,
+                            'n_arms': n_arms, 'dim': dim, 'horizon': horizon})
+    return cases
+
+
+def case_name(case):
+    """
+    A readable, unique name of a case, which identifies it in result files.
+    """
+    parts = [case['algtype'] + "".join("[{}]".format(extra) for extra in
+        sorted(str(value) for key, value in case['extra'].items() if key == 'incr')),
+        case['family'], "K={}".format(case['n_arms'])]
+    if case['dim'] is not None:
+        parts.append("d={}".format(case['dim']))
+    parts.append("T={}".format(case['horizon']))
+    return "/".join(parts)
+
+
+def _arm_list(case, rng):
+    n_arms = case['n_arms']
+    if case['family'] == 'Bernoulli':
+        return [['Bernoulli', [mean]] for mean in rng.uniform(0.1, 0.9, n_arms)]
+    elif case['family'] == 'Normal':
+        return [['Normal', [mean, 1.0]] for mean in rng.uniform(0.1, 0.9, n_arms)]
+    elif case['family'] == 'Linear':
+        vectors = rng.normal(size=(n_arms, case['dim']))
+        return [['Linear', list(vector / np.linalg.norm(vector))] for vector in vectors]
+    return [['General', list(losses)] for losses in rng.random((n_arms, case['horizon']))]
+
+
+def _simulation(case, seed=0):
+    rng = np.random.default_rng(seed)
+    sim_dict = {
+        'Algorithm': {'algtype': case['algtype'], **case['extra']},
+        'Bandit': {'ArmList': _arm_list(case, rng)},
+        'Normalized': False}
+    if case['family'] == 'Linear':
+        sim_dict['Bandit']['MeanVector'] = list(rng.normal(size=case['dim']))
+    ReMapSim(sim_dict, seed)
+    return sim_dict['Simulation']
+
+
+def _batch(sim, cycles):
+    """
+    Points the algorithm of sim at a batched copy of its bandit, as runBatch does, or returns None
+    if sim cannot be batched.
+    """
+    if not sim._batchable():
+        return None
+    batch_class = BatchAdvBandit if isinstance(sim.bandit, AdvBandit) else BatchStoBandit
+    batch = batch_class(sim.bandit.arms, cycles, sim.bandit.rng)
+    sim.alg.bandit = batch
+    return batch
+
+
+def _run(sim, bandit, horizon, budget, steps=None):
+    """
+    Pulls every arm of bandit once, then runs decision steps until the horizon, until steps steps
+    or until budget seconds are used. Returns the number of decision steps and the seconds they
+    took.
+    """
+    bandit.horizon = np.full(sim.bandit.n_arms, horizon, dtype=int)
+    for arm in range(sim.bandit.n_arms):
+        bandit.pullArm(arm)
+    total = horizon - sim.bandit.n_arms if steps is None else steps
+    done, block = 0, 1
+    start = time.perf_counter()
+    while done < total and time.perf_counter() - start < budget:
+        # blocks double in size, so that reading the clock costs nothing next to the steps
+        for _ in range(min(block, total - done)):
+            bandit.pullArm(sim.alg.giveArm())
+        done += min(block, total - done)
+        block *= 2
+    return done, time.perf_counter() - start
+
+
+def _peak_memory(case, horizon, cycles=None):
+    """
+    The peak memory (in bytes) allocated while building the simulation of a case and running
+    MEMORY_STEPS of its decision steps, on a single cycle or on cycles replicates.
+    """
+    tracemalloc.start()
+    try:
+        sim = _simulation(case)
+        bandit = sim.bandit if cycles is None else _batch(sim, cycles)
+        _run(sim, bandit, horizon, np.inf, min(MEMORY_STEPS, horizon - sim.bandit.n_arms))
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def run_case(case, budget=BENCH_BUDGET):
+    """
+    Runs a case, and returns a dict of its results: for each path, its number of steps, the
+    seconds they took, the steps per second and the peak memory; or the reason it was skipped.
+    """
+    result = {'algorithm': case['algtype'], 'extra': case['extra'], 'family': case['family'],
+        'n_arms': case['n_arms'], 'dim': case['dim'], 'horizon': case['horizon']}
+    if case['horizon'] <= case['n_arms']:
+        result['skipped'] = "the horizon is not longer than the initial pull of every arm"
+        return result
+    if case['family'] == 'General' and case['n_arms'] * case['horizon'] * 8 > MEMORY_LIMIT:
+        result['skipped'] = "the loss sequences of the arms would not fit in MEMORY_LIMIT"
+        return result
+
+    memory = _peak_memory(case, case['horizon'])
+    sim = _simulation(case)
+    steps, seconds = _run(sim, sim.bandit, case['horizon'], budget)
+    result['single'] = {'steps': steps, 'seconds': seconds, 'steps_per_second': steps / seconds,
+        'peak_memory': memory}
+
+    sim = _simulation(case)
+    if not sim._batchable():
+        return result
+    if memory * BENCH_CYCLES > MEMORY_LIMIT:
+        result['batch'] = {'skipped': "{} replicates would not fit in MEMORY_LIMIT".format(
+            BENCH_CYCLES)}
+        return result
+    memory = _peak_memory(case, case['horizon'], BENCH_CYCLES)
+    steps, seconds = _run(sim, _batch(sim, BENCH_CYCLES), case['horizon'], budget)
+    result['batch'] = {'steps': steps * BENCH_CYCLES, 'seconds': seconds,
+        'steps_per_second': steps * BENCH_CYCLES / seconds, 'peak_memory': memory}
+    return result
+
+
+def _format(result, path):
+    if 'skipped' in result:
+        return "skipped: " + result['skipped']
+    if path not in result:
+        return ""
+    if 'skipped' in result[path]:
+        return "{} skipped: {}".format(path, result[path]['skipped'])
+    return "{} {:10.4g} steps/s {:9.1f} MiB".format(path, result[path]['steps_per_second'],
+        result[path]['peak_memory'] / 2**20)
+
+
+def compare(results, previous):
+    """
+    The lines of a comparison of the results of two runs, case by case: the ratio of the steps
+    per second of each path (above 1 is faster now) and of its peak memory. Cases which only one
+    of the runs has are left out.
+    """
+    lines = ["{:<44} {:>6} {:>14} {:>14}".format("case", "path", "speed ratio", "memory ratio")]
+    for name, result in results['results'].items():
+        before = previous['results'].get(name)
+        if before is None:
+            continue
+        for path in ('single', 'batch'):
+            now, then = result.get(path, {}), before.get(path, {})
+            if 'steps_per_second' not in now or 'steps_per_second' not in then:
+                continue
+            lines.append("{:<44} {:>6} {:>14.3g} {:>14.3g}".format(name, path,
+                now['steps_per_second'] / then['steps_per_second'],
+                now['peak_memory'] / max(then['peak_memory'], 1)))
+    return lines
+
+
+def main(argv=None):
+    """
+    The `banditvis bench` command.
+    """
+    parser = argparse.ArgumentParser(prog='banditvis bench',
+        description="Benchmark the algorithms, arms and bandits of banditvis.")
+    parser.add_argument("--out", default="bench.json",
+        help="The path of the JSON result file, defaults to bench.json.")
+    parser.add_argument("--compare",
+        help="The JSON result file of an earlier run to compare with.")
+    parser.add_argument("--only",
+        help="Only run the cases whose name contains this text, eg. 'UCB[B6]' or 'K=1000/'.")
+    parser.add_argument("--budget", type=float, default=BENCH_BUDGET,
+        help="The seconds each path of a case may run for, defaults to {}.".format(BENCH_BUDGET))
+    parser.add_argument("--quick", action='store_true',
+        help="Only run {} arms and a horizon of {}.".format(
+            " and ".join(map(str, QUICK_ARMS)), " and ".join(map(str, QUICK_HORIZONS))))
+    args = parser.parse_args(argv)
+
+    if args.quick:
+        cases = bench_cases(QUICK_ARMS, BENCH_DIMS, QUICK_HORIZONS)
+    else:
+        cases = bench_cases()
+    if args.only:
+        cases = [case for case in cases if args.only in case_name(case)]
+
+    results = {
+        'version': __version__,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'date': datetime.now().isoformat(timespec='seconds'),
+        'budget': args.budget,
+        'results': {}}
+    for case in cases:
+        name = case_name(case)
+        result = run_case(case, args.budget)
+        results['results'][name] = result
+        print("{:<44} {}".format(name, "  ".join(filter(None,
+            [_format(result, 'single'), _format(result, 'batch')]))))
+
+    out = safe_save(args.out)
+    with open(out, 'w') as file:
+        json.dump(results, file, indent=1)
+    print("\nResults written to {}".format(out))
+
+    if args.compare:
+        with open(args.compare) as file:
+            previous = json.load(file)
+        print("\nCompared with {} (version {}, {}):\n".format(
+            args.compare, previous['version'], previous['date']))
+        print("\n".join(compare(results, previous)))
+    return 0
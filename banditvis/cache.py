@@ -0,0 +1,137 @@
+"""
+A content-addressed on-disk cache of simulation results.
+
+Every result is stored under a key which is the SHA-256 hash of a canonical description of the work
+that produced it: the simulation dictionary (without its label, which only affects the plot), the
+seed, the way the cycles were split into chunks, the package version and CACHE_FORMAT. Editing one
+Simulation block of a file only changes the keys of that simulation, so every other simulation is
+read back from the cache instead of being recomputed.
+
+Entries are result files (see banditvis.store), and the cache is bounded in size: once it grows
+past its limit, the least recently used entries are evicted.
+
+Methods:
+    * cache_key(**parts): the key of a piece of work
+    * default_folder(): the default cache folder
+"""
+
+import hashlib
+import json
+import os
+
+import numpy as np
+
+from . import __version__
+from .store import append_results, load_results
+
+# the default size limit of a ResultCache, in megabytes
+CACHE_SIZE = 1024
+# the format of cached results, bumped whenever the same work gives different results (eg. when
+# the random streams of the arms or the packing of a TrajectoryStats change), so that stale
+# entries are never read back
+CACHE_FORMAT = 2
+
+
+def default_folder():
+    """
+    $BANDITVIS_CACHE if set, and banditvis inside the user cache folder otherwise.
+    """
+    if os.environ.get('BANDITVIS_CACHE'):
+        return os.environ['BANDITVIS_CACHE']
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "banditvis")
+
+
+def _canonical(obj):
+    if isinstance(obj, dict):
+        return {str(key): _canonical(val) for key, val in obj.items() if key != 'label'}
+    elif isinstance(obj, (list, tuple)):
+        return [_canonical(val) for val in obj]
+    elif isinstance(obj, np.random.SeedSequence):
+        return {'entropy': obj.entropy, 'spawn_key': list(obj.spawn_key)}
+    elif isinstance(obj, np.ndarray):
+        return _canonical(obj.tolist())
+    elif isinstance(obj, np.generic):
+        return obj.item()
+    return obj
+
+
+def cache_key(**parts):
+    """
+    The key of a piece of work described by parts, eg. the simulation dictionary, the seed and the
+    chunk sizes. Labels are ignored, and dicts are hashed independently of their key order.
+
+    Examples:
+
+    >>> cache_key(sim={'horizon': 10, 'label': 'a'}) == cache_key(sim={'horizon': 10})
+    True
+    >>> cache_key(sim={'horizon': 10}) == cache_key(sim={'horizon': 11})
+    False
+
+    """
+    text = json.dumps(_canonical({'version': __version__, 'format': CACHE_FORMAT, **parts}),
+        sort_keys=True, default=repr)
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+class ResultCache:
+    """
+    A size-bounded folder of cached results.
+
+    Keyword Arguments:
+        * folder: the folder holding the entries, created if necessary (default_folder() if None)
+        * max_size: the size limit in megabytes
+    Attributes:
+        * folder: the cache folder
+        * max_size: the size limit in bytes
+        * hits, misses: the number of gets which found / did not find their key
+    Methods:
+        * get(key): the cached array of key, or None
+        * put(key, values): stores an array under key, then evicts entries if over the limit
+        * evict(): removes the least recently used entries until the cache fits its limit
+    """
+    def __init__(self, folder=None, max_size=CACHE_SIZE):
+        self.folder = default_folder() if folder is None else folder
+        self.max_size = max_size * 2**20
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(self.folder, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.folder, key + ".bin")
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            values = np.array(load_results(path))
+            os.utime(path)  # marks the entry as recently used
+        except (FileNotFoundError, ValueError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return values
+
+    def put(self, key, values):
+        # written to a temporary file first, so that readers never see a partial entry
+        temp = self._path(key) + ".{}.tmp".format(os.getpid())
+        append_results(temp, values)
+        os.replace(temp, self._path(key))
+        self.evict()
+        return None
+
+    def evict(self):
+        entries = []
+        for name in os.listdir(self.folder):
+            if name.endswith(".bin"):
+                stat = os.stat(os.path.join(self.folder, name))
+                entries.append((stat.st_mtime, stat.st_size, name))
+        total = sum(size for mtime, size, name in entries)
+        for mtime, size, name in sorted(entries):
+            if total <= self.max_size:
+                break
+            try:
+                os.remove(os.path.join(self.folder, name))
+            except FileNotFoundError:
+                pass
+            total -= size
+        return None
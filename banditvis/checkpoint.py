@@ -0,0 +1,88 @@
+"""
+Checkpoints of Histogram and Variable runs, so that an interrupted run can be resumed.
+
+The data folder of a run holds a copy of its input file and a manifest. The manifest is a JSON
+lines file: its first line describes the run (its init, seed and command line arguments), and
+every following line records a finished unit of work:
+    * Histogram: the chunk of cycles [i, c], with the number of results in data{i}.bin once its
+        regret was written
+    * Variable: the sweep point [i, j], with its total regret and number of cycles
+Records are appended and synced to disk as soon as their work is finished, so a run that is
+interrupted or killed only loses the work in progress, and resuming it reruns only the work that
+has no record.
+
+Methods:
+    * manifest_path(folder): the path of the manifest of a data folder
+    * input_path(folder): the path of the copy of the input file in a data folder
+"""
+
+import json
+import os
+import threading as th
+
+
+def manifest_path(folder):
+    return "{}/manifest.jsonl".format(folder)
+
+
+def input_path(folder):
+    return "{}/input.txt".format(folder)
+
+
+class Manifest:
+    """
+    The manifest of a data folder.
+
+    Positional Arguments:
+        * folder: the data folder; the manifest already in it, if any, is read
+    Attributes:
+        * path: the path of the manifest
+        * header: the description of the run, or None if the manifest is new
+        * records: a dict of {key: dict of fields} of the finished work
+    Methods:
+        * start(**header): writes the header of a new manifest
+        * record(*key, **fields): records the work identified by key as finished
+        * done(*key): the fields recorded for key, or None if its work is not finished
+    """
+    def __init__(self, folder):
+        self.path = manifest_path(folder)
+        self.header = None
+        self.records = {}
+        self.lock = th.Lock()
+        if os.path.isfile(self.path):
+            self._read()
+
+    def _read(self):
+        with open(self.path, 'rb') as file:
+            text = file.read()
+        # a run killed while appending may leave a partial last line, which is dropped
+        end = text.rfind(b'\n') + 1
+        if end < len(text):
+            os.truncate(self.path, end)
+        lines = text[:end].decode().splitlines()
+        if lines:
+            self.header = json.loads(lines[0])
+        for line in lines[1:]:
+            fields = json.loads(line)
+            self.records[tuple(fields.pop('key'))] = fields
+        return None
+
+    def _append(self, obj):
+        with self.lock, open(self.path, 'a') as file:
+            file.write(json.dumps(obj) + "\n")
+            file.flush()
+            os.fsync(file.fileno())
+        return None
+
+    def start(self, **header):
+        self.header = header
+        self._append(header)
+        return None
+
+    def record(self, *key, **fields):
+        self.records[key] = fields
+        self._append({'key': list(key), **fields})
+        return None
+
+    def done(self, *key):
+        return self.records.get(key)
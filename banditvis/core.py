@@ -1,13 +1,14 @@
 """
-This module contains the various Bandit classes {StoBandit, LinBandit, AdvBandit} and the Algorithm
-class.
+This module contains the various Bandit classes {StoBandit, BatchStoBandit, LinBandit, AdvBandit,
+BatchAdvBandit} and the Algorithm class.
 """
 
 import numpy as np
-from numpy.linalg import inv
 from pprint import pprint
 
-__all__ = ['StoBandit', 'LinBandit', 'AdvBandit', 'Algorithm']
+from .arms import ArmSet
+
+__all__ = ['StoBandit', 'BatchStoBandit', 'LinBandit', 'AdvBandit', 'BatchAdvBandit', 'Algorithm']
 
 
 class StoBandit:
@@ -15,10 +16,17 @@ class StoBandit:
     """
     This bandit class simulates a single-dimensional `Sto`chastic bandit.
 
+    Every pull only touches the pulled arm, so its cost does not depend on
+    the number of arms.
+
     Positional Arguments:
-        * arm object
+        * arm object list, or an ArmSet
+    Keyword Arguments:
+        * rng: a numpy Generator, or a seed to build one from
     Attributes:
-        * Bandit.arms : list of arms objects within the bandit, which contains:
+        * Bandit.rng : the numpy Generator shared by the bandit, its arms and
+            its algorithm
+        * Bandit.arms : the ArmSet of the arms within the bandit, which contains:
             * Bandit.arms[n].mean : the mean of the n^th arm
             * Bandit.arms[n].info : info about the n_th arm
         * Bandit.n_arms : number of arms that the Bandit has
@@ -28,41 +36,53 @@ class StoBandit:
             some confidence interval (not always used)
         * Bandit.timestep[0] : the number of timesteps that have passed so far
             (incremented with every arm pull)
-            * Note : Bandit.timestep is a vector for use in algorithms
+            * Note : Bandit.timestep is a vector of length 1, which
+                broadcasts against the per-arm vectors in algorithms
         * Bandit.total_reward : the total reward that the Bandit has
             accumulated so far
         * Bandit.arm_reward : the reward that each arm has so far
         * Bandit.reward : the reward that the Bandit recieved after the
             previous timestep
+        * Bandit.gaps : the gap between the best mean and the mean of each arm
+        * Bandit.regret : the regret so far, updated with every arm pull
     Methods:
         * pullArm(arm): pull a specific arm
-        * giveRegret(): calculate the current regret
+        * giveRegret(): give the current regret
         * reset(): reset all timestep-based properties
+        * refresh(rng=None): re-read the parameters of the arms after they
+            change, optionally switching to a new generator, and reset
         * fullInfo(): print information about the bandit
     """
 
-    def __init__(self, arm_object_list):
-        self.arms = arm_object_list
-        self.n_arms = len(arm_object_list)
-        self.T = np.zeros(self.n_arms, dtype=np.int)
+    def __init__(self, arm_object_list, rng=None):
+        self.rng = np.random.default_rng(rng)
+        if isinstance(arm_object_list, ArmSet):
+            self.arms = arm_object_list
+        else:
+            self.arms = ArmSet.from_arms(arm_object_list)
+        self.arms.rng = self.rng
+        self.n_arms = self.arms.n_arms
+        self.T = np.zeros(self.n_arms, dtype=int)
         self.U = np.zeros(self.n_arms)
         self.U_conf = np.zeros(self.n_arms)
-        self.timestep = np.zeros(self.n_arms, dtype=np.int)
-        self.arm_reward = np.zeros(self.n_arms, dtype=np.int)
+        self.timestep = np.zeros(1, dtype=int)
+        self.arm_reward = np.zeros(self.n_arms, dtype=int)
         self.total_reward = 0
 
-        self.mean_list = np.array([self.arms[arm].mean
-            for arm in range(self.n_arms)])
+        self.mean_list = self.arms.mean
+        self.gaps = np.amax(self.mean_list) - self.mean_list
+        self.regret = 0
 
 
     def giveRegret(self):
-        return sum(self.T[i] * (np.amax(self.mean_list) - self.arms[i].mean) for i in range(self.n_arms))
+        return self.regret
 
 
     def pullArm(self, arm):
         self.T[arm] += 1
         self.timestep += 1
-        self.reward = self.arms[arm].pull()
+        self.regret += self.gaps[arm]
+        self.reward = self.arms.pull(arm)
         self.arm_reward[arm] += self.reward
         self.U[arm] = self.U[arm] + 1/self.T[arm] * (self.reward - self.U[arm])
 
@@ -70,15 +90,28 @@ class StoBandit:
 
 
     def reset(self):  # resets everything in the bandit for re-use!
-        self.T = np.zeros(self.n_arms, dtype=np.int)
+        self.T = np.zeros(self.n_arms, dtype=int)
         self.U = np.zeros(self.n_arms)
         self.U_conf = np.zeros(self.n_arms)
-        self.timestep = np.zeros(self.n_arms, dtype=np.int)
+        self.timestep = np.zeros(1, dtype=int)
+        self.arm_reward = np.zeros(self.n_arms, dtype=int)
         self.regret = 0
 
         return None
 
 
+    def refresh(self, rng=None):
+        if rng is not None:
+            self.rng = rng
+        self.arms.rng = self.rng
+        self.arms.discard()
+        self.mean_list = self.arms.mean
+        self.gaps = np.amax(self.mean_list) - self.mean_list
+        self.reset()
+
+        return None
+
+
     def fullInfo(self):
         print("\n" + "+" + "-"*85 + "+")
 
@@ -87,7 +120,7 @@ class StoBandit:
                 "({3:f}), called ({4}) times"
                 .format(
                     arm,
-                    self.arms[arm].mean,
+                    self.mean_list[arm],
                     self.U[arm],
                     self.U_conf[arm],
                     self.T[arm]))
@@ -103,6 +136,107 @@ class StoBandit:
 
 
 
+class BatchStoBandit:
+
+    """
+    A vectorized StoBandit which runs many independent replicates (cycles) of
+    the same bandit in lockstep.
+
+    Every per-arm quantity of StoBandit gains a leading replicate axis, so one
+    call to pullArm advances every replicate by one timestep. The algorithms
+    in banditvis.algorithms operate along the last axis, so the same algorithm
+    functions work for both StoBandit and BatchStoBandit.
+
+    Positional Arguments:
+        * arm object list, or an ArmSet
+        * number of replicates
+    Keyword Arguments:
+        * rng: a numpy Generator, or a seed to build one from
+    Attributes:
+        * Bandit.rng : the numpy Generator used by the bandit and its algorithm
+        * Bandit.arms : the arms within the bandit, as given
+        * Bandit.n_arms : number of arms that the Bandit has
+        * Bandit.cycles : number of replicates
+        * Bandit.T : (cycles, n_arms) array of pulls of each arm
+        * Bandit.U : (cycles, n_arms) array of the cumulative average of each arm
+        * Bandit.U_conf : (cycles, n_arms) array of adjusted averages
+        * Bandit.arm_reward : (cycles, n_arms) array of the reward of each arm
+        * Bandit.timestep[0] : the number of timesteps that have passed so
+            far, shared by every replicate (a vector of length 1, as in
+            StoBandit)
+        * Bandit.reward : the (cycles,) rewards recieved in the previous
+            timestep
+        * Bandit.gaps : the gap between the best mean and the mean of each arm
+        * Bandit.regret : the (cycles,) regret of every replicate so far
+    Methods:
+        * pullArm(arm): pull an arm in every replicate; arm is either a single
+            index or a (cycles,) array of indices
+        * giveRegret(): calculate the current regret of every replicate
+        * reset(): reset all timestep-based properties
+    """
+
+    def __init__(self, arm_object_list, cycles, rng=None):
+        self.rng = np.random.default_rng(rng)
+        self.arms = arm_object_list
+        self.n_arms = len(arm_object_list)
+        self.cycles = cycles
+        self.rows = np.arange(cycles)
+
+        if isinstance(arm_object_list, ArmSet):
+            arm_set = arm_object_list
+        else:
+            arm_set = ArmSet.from_arms(arm_object_list)
+        self.mean_list = arm_set.mean.copy()
+        self.gaps = np.amax(self.mean_list) - self.mean_list
+        self.bernoulli = arm_set.bernoulli.copy()
+        self.sd_list = np.where(arm_set.bernoulli, 0., arm_set.sd)
+
+        self.reset()
+
+
+    def _draw(self, arm):
+        """
+        Draws one reward for each replicate from the arm that replicate pulled.
+        """
+        reward = np.empty(self.cycles)
+        bern = self.bernoulli[arm]
+        if bern.any():
+            reward[bern] = self.rng.random(np.count_nonzero(bern)) <= self.mean_list[arm[bern]]
+        if not bern.all():
+            norm = np.invert(bern)
+            reward[norm] = self.rng.normal(self.mean_list[arm[norm]], self.sd_list[arm[norm]])
+        return reward
+
+
+    def giveRegret(self):
+        return self.regret.copy()
+
+
+    def pullArm(self, arm):
+        arm = np.broadcast_to(arm, (self.cycles,))
+        self.T[self.rows, arm] += 1
+        self.timestep += 1
+        self.regret += self.gaps[arm]
+        self.reward = self._draw(arm)
+        self.arm_reward[self.rows, arm] += self.reward
+        self.U[self.rows, arm] += (self.reward - self.U[self.rows, arm]) / self.T[self.rows, arm]
+
+        return None
+
+
+    def reset(self):
+        shape = (self.cycles, self.n_arms)
+        self.T = np.zeros(shape, dtype=int)
+        self.U = np.zeros(shape)
+        self.U_conf = np.zeros(shape)
+        self.arm_reward = np.zeros(shape)
+        self.timestep = np.zeros(1, dtype=int)
+        self.regret = np.zeros(self.cycles)
+
+        return None
+
+
+
 class LinBandit:
     """
     The Linear Bandit class is very similar to the original Bandit class, in
@@ -115,7 +249,10 @@ class LinBandit:
         * vector mean
     Keyword Arguments:
         * normalized: boolean
+        * rng: a numpy Generator, or a seed to build one from
     Attributes:
+        * rng: the numpy Generator shared by the bandit, its arms and its
+            algorithm
         * normalized: boolean for normalized (all vectors length 1)
         * mean: the vector mean
         * n_arms: the number of arms
@@ -125,18 +262,24 @@ class LinBandit:
         * arm_vecs: a list of the arm vectors
         * G: the gram matrix, initialized with the identity to ensure
             invertibility
+        * G_inv: the inverse of G, kept up to date with Sherman-Morrison
+            rank-1 updates so that it never has to be recomputed
         * U: the system average vector
         * A: the sum of arm vectors chosen multiplied by the scalar reward
             it recieved
         * U_conf: the confidence value for each arm
         * timestep: the timestep
+        * gaps: the gap between the best expected reward and the expected
+            reward of each arm
+        * regret: the regret so far, updated with every arm pull
     Methods:
         * pullArm(arm): pull a specific arm
-        * giveRegret(): calculate the current regret
+        * giveRegret(): give the current regret
         * reset(): reset all timestep-based properties
         * fullInfo(): print information about the bandit
     """
-    def __init__(self, arm_object_list, vector_mean, normalized=False):
+    def __init__(self, arm_object_list, vector_mean, normalized=False, rng=None):
+        self.rng = np.random.default_rng(rng)
         self.mean = vector_mean
         self.arms = arm_object_list
         self.arm_vecs = np.array([arm.arm_vec for arm in self.arms])
@@ -151,46 +294,56 @@ class LinBandit:
         self.dim = arm_object_list[0].dim
 
         self.G = np.identity(self.dim)  # .dim is the dimension
+        self.G_inv = np.identity(self.dim)
         self.U = np.zeros(self.dim)  # vector of averages
         self.A = np.zeros(self.dim)  # vectors of actions taken so far weighted by the reward
         self.U_conf = np.zeros(self.n_arms)
-        self.timestep = np.zeros(self.n_arms, dtype=np.int)
+        self.timestep = np.zeros(self.n_arms, dtype=int)
 
-        # give each arm a vector mean
+        arm_means = np.dot(self.arm_vecs, self.mean)
+        self.gaps = np.amax(arm_means) - arm_means
+        self.regret = 0
+
+        # give each arm a vector mean and the shared generator
         for arm in arm_object_list:
             arm.mean_vec = vector_mean
+            arm.rng = self.rng
 
     def pullArm(self, arm):
         self.T[arm] += 1
         self.timestep += 1  # update timesetp
+        self.regret += self.gaps[arm]
 
         # self.G is the sum of the products X X^T of the arm pulled in each round X
         # self.arm_vecs[arm] is the arm vector for a given [arm]
         self.G += np.outer(self.arm_vecs[arm], self.arm_vecs[arm])
 
+        # Sherman-Morrison: the inverse of G + x x^T from the inverse of G in O(dim^2)
+        G_inv_x = np.dot(self.G_inv, self.arm_vecs[arm])
+        self.G_inv -= np.outer(G_inv_x, G_inv_x) / (1 + np.dot(self.arm_vecs[arm], G_inv_x))
+
         # self.A is the sum of the arm vector pulled so far, scaled by the reward each pull resulted in
         self.A += self.arm_vecs[arm] * self.arms[arm].pull()
 
         # self.U is the "most likely" value of the mean vector; it is calculated based on least squares
         # update the reward approximation based on the inverse of G times the scaled sum of chosen arms
-        self.U = np.dot(inv(self.G), self.A)
+        self.U = np.dot(self.G_inv, self.A)
 
         return None
 
     def giveRegret(self):
-        return np.amax(np.dot(self.arm_vecs, self.mean)) * self.timestep[0] - np.dot(
-            self.T,
-            np.dot(self.arm_vecs, self.mean)
-        )
+        return self.regret
 
 
     def reset(self):
         self.T = np.zeros(self.n_arms)
         self.G = np.identity(self.dim)  # .dim is the dimension
+        self.G_inv = np.identity(self.dim)
         self.U = np.zeros(self.dim)  # vector
         self.A = np.zeros(self.dim)  # vectors of actions taken so far weighted by the reward
         self.U_conf = np.zeros(self.n_arms)
-        self.timestep = np.zeros(self.n_arms, dtype=np.int)
+        self.timestep = np.zeros(self.n_arms, dtype=int)
+        self.regret = 0
         return None
 
 
@@ -216,47 +369,90 @@ class LinBandit:
 
 
 
+def _best_loss(seq, block=4096):
+    """
+    The loss of the best arm in hindsight after each timestep of seq, with a
+    leading 0. The cumulative sums are built block by block of timesteps, so
+    only (n_arms, block) values are held beyond seq itself.
+    """
+    best = np.zeros(seq.shape[1] + 1)
+    totals = np.zeros(seq.shape[0])
+    for start in range(0, seq.shape[1], block):
+        sums = totals[:, None] + np.cumsum(seq[:, start:start + block], axis=1)
+        best[start + 1:start + 1 + sums.shape[1]] = np.amin(sums, axis=0)
+        totals = sums[:, -1]
+    return best
+
+
 class AdvBandit:
-    def __init__(self, arm_object_list):
+    """
+    An `Adv`ersarial bandit, whose arms follow fixed sequences of losses.
+
+    Positional Arguments:
+        * list of arm objects, each with a reward_vec of losses
+    Keyword Arguments:
+        * rng: a numpy Generator, or a seed to build one from
+    Attributes:
+        * seq: the (n_arms, horizon) array of losses
+        * logW: the log weight of each arm, updated by the algorithm
+        * log_norm: the log of the sum of the weights, kept up to date by the
+            algorithm
+        * T: the number of pulls of each arm
+        * choices: the arm chosen at each timestep, stored in the smallest
+            integer type that fits (-1 for timesteps not reached yet)
+        * loss: the loss incurred so far
+        * best_loss: the loss of the best arm in hindsight after each
+            timestep (best_loss[0] = 0), precomputed from cumulative sums of
+            seq
+        * timestep: the timestep
+    Methods:
+        * pullArm(arm): pull a specific arm
+        * giveRegret(): give the current regret
+        * reset(): reset all timestep-based properties
+        * fullInfo(): print information about the bandit
+    """
+    def __init__(self, arm_object_list, rng=None):
+        self.rng = np.random.default_rng(rng)
         self.arms = arm_object_list
         self.seq = np.array([arm.reward_vec for arm in self.arms])
         self.n_arms, self.horizon = self.seq.shape
+        self.best_loss = _best_loss(self.seq)
+        self.choices = np.full(self.horizon, -1, dtype=np.min_scalar_type(-self.n_arms))
         self.horizon = [self.horizon] * self.n_arms
 
         self.U = np.ones(self.n_arms)
-        self.W = np.ones(self.n_arms)  # weights, updated by algorithm
+        self.logW = np.zeros(self.n_arms)  # log weights, updated by algorithm
+        self.log_norm = np.array(np.log(self.n_arms))
         self.T = np.zeros(self.n_arms)
-        self.pulled = np.full(self.seq.shape, False, dtype=bool)
-        self.timestep = np.zeros(self.n_arms, dtype=np.int)
+        self.timestep = np.zeros(self.n_arms, dtype=int)
+        self.loss = 0
 
 
     def pullArm(self, arm):
         self.T[arm] += 1
         self.timestep += 1
-        self.pulled[arm][self.timestep-1] = True
+        self.choices[self.timestep[0]-1] = arm
+        self.loss += self.seq[arm, self.timestep[0]-1]
 
     def giveRegret(self):
-        values = self.pulled * self.seq
-        total_reward = np.sum(values)
-        # the slice shortens the row by truncating any columns beyond the timestep
-        best_arm_reward = np.amin(np.sum(self.seq[:,:self.timestep[0]], axis=1))  # compute the best arm loss
-        return total_reward - best_arm_reward
+        return self.loss - self.best_loss[self.timestep[0]]
 
 
     def reset(self):
-        self.W = np.ones(self.n_arms)  # weights, updated by algorithm
+        self.logW = np.zeros(self.n_arms)  # log weights, updated by algorithm
+        self.log_norm = np.array(np.log(self.n_arms))
         self.T = np.zeros(self.n_arms)
-        self.pulled = np.full(self.seq.shape, False, dtype=bool)
-        self.timestep = np.zeros(self.n_arms, dtype=np.int)
-        self.loss_approx = np.zeros(self.n_arms, dtype=np.int)
+        self.choices[:self.timestep[0]] = -1
+        self.timestep = np.zeros(self.n_arms, dtype=int)
+        self.loss = 0
 
     def fullInfo(self):
         print("\n" + "+" + "-"*85 + "+")
 
         for arm in range(self.n_arms):
-            print("| Arm {0}: weight ({1:f}), called ({2}) times".format(
+            print("| Arm {0}: probability ({1:f}), called ({2}) times".format(
                 arm,
-                self.W[arm],
+                np.exp(self.logW[arm] - self.log_norm),
                 self.T[arm]))
         print("|\n| {0} arms, regret ({1}), timestep ({2} / {3})"
             .format(
@@ -269,6 +465,74 @@ class AdvBandit:
         return None
 
 
+class BatchAdvBandit:
+
+    """
+    A vectorized AdvBandit which runs many independent replicates (cycles) of
+    the same adversarial bandit in lockstep, in the same way as
+    BatchStoBandit. The loss sequence and the best-arm-in-hindsight losses are
+    shared by every replicate.
+
+    Positional Arguments:
+        * arm object list
+        * number of replicates
+    Keyword Arguments:
+        * rng: a numpy Generator, or a seed to build one from
+    Attributes:
+        * Bandit.seq : the (n_arms, horizon) array of losses
+        * Bandit.logW : (cycles, n_arms) array of log weights
+        * Bandit.log_norm : (cycles,) array of the log of the sum of weights
+        * Bandit.T : (cycles, n_arms) array of pulls of each arm
+        * Bandit.loss : (cycles,) array of the loss incurred so far
+        * Bandit.best_loss : the loss of the best arm in hindsight after each
+            timestep
+        * Bandit.timestep : the number of timesteps that have passed so far,
+            shared by every replicate
+    Methods:
+        * pullArm(arm): pull an arm in every replicate; arm is either a single
+            index or a (cycles,) array of indices
+        * giveRegret(): give the current regret of every replicate
+        * reset(): reset all timestep-based properties
+    """
+
+    def __init__(self, arm_object_list, cycles, rng=None):
+        self.rng = np.random.default_rng(rng)
+        self.arms = arm_object_list
+        self.seq = np.array([arm.reward_vec for arm in self.arms])
+        self.n_arms = self.seq.shape[0]
+        self.horizon = [self.seq.shape[1]] * self.n_arms
+        self.cycles = cycles
+        self.rows = np.arange(cycles)
+        self.best_loss = _best_loss(self.seq)
+
+        self.reset()
+
+
+    def giveRegret(self):
+        return self.loss - self.best_loss[self.timestep[0]]
+
+
+    def pullArm(self, arm):
+        arm = np.broadcast_to(arm, (self.cycles,))
+        self.T[self.rows, arm] += 1
+        self.loss += self.seq[arm, self.timestep[0]]
+        self.timestep += 1
+
+        return None
+
+
+    def reset(self):
+        shape = (self.cycles, self.n_arms)
+        self.logW = np.zeros(shape)
+        self.log_norm = np.full(self.cycles, np.log(self.n_arms))
+        self.T = np.zeros(shape, dtype=int)
+        self.loss = np.zeros(self.cycles)
+        self.timestep = np.zeros(self.n_arms, dtype=int)
+
+        return None
+
+
+
 class Algorithm:
     """
     The Algorithm class specifies the behaviour of an algorithm.
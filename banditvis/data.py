@@ -2,81 +2,133 @@ import copy
 import os
 import numpy as np
 from .simulation import ReMapSim
+from .trajectory import trajectory_grid
+from .sweep import SweepTemplate
+from .profiling import Profile
 from pprint import pprint
 import time
 
-def _fix_vars(obj, variable):
+# the shared array of the number of pulls done for each simulation, set in
+# every worker process of the pool by SetProgress
+_progress = None
+# the multiprocessing.Queue which the Profile of every chunk is sent to when
+# the run is profiled, set by SetProgress
+_reports = None
+
+def SetProgress(progress, reports=None):
     """
-    Recursively searches the nested sim dict structure, and attempts to find
-    every instance of '&&', replace it with some variable, and evaulate that
-    string. It does this by recursively building a copy of the object if it
-    contains dict or list substructures. Note that this function will not
-    search in any structures other than lists or dicts.
+    Sets the shared-memory array (a multiprocessing.Array with one integer per
+    simulation) which HistChunk, VarBlock and TrajChunk add their pulls to.
+    It is called once in each worker process, as the initializer of the pool.
+
+    If reports is given, every chunk is run on an instrumented Simulation, and
+    its Profile is put on reports as (i, profile) once it is finished.
     """
-    if isinstance(obj, dict):
-        return {key: _fix_vars(val, variable) for key, val in obj.items()}
-    elif isinstance(obj, list):
-        return [_fix_vars(key, variable) for key in obj]
-    elif isinstance(obj, str):
-        if '&&' in obj:
-            return eval(obj.replace("&&", str(variable)))
-        else:
-            return obj
-    return obj
+    global _progress, _reports
+    _progress = progress
+    _reports = reports
+    return None
+
+def _advance(i, pulls):
+    if _progress is not None:
+        with _progress.get_lock():
+            _progress[i] += pulls
+    return None
 
-def HistData(i, sim_dict, data_folder="."):
+def _profile():
+    return None if _reports is None else Profile()
+
+def _instrument(sim, profile):
+    if profile is not None and sim.profile is None:
+        sim.instrument(profile)
+    return None
+
+def _report(i, profile):
+    if profile is not None:
+        _reports.put((i, profile))
+    return None
+
+def HistChunk(i, sim_dict, cycles, seed=None, bounds=None):
     """
-    Generates Histogram data.
-
-    Runs the bandit algorithms to create files containing regret data for each
-    element of core_dict['sim']
-        * builds a temporary dictionary which is a deep copy of the correspon-
-            ding simulation dictionary
-        * uses ReMapSim to build a Simulation object
-        * runs that Simulation object using runHist
-        * saves that data in the specified folder
+    Generates a chunk of Histogram data.
+
+    Runs a number of cycles of the i^th simulation and returns (i, regret),
+    where regret is an array of the regret of each cycle. The chunks of a
+    single simulation are independent, so they can be run by different
+    processes and merged into the same data file by the caller. Each chunk
+    draws from its own generator built from seed, so a chunk can be rerun on
+    its own given the same seed. Pulls are added to the progress counter of
+    the i^th simulation as cycles finish.
+
+    If bounds is given, regret is instead a TrajectoryStats of the regret
+    binned over the (lower, upper) range of bounds (see runHistogram), which
+    the caller merges.
     """
-    file_name = "{}/data{}.txt".format(data_folder, i)
     temp_dict = copy.deepcopy(sim_dict)
-    ReMapSim(temp_dict)
+    ReMapSim(temp_dict, seed)
     sim = temp_dict['Simulation']
+    horizon = temp_dict['horizon']
+    profile = _profile()
+    _instrument(sim, profile)
 
-    sim.runHist(
-        temp_dict['horizon'],
-        temp_dict['cycles'],
-        file_name)
-
-    return None
+    progress = lambda finished: _advance(i, finished * horizon)
+    if bounds is not None:
+        result = sim.runHistogram(horizon, cycles, *bounds, progress)
+    else:
+        result = sim.runRegret(horizon, cycles, progress)
+    _report(i, profile)
+    return (i, result)
 
 
-def VarData(i, sim_dict, data_folder=".", iter_list = []):
+def VarBlock(i, sim_dict, points, squares=False):
     """
-    Generates Variable data.
-
-    VarData runs the bandit algorithms to create files containing regret data
-    for each element of core_dict['sim']. It:
-        * builds a temporary dictionary which is a deep copy of the correspond-
-            ing simulation dictionary
-        * uses ReMapSim to build a Simulation object
-        * runs that Simulation object using runVar
-        * saves the output data to sequentially generated save files
-
-    The inner loop works as follows:
-        * temp_dict is made as a copy
-        * every instance of '#' is replaced with num
-        * the bandit algorithm is run using the replaced string
+    Generates the Variable data of several sweep points of the i^th
+    simulation at once.
+
+    points is a list of (j, num, cycles, seed), one per chunk to run. The
+    '&&' placeholders are compiled once into a SweepTemplate, whose Simulation
+    is rebound to each point in turn rather than rebuilt. Returns (i,
+    [(j, total_regret, iterations), ...]) in the order of points. If squares,
+    each result also holds the sum of the squared regret of its cycles, which
+    a StoppingRule needs. As with HistChunk, each point draws from its own
+    generator built from its seed, and pulls are added to the progress
+    counter of the i^th simulation.
     """
-    for num in iter_list:  # now num is the variable
-        temp_dict = _fix_vars(sim_dict, num)
+    template = SweepTemplate(sim_dict)
+    profile = _profile()
+    results = []
+    for j, num, cycles, seed in points:
+        sim, horizon, _ = template.point(num, seed)
+        _instrument(sim, profile)
+        regret = sim.runRegret(horizon, cycles, lambda finished: _advance(i, finished * horizon))
+        if squares:
+            results.append((j, sim.total_regret, sim.iterations, np.dot(regret, regret)))
+        else:
+            results.append((j, sim.total_regret, sim.iterations))
+
+    _report(i, profile)
+    return (i, results)
 
-        ReMapSim(temp_dict)
-        sim = temp_dict['Simulation']
 
-        file_name = "{}/data{}.txt".format(data_folder, i)
-        sim.runVar(
-            temp_dict['horizon'],
-            temp_dict['cycles'],
-            file_name
-        )
+def TrajChunk(i, sim_dict, cycles, points=None, seed=None):
+    """
+    Generates a chunk of Trajectory data.
+
+    Runs a number of cycles of the i^th simulation and returns (i, stats),
+    where stats is a TrajectoryStats of the cumulative regret on the grid
+    given by trajectory_grid(horizon, points). The stats of the chunks of a
+    simulation are merged by the caller. As with HistChunk, the chunk draws
+    from its own generator built from seed, and adds its pulls to the
+    progress counter of the i^th simulation.
+    """
+    temp_dict = copy.deepcopy(sim_dict)
+    ReMapSim(temp_dict, seed)
+    sim = temp_dict['Simulation']
+    horizon = temp_dict['horizon']
+    profile = _profile()
+    _instrument(sim, profile)
 
-    return None
\ No newline at end of file
+    stats = sim.runTrajectory(horizon, cycles, trajectory_grid(horizon, points),
+        lambda finished: _advance(i, finished * horizon))
+    _report(i, profile)
+    return (i, stats)
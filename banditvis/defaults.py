@@ -5,7 +5,12 @@ import os
 CORE_DEFAULTS = {
     'out': "hi",
     'Animate': False,
+    'Cache': True,
+    'CacheFolder': None,
+    'CacheSize': 1024,
+    'Confidence': 0.95,
     'FPS': 20,
+    'GridPoints': 100,
     'HelpLines': True,
     'InputData': False,
     'LevelCurves': True,
@@ -14,5 +19,11 @@ CORE_DEFAULTS = {
     'Normalized': False,
     'PlotSave': "temp.pdf",
     'PlotTitle': False,
-    'DeleteData': False
+    'Precompute': False,
+    'Profile': False,
+    'RawData': False,
+    'Precision': False,
+    'RelativePrecision': False,
+    'DeleteData': False,
+    'StepsPerFrame': 1
 }
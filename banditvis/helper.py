@@ -36,3 +36,25 @@ def msplit(text, *limiters):
     for limit in limiters:
         text = text.replace(limit, '$!!7=4+[4}|[2')
     return text.split('$!!7=4+[4}|[2')
+
+
+def split_cycles(cycles, parts):
+    """
+    Splits a number of cycles into at most parts chunks of nearly equal size.
+
+    Args:
+        cycles: the total number of cycles
+        parts: the desired number of chunks
+    Returns:
+        A list of chunk sizes which sum to cycles
+
+    Examples:
+
+    >>> split_cycles(10, 4)
+    [3, 3, 2, 2]
+    >>> split_cycles(2, 4)
+    [1, 1]
+
+    """
+    parts = max(1, min(parts, cycles))
+    return [cycles // parts + (k < cycles % parts) for k in range(parts)]
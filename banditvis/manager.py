@@ -8,17 +8,58 @@ import sys
 import time
 import signal
 import os
+import queue
+import shutil
+import filecmp
+from collections import deque
+
+import numpy as np
 
 from .parse import Parse
 from .plot import *
 from .data import *
+from .sweep import SweepTemplate
 from .animation import *
 from .formatting import bcolors
+from .helper import split_cycles
+from .store import (ResultWriter, result_path, cycles_path, read_results, count_results,
+    truncate_results)
+from .stopping import StoppingRule
+from .trajectory import (TrajectoryStats, HISTOGRAM_BINS, trajectory_path, histogram_path,
+    histogram_range)
+from .cache import ResultCache, cache_key
+from .checkpoint import Manifest, manifest_path, input_path
+from .profiling import Profile, ProfileCollector, profile_path, PHASES
+
+# the largest number of pulls (cycles times horizon) in a chunk of cycles
+CHUNK_PULLS = 2**18
+# the number of tasks scheduled for each process in the pool when grouping the chunks of a sweep
+CHUNKS_PER_PROCESS = 4
+# the number of chunks per process kept in the pool at once when stopping sequentially
+SEQUENTIAL_WINDOW = 2
+# the number of raw results read at once when binning a data file
+HIST_BLOCK = 2**20
+# the number of seconds between updates of the status line
+STATUS_INTERVAL = 0.5
 
 def _checkInput(**arg_dict):
     """
     Gets the input from the user commmand and checks it for potential errors.
+
+    To resume a run, the copy of the input file in its data folder is parsed again with the seed
+    and command line arguments recorded in its manifest.
     """
+    if 'resume' in arg_dict:
+        folder = arg_dict.pop('resume')
+        manifest = Manifest(folder)
+        if manifest.header is None:
+            sys.exit("ERROR: '{}' is not the data folder of an interrupted run.".format(folder))
+        arg_dict.pop('input', None)
+        arg_dict = {**manifest.header['args'], **arg_dict, 'seed': manifest.header['seed'],
+            'DataFolder': folder}
+        core_dict = Parse(input_path(folder), **arg_dict)
+        core_dict['DataFolder'] = folder
+        return core_dict
     if arg_dict['input'].endswith('.txt'):
         pass
     else:
@@ -31,35 +72,640 @@ def _checkInput(**arg_dict):
         sys.exit("ERROR: The file '{}' you tried to input doesn't exist in the current directory.".format(input_file))
     return core_dict
 
-def _init_worker():
+def _init_worker(progress, reports=None):
     signal.signal(signal.SIGINT, signal.SIG_IGN)
+    SetProgress(progress, reports)
+
+def _star(task):
+    """
+    Unpacks a (function, args) pair for use with pool.imap_unordered.
+    """
+    func, args = task
+    return func(*args)
+
+def _keyed(task):
+    """
+    Unpacks a (key, function, args) triple for use with pool.imap_unordered, and returns the key
+    along with the result so that the caller knows which task finished.
+    """
+    key, func, args = task
+    return (key, func(*args))
+
+def _chunks(cycles, horizon):
+    """
+    The sizes of the chunks the cycles of a simulation (or sweep point) are split into: as few as
+    keep every chunk within CHUNK_PULLS pulls. The split, and so the seed of every chunk, does not
+    depend on the number of processes, so a seeded run gives the same results with any Multiprocess.
+    """
+    return split_cycles(cycles, -(-cycles * horizon // CHUNK_PULLS))
+
+def _parts(core_dict, n_tasks):
+    """
+    The number of tasks to group the chunks of each of n_tasks into, so that every process in the
+    pool has several tasks to work on. Grouping only decides which chunks share a worker.
+    """
+    return -(-CHUNKS_PER_PROCESS * core_dict['Multiprocess'] // n_tasks)
+
+def _seed(core_dict, *key):
+    """
+    The SeedSequence of a single chunk of work, identified by its key (simulation index, [sweep
+    point index,] chunk index). Chunks are seeded independently of the order in which they run, so
+    any chunk can be rerun on its own from the run seed.
+    """
+    return np.random.SeedSequence(core_dict['Seed'], spawn_key=key)
+
+def _cache(core_dict):
+    """
+    The ResultCache of a run, or None if caching is turned off. Unseeded runs are not cached, since
+    their keys would never repeat.
+    """
+    if not core_dict['Cache'] or not core_dict['Seeded']:
+        return None
+    return ResultCache(core_dict['CacheFolder'], core_dict['CacheSize'])
+
+def _checkpoint(core_dict, input_file, arg_dict):
+    """
+    Creates the data folder of a Histogram or Variable run if necessary, and returns its Manifest.
+
+    A new manifest records a copy of the input file, the seed of the run, and the command line
+    arguments needed to resume it. A data folder which already has a manifest must
+    come from the same input file; its seed is used again, so that the work it records as finished
+    is not redone.
+    """
+    folder = core_dict['DataFolder']
+    os.makedirs(folder, exist_ok=True)
+    manifest = Manifest(folder)
+    if manifest.header is None:
+        if os.path.abspath(input_file) != os.path.abspath(input_path(folder)):
+            shutil.copyfile(input_file, input_path(folder))
+        manifest.start(init=core_dict['init'], seed=core_dict['Seed'], seeded=core_dict['Seeded'],
+            args={key: arg_dict[key] for key in ('out',) if key in arg_dict})
+    elif not filecmp.cmp(input_file, input_path(folder), shallow=False):
+        sys.exit("ERROR: The data folder '{}' holds a different run. Resume it with "
+            "'banditvis --resume' or use another folder.".format(folder))
+    else:
+        core_dict['Seed'] = manifest.header['seed']
+        core_dict['Seeded'] = manifest.header['seeded']
+    return manifest
+
+def _recorder(manifest, path, i, chunks):
+    """
+    A function recording the chunks of the i^th simulation as finished in manifest, along with the
+    number of results in path, for the ResultWriter to call once their regret is written.
+    """
+    if manifest is None:
+        return None
+    def record():
+        count = count_results(path)
+        for c in chunks:
+            manifest.record(i, c, count=count)
+    return record
+
+def _background(func, *args):
+    """
+    Runs func(*args) in a daemon thread, and returns a function which waits for it to finish and
+    re-raises any error it raised.
+    """
+    errors = []
+    def target():
+        try:
+            func(*args)
+        except BaseException as e:
+            errors.append(e)
+    thread = th.Thread(target=target, daemon=True)
+    thread.start()
+    def wait():
+        thread.join()
+        if errors:
+            raise errors[0]
+    return wait
+
+def _reused(cache, total):
+    if cache is not None and cache.hits:
+        print(" {} of {} results reused from the cache ".format(cache.hits, total).center(100, "-"))
+    return None
+
+def _rule(core_dict):
+    """
+    The StoppingRule of a run, or None if it runs every one of its cycles.
+    """
+    if not core_dict['Precision'] and not core_dict['RelativePrecision']:
+        return None
+    return StoppingRule(core_dict['Precision'], core_dict['RelativePrecision'],
+        core_dict['Confidence'])
+
+def _cycles(used, planned):
+    print(" cycles used: {} ".format(" ".join("[{}] {} of {}".format(i, u, p)
+        for i, (u, p) in enumerate(zip(used, planned)))).center(100, "-"))
+    return None
+
+class _Sequence:
+    """
+    The chunks of cycles of a simulation (Histogram) or sweep point (Variable) run under a
+    StoppingRule. Chunks are accepted in index order only, and the rule is checked after each one,
+    so the cycles used do not depend on the order in which the pool finishes them. Once the rule
+    is met, the chunks still queued are dropped, and those still running are discarded.
+
+    Positional Arguments:
+        * rule: the StoppingRule
+        * tasks: the (key, function, args) tasks of the chunks left to run, in index order, keyed
+            by tuples ending in the chunk index
+        * sizes: the number of cycles of every chunk
+        * horizon: the horizon of the simulation
+    Keyword Arguments:
+        * start: the index of the first chunk left to run
+        * count, total, square: the number of cycles of the chunks before start, and the sums of
+            their regret and squared regret
+    Attributes:
+        * queue: the tasks which are not in the pool yet
+        * stopped: whether the rule is met
+        * count, total, square: the number of cycles accepted, and the sums of their regret and
+            squared regret
+    Methods:
+        * accept(c, result, count, total, square): adds the result of the c^th chunk, and returns
+            the (chunk index, result) pairs it lets through, in index order
+        * finished(): whether no more chunks will be accepted
+        * pulls(): the number of pulls this run makes, or made before the rule was met
+    """
+    def __init__(self, rule, tasks, sizes, horizon, start=0, count=0, total=0, square=0):
+        self.rule = rule
+        self.queue = deque(tasks)
+        self.sizes = sizes
+        self.horizon = horizon
+        self.start = start
+        self.next = start
+        self.pending = {}
+        self.count, self.total, self.square = count, total, square
+        self.stopped = False
+        self._check()
+
+    def _check(self):
+        if self.count and self.rule.done(self.count, self.total, self.square):
+            self.stopped = True
+            self.queue.clear()
+            self.pending.clear()
+
+    def accept(self, c, result, count, total, square):
+        accepted = []
+        if self.stopped:
+            return accepted
+        self.pending[c] = (result, count, total, square)
+        while not self.stopped and self.next in self.pending:
+            result, count, total, square = self.pending.pop(self.next)
+            self.count += count
+            self.total += total
+            self.square += square
+            accepted.append((self.next, result))
+            self.next += 1
+            self._check()
+        return accepted
+
+    def finished(self):
+        return self.stopped or self.next == len(self.sizes)
+
+    def pulls(self):
+        return sum(self.sizes[self.start:self.next if self.stopped else None]) * self.horizon
+
+def _windowed(pool, sequences, window):
+    """
+    Runs the tasks of several _Sequences in the pool, keeping at most window tasks in it at once.
+    Each free slot goes to the sequence with the fewest tasks running, so that few chunks are
+    still running (and then discarded) when a sequence meets its rule. Yields (key, result) as
+    tasks finish.
+    """
+    results = queue.Queue()
+    running = {id(sequence): 0 for sequence in sequences}
+    while True:
+        ready = [sequence for sequence in sequences if sequence.queue]
+        while ready and sum(running.values()) < window:
+            sequence = min(ready, key=lambda sequence: running[id(sequence)])
+            running[id(sequence)] += 1
+            pool.apply_async(_keyed, (sequence.queue.popleft(),),
+                callback=lambda result, key=id(sequence): results.put((key, result)),
+                error_callback=results.put)
+            ready = [sequence for sequence in sequences if sequence.queue]
+        if not sum(running.values()):
+            return
+        item = results.get()
+        if isinstance(item, BaseException):
+            raise item
+        running[item[0]] -= 1
+        yield item[1]
+
+def _moments(stats):
+    """
+    The (count, total, square) of the regret summarised by a single-point TrajectoryStats, as a
+    _Sequence accepts them.
+    """
+    count = stats.count[0]
+    return (count, stats.mean[0] * count, stats.m2[0] + count * stats.mean[0]**2)
+
+def _saveStats(stats, path):
+    # written to a temporary file first, so that a checkpoint never holds a partial file
+    temp = path[:-len(".npz")] + ".tmp.npz"
+    stats.save(temp)
+    os.replace(temp, path)
+    return None
+
+def _rawStats(folder, i, horizon, lower, upper):
+    """
+    The binned TrajectoryStats of the raw data file of the i^th simulation, read HIST_BLOCK
+    results at a time.
+    """
+    stats = TrajectoryStats([horizon], lower, upper, HISTOGRAM_BINS)
+    regret = read_results(folder, i)
+    for start in range(0, len(regret), HIST_BLOCK):
+        stats.add(regret[start:start + HIST_BLOCK], 0)
+    return stats
+
+def _written(collector, writer, folder, n_sims):
+    """
+    Adds the time the ResultWriter spent writing the data file of each simulation to the write
+    phase of its Profile, if the run is profiled.
+    """
+    if collector is None:
+        return None
+    for i in range(n_sims):
+        profile = Profile()
+        profile.add('write', writer.seconds.get(result_path(folder, i), 0))
+        collector.add(i, profile)
+    return None
+
+def _collect(core_dict, collector):
+    """
+    Once the pool is joined, merges the last Profiles sent by its workers, writes the Profile of
+    every simulation next to its data files, and prints the share of each phase and the giveArm
+    latency quantiles. Does nothing if the run is not profiled.
+    """
+    if collector is None:
+        return None
+    collector.close()
+    print("\n" + " Profile ".center(100, "-"))
+    for i, profile in enumerate(collector.profiles):
+        profile.save(profile_path(core_dict['DataFolder'], i))
+        report = profile.report()
+        shares = " ".join("{} {:.0%}".format(phase, report['phases'][phase]['share'])
+            for phase in PHASES)
+        latency = " ".join("{} {}".format(name, "--" if seconds is None else
+            "{:.3g} us".format(seconds * 1e6)) for name, seconds in report['latency'].items()
+            if name.startswith('p'))
+        print("[{}] {} | giveArm {}".format(i, shares, latency))
+    print("-"*100)
+    return None
+
+def _histRun(pool, core_dict, progress, manifest=None, collector=None):
+    """
+    Splits the cycles of every simulation into chunks and runs them in the pool. Each worker bins
+    the regret of its chunk into a TrajectoryStats of a single point, which is merged into that of
+    its simulation, so memory does not grow with the number of cycles. The merged statistics are
+    saved to the histogram file of each simulation. A _statusThread reports the progress counters
+    of the pool while it runs.
+
+    With RawData (or Animate), workers return the regret of every cycle instead, which is handed
+    to a ResultWriter for the data file of its simulation as soon as it is finished, and the
+    histogram files are built from the data files at the end.
+
+    Simulations found in the result cache are read back instead of being run, and the others are
+    added to the cache once they are finished.
+
+    Given a Manifest, every chunk is recorded in it once its result is written (raw data) or
+    merged (binned data, whose histogram file is then saved). Chunks it already records (from an
+    interrupted run) are skipped, and each data file is first cut back to the results of those
+    chunks.
+
+    With a StoppingRule, the cycles of each simulation are split by StoppingRule.split instead,
+    whatever the number of processes, and its chunks are run as a _Sequence, and accepted in index
+    order until the rule is met.
+
+    Given a ProfileCollector, the time spent writing each data file is added to its Profile.
+    """
+    cache = _cache(core_dict)
+    rule = _rule(core_dict)
+    raw = core_dict['RawData'] or core_dict['Animate']
+    lower, upper = histogram_range(core_dict)
+    folder = core_dict['DataFolder']
+    n_sims = len(core_dict['sim'])
+    tasks = []
+    sequences = [None] * n_sims
+    stats = [TrajectoryStats([sim_dict['horizon']], lower, upper, HISTOGRAM_BINS)
+        for sim_dict in core_dict['sim']]
+    keys = [None] * n_sims
+    totals = [0] * n_sims
+    writer = ResultWriter()
+    for i, sim_dict in enumerate(core_dict['sim']):
+        path = result_path(folder, i)
+        if rule is None:
+            chunks = _chunks(sim_dict['cycles'], sim_dict['horizon'])
+        else:
+            chunks = rule.split(sim_dict['cycles'])
+        done = []
+        if manifest is not None:
+            if raw:
+                done = [c for c in range(len(chunks)) if manifest.done(i, c)]
+                truncate_results(path, max((manifest.done(i, c)['count'] for c in done),
+                    default=0))
+            elif os.path.isfile(histogram_path(folder, i)):
+                # chunks recorded after the histogram file was last saved are run again
+                stats[i] = TrajectoryStats.load(histogram_path(folder, i))
+                done = [c for c in range(len(chunks)) if manifest.done(i, c)
+                    and manifest.done(i, c)['count'] <= stats[i].count[0]]
+            if len(done) == len(chunks):
+                continue
+        if cache is not None:
+            keys[i] = cache_key(init='Histogram', sim=sim_dict, seed=core_dict['Seed'], index=i,
+                chunks=chunks, stopping=rule, raw=raw, bounds=None if raw else (lower, upper))
+            cached = cache.get(keys[i])
+            if cached is not None:
+                if raw:
+                    if manifest is not None:
+                        truncate_results(path, 0)
+                    writer.write(path, cached, _recorder(manifest, path, i, range(len(chunks))))
+                else:
+                    stats[i] = TrajectoryStats.unpack(cached)
+                    for c in range(len(chunks)):
+                        if manifest is not None:
+                            manifest.record(i, c, count=int(stats[i].count[0]))
+                keys[i] = None
+                continue
+        totals[i] = sum(cycles for c, cycles in enumerate(chunks) if c not in done) \
+            * sim_dict['horizon']
+        sim_tasks = [((i, c), HistChunk, (i, sim_dict, cycles, _seed(core_dict, i, c),
+            None if raw else (lower, upper))) for c, cycles in enumerate(chunks) if c not in done]
+        if rule is None:
+            tasks += sim_tasks
+        else:
+            # chunks are accepted in index order, so the chunks already done are a prefix
+            if raw:
+                regret = read_results(folder, i) if done else np.zeros(0)
+                moments = (len(regret), np.sum(regret), np.dot(regret, regret))
+            else:
+                moments = _moments(stats[i])
+            sequences[i] = _Sequence(rule, sim_tasks, chunks, sim_dict['horizon'], len(done),
+                *moments)
+            totals[i] = sequences[i].pulls()
+    _reused(cache, n_sims)
+
+    status = _statusThread(progress, totals)
+    try:
+        if rule is None:
+            finished = pool.imap_unordered(_keyed, tasks)
+        else:
+            finished = _windowed(pool, [seq for seq in sequences if seq],
+                SEQUENTIAL_WINDOW * core_dict['Multiprocess'])
+        for (i, c), (_, result) in finished:
+            if rule is None:
+                accepted = [(c, result)]
+            elif raw:
+                accepted = sequences[i].accept(c, result, len(result), np.sum(result),
+                    np.dot(result, result))
+            else:
+                accepted = sequences[i].accept(c, result, *_moments(result))
+            for k, chunk in accepted:
+                if raw:
+                    path = result_path(folder, i)
+                    writer.write(path, chunk, _recorder(manifest, path, i, [k]))
+                else:
+                    stats[i].merge(chunk)
+                    if manifest is not None:
+                        manifest.record(i, k, count=int(stats[i].count[0]))
+                        _saveStats(stats[i], histogram_path(folder, i))
+            if rule is not None:
+                totals[i] = sequences[i].pulls()
+    finally:
+        writer.close()
+        status.stop()
+    _written(collector, writer, folder, n_sims)
+
+    for i, sim_dict in enumerate(core_dict['sim']):
+        if raw:
+            stats[i] = _rawStats(folder, i, sim_dict['horizon'], lower, upper)
+        _saveStats(stats[i], histogram_path(folder, i))
+        if keys[i] is not None:
+            cache.put(keys[i], read_results(folder, i) if raw else stats[i].pack())
+    if rule is not None:
+        print()
+        _cycles([int(stats[i].count[0]) for i in range(n_sims)],
+            [sim_dict['cycles'] for sim_dict in core_dict['sim']])
+    return None
+
+def _varRun(pool, core_dict, progress, manifest=None, collector=None):
+    """
+    Splits the cycles of every (simulation, sweep point) pair into chunks, and groups consecutive
+    chunks of each simulation into about CHUNKS_PER_PROCESS tasks per process, so that each task
+    compiles its SweepTemplate once and rebinds its Simulation for every chunk. Once every chunk of
+    a sweep point is finished, and every earlier sweep point of the same simulation has been
+    written, its average regret is appended to the data file, and its number of cycles to the
+    cycles file. A _statusThread reports the progress counters of the pool while it runs.
+
+    Sweep points found in the result cache are not run, and the others are added to the cache as
+    soon as they are finished.
+
+    Given a Manifest, every sweep point is recorded in it as soon as it is finished. Sweep points
+    it already records (from an interrupted run) are not run, and the data files are written again
+    from the start.
+
+    With a StoppingRule, the cycles of each sweep point are split by StoppingRule.split, every
+    chunk is a task of its own, and the chunks of each sweep point are run as a _Sequence, so that
+    the sweep point is finished once the rule is met.
+
+    As in _histRun, a ProfileCollector is given the time spent writing each data file.
+    """
+    cache = _cache(core_dict)
+    rule = _rule(core_dict)
+    arg_list = core_dict['arg_list']
+    n_sims = len(core_dict['sim'])
+
+    tasks = []
+    sequences = [[None] * len(arg_list) for i in range(n_sims)]
+    remaining = [[0] * len(arg_list) for i in range(n_sims)]
+    total_regret = [[0] * len(arg_list) for i in range(n_sims)]
+    iterations = [[0] * len(arg_list) for i in range(n_sims)]
+    keys = [[None] * len(arg_list) for i in range(n_sims)]
+    totals = [0] * n_sims
+    for i, sim_dict in enumerate(core_dict['sim']):
+        template = SweepTemplate(sim_dict)
+        chunks = []
+        if manifest is not None:
+            truncate_results(result_path(core_dict['DataFolder'], i), 0)
+            truncate_results(cycles_path(core_dict['DataFolder'], i), 0)
+        for j, num in enumerate(arg_list):
+            cycles = template.value(num, 'cycles')
+            if rule is None:
+                split = _chunks(cycles, template.value(num, 'horizon'))
+            else:
+                split = rule.split(cycles)
+            record = None if manifest is None else manifest.done(i, j)
+            if record is not None:
+                total_regret[i][j], iterations[i][j] = record['regret'], record['count']
+                continue
+            if cache is not None:
+                keys[i][j] = cache_key(init='Variable', sim=sim_dict, seed=core_dict['Seed'],
+                    index=i, point=j, num=num, chunks=split, stopping=rule)
+                cached = cache.get(keys[i][j])
+                if cached is not None:
+                    total_regret[i][j], iterations[i][j] = cached
+                    continue
+            totals[i] += cycles * template.value(num, 'horizon')
+            if rule is not None:
+                sequences[i][j] = _Sequence(rule, [((i, j, c), VarBlock,
+                    (i, sim_dict, [(j, num, chunk, _seed(core_dict, i, j, c))], True))
+                    for c, chunk in enumerate(split)], split, template.value(num, 'horizon'))
+                remaining[i][j] = 1
+                continue
+            for c, chunk in enumerate(split):
+                chunks.append((j, num, chunk, _seed(core_dict, i, j, c)))
+                remaining[i][j] += 1
+        if not chunks:
+            # every sweep point is cached or already recorded
+            continue
+        # consecutive chunks share a task, so that one Simulation is rebound across them
+        start = 0
+        for size in split_cycles(len(chunks), _parts(core_dict, n_sims)):
+            tasks.append((VarBlock, (i, sim_dict, chunks[start:start + size])))
+            start += size
+    _reused(cache, n_sims * len(arg_list))
+
+    written = [0] * n_sims
+    def flush(i):
+        start = written[i]
+        while written[i] < len(arg_list) and remaining[i][written[i]] == 0:
+            written[i] += 1
+        if written[i] > start:
+            writer.write(result_path(core_dict['DataFolder'], i),
+                [total_regret[i][k] / iterations[i][k] for k in range(start, written[i])])
+            writer.write(cycles_path(core_dict['DataFolder'], i), iterations[i][start:written[i]],
+                dtype=np.int64)
+
+    def finish(i, j):
+        if manifest is not None:
+            manifest.record(i, j, regret=float(total_regret[i][j]), count=int(iterations[i][j]))
+        if keys[i][j] is not None:
+            cache.put(keys[i][j], [total_regret[i][j], iterations[i][j]])
+
+    status = _statusThread(progress, totals)
+    writer = ResultWriter()
+    try:
+        for i in range(n_sims):
+            flush(i)
+        if rule is None:
+            for i, results in pool.imap_unordered(_star, tasks):
+                for j, regret, count in results:
+                    total_regret[i][j] += regret
+                    iterations[i][j] += count
+                    remaining[i][j] -= 1
+                    if remaining[i][j] == 0:
+                        finish(i, j)
+                flush(i)
+        else:
+            window = SEQUENTIAL_WINDOW * core_dict['Multiprocess']
+            for (i, j, c), (_, [(_, regret, count, square)]) in _windowed(pool,
+                    [seq for row in sequences for seq in row if seq], window):
+                for _, (chunk_regret, chunk_count) in sequences[i][j].accept(c, (regret, count),
+                        count, regret, square):
+                    total_regret[i][j] += chunk_regret
+                    iterations[i][j] += chunk_count
+                if remaining[i][j] and sequences[i][j].finished():
+                    remaining[i][j] = 0
+                    finish(i, j)
+                totals[i] = sum(seq.pulls() for seq in sequences[i] if seq)
+                flush(i)
+    finally:
+        writer.close()
+        status.stop()
+    _written(collector, writer, core_dict['DataFolder'], n_sims)
+    if rule is not None:
+        print()
+        _cycles([sum(row) for row in iterations],
+            [sum(SweepTemplate(sim_dict).value(num, 'cycles') for num in arg_list)
+                for sim_dict in core_dict['sim']])
+    return None
+
+def _trajRun(pool, core_dict, progress):
+    """
+    Splits the cycles of every simulation into chunks, runs them in the pool, and merges the
+    TrajectoryStats of each chunk into that of its simulation as soon as it is finished. The merged
+    statistics are saved to the data folder once every chunk is done.
+    """
+    n_sims = len(core_dict['sim'])
+    tasks = [(TrajChunk, (i, sim_dict, cycles, core_dict['GridPoints'], _seed(core_dict, i, c)))
+        for i, sim_dict in enumerate(core_dict['sim'])
+        for c, cycles in enumerate(_chunks(sim_dict['cycles'], sim_dict['horizon']))]
+    totals = [sim_dict['cycles'] * sim_dict['horizon'] for sim_dict in core_dict['sim']]
+
+    status = _statusThread(progress, totals)
+    merged = [None] * n_sims
+    try:
+        for i, stats in pool.imap_unordered(_star, tasks):
+            merged[i] = stats if merged[i] is None else merged[i].merge(stats)
+    finally:
+        status.stop()
+    for i, stats in enumerate(merged):
+        stats.save(trajectory_path(core_dict['DataFolder'], i))
+    return None
 
 class _statusThread(th.Thread):
-    def __init__(self, core_dict):
+    """
+    Prints the progress of a run every STATUS_INTERVAL seconds.
+
+    The workers of the pool add the pulls they make to a shared-memory array with one counter per
+    simulation, so each update only reads n_sims integers. Along with the overall progress, the
+    status line shows the throughput of each simulation in pulls/s and an estimate of the time
+    remaining. The thread starts itself, and stops once every pull is counted or when stop() is
+    called, which the caller does once the pool is done (or has failed).
+
+    Positional Arguments:
+        * progress: the shared multiprocessing.Array of the number of pulls done per simulation
+        * totals: the total number of pulls of each simulation
+    Methods:
+        * stop(): prints a final update and stops the thread
+    """
+    def __init__(self, progress, totals):
         super(_statusThread, self).__init__()
-        self.core_dict = core_dict
+        self.progress = progress
+        self.totals = totals
         self.daemon = True
+        self.stopped = th.Event()
+        self.start_time = time.time()
+        self.start()
+
     def run(self):
-        n_files = len(self.core_dict['sim'])
-        current = [0] * n_files
-        finished = 0
-        total = self.core_dict['total_lines']
-        while finished != total:  # TODO fix this to have a termination
-            time.sleep(0.5)
-            for i in range(n_files):
-                try:
-                    with open("{}/data{}.txt".format(self.core_dict['DataFolder'], i), 'r') as file:
-                        current[i] = sum(1 for line in file) - 1
-                except FileNotFoundError:
-                    pass
-            finished = sum(current)
-            sys.stdout.write("\r" + " {:2.0f} % complete ".format(finished*100/total).center(100, "-"))
-            sys.stdout.flush()
+        while not self.stopped.wait(STATUS_INTERVAL):
+            if self._update() >= sum(self.totals):
+                break
+
+    def _update(self):
+        done = self.progress[:]
+        elapsed = max(time.time() - self.start_time, 1e-9)
+        total = sum(self.totals)
+        finished = min(sum(done), total)
+        rate = finished / elapsed
+        if finished == total:
+            eta = "00:00:00"
+        elif rate > 0:
+            eta = time.strftime("%H:%M:%S", time.gmtime((total - finished) / rate))
+        else:
+            eta = "--:--:--"
+        rates = " ".join("[{}] {:.3g}".format(i, count / elapsed) for i, count in enumerate(done))
+        sys.stdout.write("\r" + " {:2.0f} % complete | ETA {} | pulls/s {} ".format(
+            finished * 100 / max(total, 1), eta, rates).center(100, "-"))
+        sys.stdout.flush()
+        return finished
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+        self._update()
+        return None
 
 
 def run(**arg_dict):
     core_dict = _checkInput(**arg_dict)
-    pool = mp.Pool(core_dict['Multiprocess'], _init_worker)
+    input_file = input_path(arg_dict['resume']) if 'resume' in arg_dict else arg_dict['input']
+    progress = mp.Array('q', len(core_dict.get('sim', [])))
+    # the workers of a profiled run send the Profile of every chunk they finish to the collector
+    reports = mp.Queue() if core_dict['Profile'] else None
+    pool = mp.Pool(core_dict['Multiprocess'], _init_worker, (progress, reports))
+    collector = None if reports is None else ProfileCollector(reports, len(core_dict['sim']))
     # ----------------------------------------------------------------------------------------------
     if arg_dict['verbose']:
         print(bcolors.OKBLUE)
@@ -70,40 +716,50 @@ def run(**arg_dict):
 
     try:
         if core_dict['init'] == 'Histogram':
-            os.mkdir(core_dict['DataFolder'])
-            status = _statusThread(core_dict)
-            status.start()
             if not core_dict['InputData']:
-                pool.starmap(HistData, [(i, sim_dict, core_dict['DataFolder'])
-                    for i, sim_dict in enumerate(core_dict['sim'])])
+                manifest = _checkpoint(core_dict, input_file, arg_dict)
+                if core_dict['Animate']:
+                    # the data is generated in the background, and animated as it is written
+                    wait = _background(_histRun, pool, core_dict, progress, manifest, collector)
+                    HistAnimation(core_dict)
+                    wait()
+                else:
+                    _histRun(pool, core_dict, progress, manifest, collector)
                 pool.close()
                 pool.join()
-                if core_dict['Animate']:  # TODO in general fix this thing
-                    while True:
-                        try:
-                            HistAnimation(core_dict)
-                            break
-                        except FileNotFoundError:
-                            time.sleep(0.3)
+                _collect(core_dict, collector)
             else:
                 pass
             HistPlot(core_dict)
 
         elif core_dict['init'] == 'Variable':
-            os.mkdir(core_dict['DataFolder'])
-            status = _statusThread(core_dict)
-            status.start()
             if not core_dict['InputData']:
-                pool.starmap(VarData, [(i, sim_dict, core_dict['DataFolder'], core_dict['arg_list'])
-                    for i, sim_dict in enumerate(core_dict['sim'])])
+                _varRun(pool, core_dict, progress, _checkpoint(core_dict, input_file, arg_dict),
+                    collector)
                 pool.close()
                 pool.join()
+                _collect(core_dict, collector)
             else:
                 pass
             VarPlot(core_dict)
 
+        elif core_dict['init'] == 'Trajectory':
+            if not core_dict['InputData']:
+                os.makedirs(core_dict['DataFolder'], exist_ok=True)
+                _trajRun(pool, core_dict, progress)
+                pool.close()
+                pool.join()
+                _collect(core_dict, collector)
+            else:
+                pass
+            TrajPlot(core_dict)
+
         elif core_dict['init'] == 'Visualize':
-            if core_dict['visual'] == 'ellipse':
+            if core_dict['Render']:
+                RenderAnimation(pool, core_dict)
+                pool.close()
+                pool.join()
+            elif core_dict['visual'] == 'ellipse':
                 EllipseAnimation(core_dict)
             elif core_dict['visual'] == 'confidence':
                 ConfAnimation(core_dict)
@@ -119,7 +775,19 @@ def run(**arg_dict):
         if core_dict['delete'] or core_dict['DeleteData']:
             path = core_dict['DataFolder']
             for i in range(len(core_dict['sim'])):
-                os.remove(path + "/data{}.txt".format(i))
+                if core_dict['init'] == 'Trajectory':
+                    os.remove(trajectory_path(path, i))
+                elif core_dict['init'] == 'Variable':
+                    os.remove(result_path(path, i))
+                    os.remove(cycles_path(path, i))
+                else:
+                    os.remove(histogram_path(path, i))
+                    if os.path.isfile(result_path(path, i)):
+                        os.remove(result_path(path, i))
+            for checkpoint in ([manifest_path(path), input_path(path)]
+                    + [profile_path(path, i) for i in range(len(core_dict['sim']))]):
+                if os.path.isfile(checkpoint):
+                    os.remove(checkpoint)
             os.rmdir(path)
 
 
@@ -128,6 +796,9 @@ def run(**arg_dict):
         pool.join()
         print("\r" + " "*150)
         print("\n\n" + bcolors.FAIL + " Keyboard Interrupt! ".center(100,"-") + bcolors.ENDC + "\n")
+        if (core_dict['init'] in ('Histogram', 'Variable') and not core_dict['InputData']
+                and os.path.isfile(manifest_path(core_dict['DataFolder']))):
+            print(" Resume with: banditvis --resume '{}' ".format(core_dict['DataFolder']).center(100, "-") + "\n")
         sys.exit(1)
 
 
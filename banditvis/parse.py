@@ -1,15 +1,20 @@
 import sys
+import hashlib
 import multiprocessing as mp
 import re
+import shutil
 
 import numpy as np
+import matplotlib as mpl
 import yaml
 from datetime import datetime
 from pprint import pprint
 
+from .arms import ArmSet, arm_family
 from .helper import msplit
 from .formatting import bcolors
 from .defaults import CORE_DEFAULTS
+from .trajectory import MAX_GRID_POINTS
 
 def Parse(user_file, **arg_dict):
     """
@@ -53,7 +58,7 @@ def Parse(user_file, **arg_dict):
     if errors:
         sys.exit(bcolors.FAIL
             + "\n" + " ERROR LIST ".center(100, "-") + "\n" + bcolors.ENDC
-            + self.errors + "\n\n")
+            + errors + "\n\n")
     else:
         print(bcolors.OKGREEN + "\n" + "No Errors!".center(100, "-") + "\n" + bcolors.ENDC)
 
@@ -94,11 +99,16 @@ def DictCheck(core_dict):
         check.Conflict('horizon')
         check.Conflict('cycles')
         check.SimExist('label')
+        check.ArmFile()
 
         check.Args()
+        check.Losses()
+        check.Precision()
         check.Linecount()
         check.Folder()
         check.Title()
+        check.Seed()
+        check.Profile()
 
 
     elif core_dict['init'] == 'Histogram':
@@ -107,15 +117,40 @@ def DictCheck(core_dict):
         check.Conflict('horizon')
         check.Conflict('cycles')
         check.SimExist('label')
+        check.ArmFile()
 
         check.Bins()
+        check.Losses()
+        check.Precision()
         check.Linecount()
         check.Folder()
         check.Title()
+        check.Seed()
+        check.Profile()
+
+
+    elif core_dict['init'] == 'Trajectory':
+        check.Save()
+
+        check.Conflict('horizon')
+        check.Conflict('cycles')
+        check.SimExist('label')
+        check.ArmFile()
+
+        check.Grid()
+        check.Losses()
+        check.Linecount()
+        check.Folder()
+        check.Title()
+        check.Seed()
+        check.Profile()
 
 
     elif core_dict['init'] == 'Visualize':
-        pass
+        check.ArmFile()
+        check.Render()
+        check.Playback()
+        check.Seed()
 
 
     else:
@@ -136,7 +171,8 @@ class CoreDict(dict):
 
         # precedence: arg_dict, then core_defaults
         self.default = {**core_defaults, **arg_dict}
-        self.ignore = {'InputData', 'DataFolder', 'Animate'}
+        self.ignore = {'InputData', 'DataFolder', 'Animate', 'Cache', 'CacheFolder', 'CacheSize',
+            'Precision', 'RelativePrecision', 'Confidence', 'RawData', 'Profile'}
         self.warning_list = []
 
     def __missing__(self, key):
@@ -180,11 +216,19 @@ class Check:
         * Exist(name): checks if name exists in the dict
         * SimExist(name): checks if name exists in every simulation sub dictionary
         * Save(): checks for the save title, as well as the save output folder
+        * ArmFile(): checks the .npy files of arm parameters declared instead of an ArmList
+        * Render(): checks whether a Visualize animation is rendered to a file, and its format
+        * Playback(): checks the number of timesteps between two frames of an animation
         * Bins(): figure out appropriate bin allocation for histogram plots
+        * Losses(): checks the loss sequences of General (adversarial) arms
         * Args(): check the args for consistency / proper declaration
         * Folder(): creates a data_folder name and prepends the path to it
+        * Grid(): checks the number of grid points of a Trajectory plot
+        * Precision(): checks the precision at which runs stop sequentially
         * Linecount(): determines how many lines will be printed to data files
         * Title(): creates a title if none exists and formats an existing one
+        * Seed(): resolves the seed of the run
+        * Profile(): checks whether the phases of every simulation are timed
     """
 
     def __init__(self, core_dict):
@@ -292,23 +336,115 @@ class Check:
         return None
 
 
+    def ArmFile(self):
+        """
+        A Bandit can declare ArmFile: [family, path] instead of an ArmList,
+        where family is Bernoulli or Normal and path is a .npy file of the
+        parameters of every arm (see banditvis.arms.ArmSet). The file is
+        loaded once to check it, and its digest is added to the Bandit as
+        ArmDigest, so results cached for an older version of the file are not
+        reused.
+        """
+        for sim_dict in self.core_dict['sim']:
+            bandit = sim_dict.get('Bandit', {})
+            if 'ArmFile' not in bandit:
+                continue
+            if 'ArmList' in bandit:
+                self.errors += ["- ArmFile: declare either an ArmList or an ArmFile, not both."]
+                continue
+            entry = bandit['ArmFile']
+            if (not isinstance(entry, list) or len(entry) != 2
+                    or entry[0] not in ('Bernoulli', 'Normal')):
+                self.errors += ["- ArmFile: declare [Bernoulli, <path>] or [Normal, <path>]."]
+                continue
+            try:
+                ArmSet.load(*entry)
+                with open(entry[1], 'rb') as file:
+                    bandit['ArmDigest'] = hashlib.sha256(file.read()).hexdigest()
+            except (OSError, ValueError) as e:
+                self.errors += ["- ArmFile: {}".format(e)]
+        return None
+
+
+    def Render(self):
+        """
+        A Visualize animation which declares PlotSave is rendered to it instead of being shown:
+        as a '.mp4' (which needs ffmpeg) or '.gif' video, or as a folder of PNG frames for any
+        other name.
+        """
+        self.core_dict['Render'] = 'PlotSave' in self.core_dict
+        if not self.core_dict['Render']:
+            return None
+        if self.core_dict['PlotSave'].endswith((".pdf", ".png")):
+            self.errors += ["- PlotSave: An animation can only be saved as a '.mp4' or '.gif' "
+                "video, or as a folder of PNG frames (any name without these endings)."]
+        elif (self.core_dict['PlotSave'].endswith(".mp4")
+            and shutil.which(mpl.rcParams['animation.ffmpeg_path']) is None):
+            self.errors += ["- PlotSave: Saving a '.mp4' needs ffmpeg, which was not found. Install "
+                "it, or save a '.gif' instead."]
+        if self.core_dict.default['out']:
+            self.core_dict['PlotSave'] = self.core_dict.default['out'] + "/" + self.core_dict['PlotSave']
+        return None
+
+
+    def Playback(self):
+        """
+        Checks StepsPerFrame, the number of timesteps a Visualize animation advances per frame.
+        """
+        steps = self.core_dict['StepsPerFrame']
+        if not isinstance(steps, int) or isinstance(steps, bool) or steps < 1:
+            self.errors += ["- StepsPerFrame: declare a positive integer."]
+        return None
+
+
     def Bins(self):
         """
         Determines how many bins the histogram should have based on the proper-
-        ties of the bandit.
+        ties of the bandit. The regret of a stochastic bandit lies in [0, the
+        largest gap times the horizon] (stored in bins). Losses are in [0, 1],
+        so the regret of an adversarial bandit, which can be negative, lies in
+        [-horizon, horizon] (stored in lower_bins and bins).
         """
         self.core_dict['bins'] = []
+        self.core_dict['lower_bins'] = []
         for sim_dict in self.core_dict['sim']:
-            if sim_dict['Bandit']['ArmList'][0][0] == 'Linear':
+            if 'ArmFile' in sim_dict['Bandit']:
+                if 'ArmDigest' not in sim_dict['Bandit']:
+                    continue  # reported by ArmFile
+                mean_list = ArmSet.load(*sim_dict['Bandit']['ArmFile']).mean
+            elif sim_dict['Bandit']['ArmList'][0][0] == 'Linear':
                 mean_list = [np.inner(arm[1], sim_dict['Bandit']['MeanVector'])
                     for arm in sim_dict['Bandit']['ArmList']]
+            elif sim_dict['Bandit']['ArmList'][0][0] == 'General':
+                self.core_dict['lower_bins'].append(-sim_dict['horizon'])
+                self.core_dict['bins'].append(sim_dict['horizon'])
+                continue
             else:
                 mean_list = [arm[1] for arm in sim_dict['Bandit']['ArmList']]
+            self.core_dict['lower_bins'].append(0)
             self.core_dict['bins'].append(np.amax(
                 mean_list - np.amin(mean_list)) * sim_dict['horizon'])
         return None
 
 
+    def Losses(self):
+        """
+        General arms take a sequence of losses, one per timestep, so every arm
+        of an adversarial bandit needs a sequence at least as long as the
+        horizon.
+        """
+        for sim_dict in self.core_dict['sim']:
+            if arm_family(sim_dict['Bandit']) != 'General':
+                continue
+            arm_list = sim_dict['Bandit']['ArmList']
+            lengths = [len(arm[1]) for arm in arm_list if isinstance(arm[1], list)]
+            if len(set(lengths)) > 1:
+                self.errors += ["- General arms: every loss sequence must have the same length."]
+            elif lengths and isinstance(sim_dict.get('horizon'), int) and lengths[0] < sim_dict['horizon']:
+                self.errors += ["- General arms: the loss sequences are shorter than the horizon."]
+        return None
+
+
     def Args(self):
         """
         When using the Variable class, args can be declared in multiple ways.
@@ -340,17 +476,59 @@ class Check:
 
     def Folder(self):
         """
-        Additional changes to be done after checking
+        Additional changes to be done after checking. A DataFolder given as an
+        argument (the folder of a resumed run) is used as it is.
         """
-        self.core_dict.default.setdefault('DataFolder', "{}".format(
-            datetime.strftime(datetime.now(), '%Y-%m-%d %H_%M_%S')))
-        if self.core_dict.default['data']:
+        if 'DataFolder' in self.core_dict.default:
+            return None
+        self.core_dict.default['DataFolder'] = "{}".format(
+            datetime.strftime(datetime.now(), '%Y-%m-%d %H_%M_%S'))
+        if self.core_dict.default.get('data'):
             self.core_dict.default['DataFolder'] = self.core_dict.default['data'] + "/" + self.core_dict.default['DataFolder']
         return None
 
 
+    def Grid(self):
+        """
+        Checks GridPoints, the number of log-spaced time steps at which a
+        Trajectory plot records regret; 'all' records every time step. Each
+        grid point keeps a histogram, so at most MAX_GRID_POINTS are recorded.
+        """
+        points = self.core_dict['GridPoints']
+        if points == 'all':
+            points = self.core_dict['GridPoints'] = None
+        elif not isinstance(points, int) or isinstance(points, bool) or points < 2:
+            self.errors += ["- GridPoints: declare either an integer of at least 2 or 'all'."]
+            return None
+        for sim_dict in self.core_dict['sim']:
+            horizon = sim_dict.get('horizon')
+            if isinstance(horizon, int) and min(points or horizon, horizon) > MAX_GRID_POINTS:
+                self.errors += ["- GridPoints: at most {} time steps can be recorded; declare "
+                    "fewer GridPoints (or a shorter horizon with 'all').".format(MAX_GRID_POINTS)]
+                break
+        return None
+
+
+    def Precision(self):
+        """
+        Checks Precision and RelativePrecision, the half-width (absolute, or
+        as a fraction of the mean regret) of the confidence interval at which
+        each simulation or sweep point stops running cycles, and Confidence,
+        the level of that interval. Either precision may be False.
+        """
+        for name in ('Precision', 'RelativePrecision'):
+            value = self.core_dict[name]
+            if value is not False and (not isinstance(value, (int, float))
+                    or isinstance(value, bool) or value <= 0):
+                self.errors += ["- {}: declare a positive number, or False.".format(name)]
+        confidence = self.core_dict['Confidence']
+        if not isinstance(confidence, float) or not 0 < confidence < 1:
+            self.errors += ["- Confidence: declare a number between 0 and 1."]
+        return None
+
+
     def Linecount(self):
-        if self.core_dict['init'] == 'Histogram':
+        if self.core_dict['init'] in ('Histogram', 'Trajectory'):
             self.core_dict['total_lines'] = sum(sim_dict['cycles'] for sim_dict in self.core_dict['sim'])
         elif self.core_dict['init'] == 'Variable':
             self.core_dict['total_lines'] = len(self.core_dict['arg_list']) * len(self.core_dict['sim'])
@@ -364,3 +542,32 @@ class Check:
             self.core_dict['PlotTitle'] += "\n"
 
         return None
+
+
+    def Seed(self):
+        """
+        Resolves the seed of the run. A seed given on the command line takes
+        precedence over a Seed declaration in the file; without either, fresh
+        entropy is drawn. The resolved value is stored in Seed so that the run
+        can be reproduced, and Seeded records whether a seed was given.
+        """
+        seed = self.core_dict.default.get('seed', self.core_dict.get('Seed'))
+        self.core_dict['Seeded'] = seed is not None
+        try:
+            self.core_dict['Seed'] = np.random.SeedSequence(seed).entropy
+        except (TypeError, ValueError):
+            self.errors += ["- Seed: the seed must be a non-negative integer."]
+        return None
+
+
+    def Profile(self):
+        """
+        Checks Profile, whether the time spent in each phase of every
+        simulation and its giveArm latencies are recorded; --profile turns it
+        on from the command line.
+        """
+        profile = self.core_dict['Profile'] or self.core_dict.default.get('profile', False)
+        if not isinstance(profile, bool):
+            self.errors += ["- Profile: declare either True or False."]
+        self.core_dict['Profile'] = profile is True
+        return None
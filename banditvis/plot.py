@@ -3,10 +3,12 @@ import os
 import matplotlib.pyplot as plt
 import numpy as np
 
-from .data import VarData
 from .simulation import ReMapSim
 from .formatting import cmap_colors, mpl_defaults
 from .helper import safe_save
+from .store import read_results
+from .trajectory import (TrajectoryStats, HISTOGRAM_BINS, trajectory_path, histogram_path,
+    histogram_range)
 
 
 def VarPlot(core_dict):
@@ -28,9 +30,7 @@ def VarPlot(core_dict):
 
     # add plots
     for i, sim_dict in enumerate(core_dict['sim']):
-        y_list = np.loadtxt(
-            "{}/data{}.txt".format(core_dict['DataFolder'], i),
-            float)
+        y_list = read_results(core_dict['DataFolder'], i)
         x_list = core_dict['arg_list']
 
         cmap = cmap_colors.sequential1[i]
@@ -59,12 +59,14 @@ def HistPlot(core_dict):
 
     The data is loaded from the data folder, whose location is specified in the
     input dictionary. The loop iterates over files in that folder, and for each
-    one adds a plot to the figure.
+    one adds a plot to the figure. Each histogram is drawn from the bin counts
+    and mean of its histogram file; data folders which only hold raw data
+    files (from older versions) are binned here instead. Regrets outside the
+    bin range are counted in the end bins.
 
     Uses plt.savefig to save the plot when finished.
 
     TODO:
-    * move HistData out of this function
     * add support for custom user (x,y) labels, if so desired
     """
 
@@ -72,21 +74,27 @@ def HistPlot(core_dict):
     fig, ax = mpl_defaults.plot()
 
     # variables
-    bins = np.linspace(0, np.amax(core_dict['bins']), num = 90)
+    lower, upper = histogram_range(core_dict)
 
     # add plots
     for i, sim_dict in enumerate(core_dict['sim']):
-        data = np.loadtxt(
-            "{}/data{}.txt".format(core_dict['DataFolder'], i),
-            float)
+        path = histogram_path(core_dict['DataFolder'], i)
+        if os.path.isfile(path):
+            stats = TrajectoryStats.load(path)
+        else:
+            stats = TrajectoryStats([sim_dict['horizon']], lower, upper, HISTOGRAM_BINS)
+            stats.add(read_results(core_dict['DataFolder'], i), 0)
+        bins = np.linspace(stats.lower[0], stats.upper[0], stats.hist.shape[1] + 1)
+        counts = stats.hist[0]
 
         cmap = cmap_colors.sequential1[i]
 
-        avgline = np.average(data)
+        avgline = stats.mean[0]
         plt.axvline(x = avgline, color = cmap(0.5),ls="--" ,linewidth = 1.7)
 
-        plt.hist(data, bins,
-            normed=1,
+        # the bins are weighted by their density, so that each histogram has an area of 1
+        plt.hist(bins[:-1], bins,
+            weights=counts / (max(counts.sum(), 1) * np.diff(bins)),
             alpha=0.6,
             facecolor = cmap(0.8),
             label = sim_dict['label'])
@@ -102,3 +110,56 @@ def HistPlot(core_dict):
     plt.savefig(safe_save(core_dict['PlotSave']))
 
     return None
+
+
+def TrajPlot(core_dict):
+    """
+    Makes a Trajectory plot out of existing data.
+
+    The TrajectoryStats of each simulation are loaded from the data folder, and
+    the median cumulative regret is plotted against time along with bands
+    between the 25th and 75th, and the 5th and 95th percentiles. The mean is
+    drawn as a dashed line. Log-spaced grids are drawn on a log time axis.
+
+    Uses plt.savefig to save the plot when finished.
+    """
+
+    # defaults
+    fig, ax = mpl_defaults.plot()
+
+    # add plots
+    for i, sim_dict in enumerate(core_dict['sim']):
+        stats = TrajectoryStats.load(trajectory_path(core_dict['DataFolder'], i))
+
+        cmap = cmap_colors.sequential1[i]
+
+        plt.fill_between(stats.grid, stats.quantile(0.05), stats.quantile(0.95),
+            alpha = 0.2,
+            linewidth = 0,
+            color = cmap(0.8))
+        plt.fill_between(stats.grid, stats.quantile(0.25), stats.quantile(0.75),
+            alpha = 0.35,
+            linewidth = 0,
+            color = cmap(0.8))
+        plt.plot(stats.grid, stats.mean, "--",
+            linewidth = 1,
+            color = cmap(0.5))
+        plt.plot(stats.grid, stats.quantile(0.5),
+            linewidth = 1.7,
+            color = cmap(0.8),
+            label = sim_dict['label'])
+
+        if len(stats.grid) < stats.grid[-1]:
+            plt.xscale('log')
+
+    # labels / text
+    legend = plt.legend(loc='best', framealpha = 1.0)
+    legend.get_frame().set_linewidth(1)
+    plt.xlabel('Time')
+    plt.ylabel('Cumulative Regret')
+    plt.title(core_dict['PlotTitle'], style='italic')
+
+    # save plot
+    plt.savefig(safe_save(core_dict['PlotSave']))
+
+    return None
@@ -0,0 +1,184 @@
+"""
+Per-phase timing of simulations, turned on with `Profile: True` or --profile.
+
+A Profile accumulates the time a Simulation spends in each of its PHASES, and the latency of every
+giveArm call in a log-bucketed histogram, from which the p50, p99 and p999 latencies are read.
+Instrumenting a Simulation (see Simulation.instrument) replaces the methods it times with timed
+wrappers on the instances themselves, so a Simulation which is not instrumented runs exactly the
+code it always did.
+
+Each worker of the pool sends the Profile of every chunk it runs to a ProfileCollector in the
+parent, which merges them per simulation; the reports are then written next to the data files.
+
+Methods:
+    * profile_path(folder, i): the path of the report of the i^th simulation in a data folder
+    * Profile(): the timings of one or more runs
+    * ProfileCollector(queue, n_sims): merges the Profiles sent by the workers
+"""
+
+import json
+import threading as th
+import time
+
+import numpy as np
+
+# the timed phases, and the methods they time
+PHASES = ('giveArm', 'pullArm', 'giveRegret', 'write')
+# the number of latency buckets per doubling, and the number of doublings (of nanoseconds) covered
+BUCKETS_PER_OCTAVE = 4
+OCTAVES = 40
+# the number of latencies kept before they are binned
+LATENCY_BUFFER = 4096
+# the latency quantiles given in reports
+QUANTILES = (('p50', 0.5), ('p99', 0.99), ('p999', 0.999))
+
+
+def profile_path(folder, i):
+    return "{}/profile{}.json".format(folder, i)
+
+
+class Profile:
+    """
+    The time spent in each phase of one or more runs, and a histogram of their giveArm latencies.
+
+    Latencies are binned BUCKETS_PER_OCTAVE buckets per doubling, so a quantile is known to within
+    a factor of 2**(1 / BUCKETS_PER_OCTAVE). On a batched bandit, one giveArm call decides for every
+    cycle of the batch.
+
+    Attributes:
+        * ns: a dict of {phase: nanoseconds spent in it}
+        * calls: a dict of {phase: number of calls}
+        * latency: the number of giveArm calls in each latency bucket
+    Methods:
+        * wrap(obj, name, phase, latency=False): replaces the method name of obj with a wrapper
+            timing it as phase, which also records its latency if latency
+        * add(phase, seconds, calls=0): adds time spent outside a wrapped method to phase
+        * merge(other): adds the timings of another Profile
+        * quantile(q): the q^th quantile of the giveArm latency in seconds (None without calls)
+        * report(): a dict of the timings, as written to report files
+        * save(path): writes the report as JSON
+    """
+    def __init__(self):
+        self.ns = dict.fromkeys(PHASES, 0)
+        self.calls = dict.fromkeys(PHASES, 0)
+        self.latency = np.zeros(BUCKETS_PER_OCTAVE * OCTAVES, dtype=np.int64)
+        self.buffer = []
+
+    def __getstate__(self):
+        self._flush()
+        return self.__dict__
+
+    def _flush(self):
+        if self.buffer:
+            ns = np.maximum(self.buffer, 1)
+            buckets = np.minimum(np.floor(BUCKETS_PER_OCTAVE * np.log2(ns)).astype(int),
+                len(self.latency) - 1)
+            self.latency += np.bincount(buckets, minlength=len(self.latency))
+            self.buffer = []
+        return None
+
+    def wrap(self, obj, name, phase, latency=False):
+        method = getattr(obj, name)
+        clock = time.perf_counter_ns
+        ns, calls = self.ns, self.calls
+        if latency:
+            def timed(*args, **kwargs):
+                start = clock()
+                result = method(*args, **kwargs)
+                elapsed = clock() - start
+                ns[phase] += elapsed
+                calls[phase] += 1
+                self.buffer.append(elapsed)
+                if len(self.buffer) >= LATENCY_BUFFER:
+                    self._flush()
+                return result
+        else:
+            def timed(*args, **kwargs):
+                start = clock()
+                result = method(*args, **kwargs)
+                ns[phase] += clock() - start
+                calls[phase] += 1
+                return result
+        setattr(obj, name, timed)
+        return None
+
+    def add(self, phase, seconds, calls=0):
+        self.ns[phase] += int(seconds * 1e9)
+        self.calls[phase] += calls
+        return None
+
+    def merge(self, other):
+        self._flush()
+        other._flush()
+        for phase in PHASES:
+            self.ns[phase] += other.ns[phase]
+            self.calls[phase] += other.calls[phase]
+        self.latency += other.latency
+        return self
+
+    def quantile(self, q):
+        self._flush()
+        total = self.latency.sum()
+        if not total:
+            return None
+        k = np.searchsorted(np.cumsum(self.latency), q * total)
+        # the upper edge of the bucket holding the quantile
+        return 2**((k + 1) / BUCKETS_PER_OCTAVE) / 1e9
+
+    def report(self):
+        self._flush()
+        total = sum(self.ns.values())
+        return {
+            'phases': {phase: {'seconds': self.ns[phase] / 1e9, 'calls': self.calls[phase],
+                'share': self.ns[phase] / total if total else 0} for phase in PHASES},
+            'latency': {**{name: self.quantile(q) for name, q in QUANTILES},
+                'buckets_per_octave': BUCKETS_PER_OCTAVE,
+                'counts': {int(k): int(count) for k, count in enumerate(self.latency) if count}}}
+
+    def save(self, path):
+        with open(path, 'w') as file:
+            json.dump(self.report(), file, indent=1)
+        return None
+
+
+class ProfileCollector(th.Thread):
+    """
+    A background thread which merges the Profiles sent by the workers of the pool.
+
+    Workers put (i, profile) on the queue once a chunk of the i^th simulation is finished. The
+    queue is read while the pool runs, so that workers never wait on a full queue to exit.
+
+    Positional Arguments:
+        * queue: the multiprocessing.Queue the workers send to
+        * n_sims: the number of simulations
+    Attributes:
+        * profiles: the merged Profile of each simulation
+    Methods:
+        * add(i, profile): merges a Profile into that of the i^th simulation
+        * close(): merges every Profile still queued and stops the thread; call it once the pool
+            is joined
+    """
+    def __init__(self, queue, n_sims):
+        super(ProfileCollector, self).__init__()
+        self.daemon = True
+        self.queue = queue
+        self.profiles = [Profile() for i in range(n_sims)]
+        self.lock = th.Lock()
+        self.start()
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            self.add(*item)
+
+    def add(self, i, profile):
+        with self.lock:
+            self.profiles[i].merge(profile)
+        return None
+
+    def close(self):
+        self.queue.put(None)
+        self.join()
+        return None
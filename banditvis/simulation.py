@@ -3,10 +3,16 @@ import time
 from .algorithms import *
 from .arms import *
 from .core import *
+from .trajectory import TrajectoryStats, HISTOGRAM_BINS
 
 import numpy as np
 from pprint import pprint
 
+# the largest number of cycles that runBatch advances at once
+BATCH_SIZE = 10000
+# the number of unbatched trajectories buffered before they are added to a TrajectoryStats
+TRAJECTORY_BUFFER = 256
+
 
 class Simulation:
 
@@ -20,6 +26,7 @@ class Simulation:
     Methods:
         ()
         reset()
+        instrument(profile)
 
     TODO:
     * what else to track? total reward, calculate regret, ...
@@ -36,7 +43,16 @@ class Simulation:
         self.alg.bandit = bandit_inst
         self.total_regret = 0
         self.iterations = 0
-        self.arm_info = [each_arm.info() for each_arm in self.bandit.arms]
+        self.profile = None
+
+
+    @property
+    def arm_info(self):
+        """
+        The info of every arm, read from the bandit when it is needed, since
+        bandits can hold millions of arms.
+        """
+        return [each_arm.info() for each_arm in self.bandit.arms]
 
 
     def reset(self):
@@ -48,6 +64,28 @@ class Simulation:
         self.bandit.reset()
 
 
+    def instrument(self, profile):
+        """
+        Times every cycle run from now on in a Profile (see banditvis.profiling).
+
+        The giveArm method of the algorithm, the pullArm and giveRegret
+        methods of the bandit (and of the batched bandits built by runBatch)
+        are replaced with timed wrappers; without a profile, nothing is
+        wrapped, so the cycles cost nothing more. The time spent writing data
+        files is added by the manager.
+        """
+        self.profile = profile
+        profile.wrap(self.alg, 'giveArm', 'giveArm', latency=True)
+        self._instrumentBandit(self.bandit)
+        return None
+
+
+    def _instrumentBandit(self, bandit):
+        self.profile.wrap(bandit, 'pullArm', 'pullArm')
+        self.profile.wrap(bandit, 'giveRegret', 'giveRegret')
+        return None
+
+
     def _print_info(self):
         """
         Prints out information about the Simulation.
@@ -98,14 +136,14 @@ class Simulation:
         self.bandit.horizon = np.full(self.bandit.n_arms, horizon, dtype = int)
         self.horizon = horizon
 
-        start_time = time.clock()
+        start_time = time.perf_counter()
         for m in range(self.bandit.n_arms):
             self.bandit.pullArm(m)
             self.bandit.fullInfo()
         for m in range(horizon - self.bandit.n_arms):
             self.bandit.pullArm(self.alg.giveArm())
             self.bandit.fullInfo()
-        stop_time = time.clock()
+        stop_time = time.perf_counter()
 
         self.total_regret += self.bandit.giveRegret()
         self.iterations += 1
@@ -115,98 +153,229 @@ class Simulation:
         return None
 
 
-    def runStandard(self, horizon, cycles):
+    def _batchable(self):
         """
-        A standard experiment-running method.
+        Whether the Simulation can run its cycles on a BatchStoBandit or a
+        BatchAdvBandit.
+        """
+        if isinstance(self.bandit, AdvBandit):
+            return self.alg.var_dict['algtype'] in ObjectDict.AdvBatchAlgs
+        return (isinstance(self.bandit, StoBandit)
+            and self.alg.var_dict['algtype'] in ObjectDict.BatchAlgs)
 
-        Runs the bandit for a certain number of cycles each to a certain
-        horizon, and prints out the result on screen.
 
-        It uses _print_info to print information about the bandit itself upon
-        termination.
+    def _batches(self, cycles):
+        """
+        Splits cycles into the batch sizes used by runBatch.
+        """
+        return [min(BATCH_SIZE, cycles - start) for start in range(0, cycles, BATCH_SIZE)]
+
+
+    def runBatch(self, horizon, cycles, stats=None):
+        """
+        Runs a number of cycles at the same time, and returns an array of the
+        regret of every cycle.
+
+        The cycles are run as the replicates of a single BatchStoBandit (or
+        BatchAdvBandit), so every step advances all of them at once. The algorithm is temporarily
+        pointed at the batched bandit, and pointed back once finished. If a
+        TrajectoryStats is given, the regret of every cycle is added to it at
+        each of its grid points.
         """
         self.bandit.horizon = np.full(self.bandit.n_arms, horizon, dtype = int)
         self.horizon = horizon
 
-        print("-"*50 + "\n")
-        start_time = time.clock()
+        record = {} if stats is None else {t: k for k, t in enumerate(stats.grid)}
+        if isinstance(self.bandit, AdvBandit):
+            batch = BatchAdvBandit(self.bandit.arms, cycles, self.bandit.rng)
+        else:
+            batch = BatchStoBandit(self.bandit.arms, cycles, self.bandit.rng)
+        batch.horizon = self.bandit.horizon
+        if self.profile is not None:
+            self._instrumentBandit(batch)
+        self.alg.bandit = batch
+        try:
+            for t in range(1, horizon + 1):
+                batch.pullArm(t - 1 if t <= batch.n_arms else self.alg.giveArm())
+                if t in record:
+                    stats.add(batch.giveRegret(), record[t])
+        finally:
+            self.alg.bandit = self.bandit
+
+        regret = batch.giveRegret()
+        self.total_regret += np.sum(regret)
+        self.iterations += cycles
+        return regret
+
+
+    def _runCycles(self, horizon, cycles):
+        """
+        Runs the bandit for a certain number of cycles, yielding an array of
+        the regret of each cycle as soon as it is finished.
+
+        Batchable simulations yield the regrets of a whole batch at once;
+        otherwise the cycles are run one at a time.
+        """
+        if self._batchable():
+            for size in self._batches(cycles):
+                yield self.runBatch(horizon, size)
+            return
 
         for i in range(cycles):
-            for i in range(self.bandit.n_arms):
-                self.bandit.pullArm(i)
+            for j in range(self.bandit.n_arms):
+                self.bandit.pullArm(j)
 
             for l in range(horizon - self.bandit.n_arms):
                 self.bandit.pullArm(self.alg.giveArm())
 
-            self.total_regret += self.bandit.giveRegret()
+            regret = self.bandit.giveRegret()
+            self.total_regret += regret
             self.iterations += 1
             self.bandit.reset()
 
-            stdout.write(
-                "\r----------  "
-                "{0:d} out of {1} cycles"
-                "----------".format(self.iterations, cycles))
-            stdout.flush()
-
-        stop_time = time.clock()
-        self.runtime = stop_time - start_time
-        self._print_info()
-        return None
+            yield np.array([regret])
 
 
-    def runHist(self, horizon, cycles, out_file):
+    def runRegret(self, horizon, cycles, progress=None):
         """
-        Produces Histogram - like data.
+        Runs the bandit for a certain number of cycles, and returns an array
+        of the regret of each cycle.
 
-        Every cycle, prints the bandit regret it out in the file, followed by a
-        newline. These data files are used by many other methods containing
-        hist in their name.
+        Nothing is written; this is used to run chunks of cycles in worker
+        processes, whose results are merged and written by the manager. If progress is
+        given, it is called with the number of cycles finished every time a
+        cycle (or a batch of cycles) finishes.
         """
         self.bandit.horizon = np.full(self.bandit.n_arms, horizon, dtype = int)
         self.horizon = horizon
 
-        for i in range(cycles):
-            for j in range(self.bandit.n_arms):
-                self.bandit.pullArm(j)
-
-            for l in range(horizon - self.bandit.n_arms):
-                self.bandit.pullArm(self.alg.giveArm())
+        regret = [np.zeros(0)]
+        for chunk in self._runCycles(horizon, cycles):
+            regret.append(chunk)
+            if progress is not None:
+                progress(len(chunk))
+        return np.concatenate(regret)
 
-            self.total_regret += self.bandit.giveRegret()
-            self.iterations += 1
 
-            with open(out_file, "a") as outfile:
-                outfile.write("{0}\n".format(self.bandit.giveRegret()))
-            self.bandit.reset()
-        return None
+    def _regretRange(self):
+        """
+        The smallest and largest regret a single pull can add, used to size
+        the histograms of a TrajectoryStats. Adversarial bandits are assumed
+        to have losses in [0, 1].
+        """
+        if isinstance(self.bandit, LinBandit):
+            means = np.dot(self.bandit.arm_vecs, self.bandit.mean)
+        elif isinstance(self.bandit, StoBandit):
+            means = self.bandit.mean_list
+        else:
+            return (-1, 1)
+        return (0, np.amax(means) - np.amin(means))
 
 
-    def runVar(self, horizon, cycles, out_file):
+    def runHistogram(self, horizon, cycles, lower, upper, progress=None):
+        """
+        Produces pre-binned Histogram data.
+
+        Runs the bandit for a certain number of cycles and returns a
+        TrajectoryStats of the regret at the horizon, with HISTOGRAM_BINS bins
+        spanning [lower, upper]. The regret of each batch (or of TRAJECTORY_BUFFER
+        unbatched cycles) is added as soon as it is finished, so no array of
+        the regret of every cycle is kept. As in runRegret, progress is called
+        with the number of cycles finished.
         """
-        Produces Variable - like data.
+        self.bandit.horizon = np.full(self.bandit.n_arms, horizon, dtype = int)
+        self.horizon = horizon
 
-        Runs the simulation for a certain number of cycles, then appends that
-        data to the text file
+        stats = TrajectoryStats([horizon], lower, upper, HISTOGRAM_BINS)
+        buffer = []
+        for chunk in self._runCycles(horizon, cycles):
+            buffer.append(chunk)
+            if sum(len(regret) for regret in buffer) >= TRAJECTORY_BUFFER:
+                stats.add(np.concatenate(buffer), 0)
+                buffer = []
+            if progress is not None:
+                progress(len(chunk))
+        if buffer:
+            stats.add(np.concatenate(buffer), 0)
+        return stats
+
+
+    def runTrajectory(self, horizon, cycles, grid, progress=None):
+        """
+        Produces Trajectory - like data.
+
+        Runs the bandit for a certain number of cycles and returns a
+        TrajectoryStats of the cumulative regret at every time step in grid,
+        binned on a log scale of the largest regret of a single step, so that
+        the quantiles resolve regret far below its worst case.
+        Batchable simulations add each grid point of a whole batch at once;
+        otherwise trajectories are buffered TRAJECTORY_BUFFER cycles at a
+        time, so no (cycles x grid) matrix is ever kept. As in runRegret,
+        progress is called with the number of cycles finished.
         """
         self.bandit.horizon = np.full(self.bandit.n_arms, horizon, dtype = int)
         self.horizon = horizon
 
+        low, high = self._regretRange()
+        stats = TrajectoryStats(grid, low * np.asarray(grid), high * np.asarray(grid),
+            scale=max(abs(low), abs(high)))
+        if self._batchable():
+            for size in self._batches(cycles):
+                self.runBatch(horizon, size, stats)
+                if progress is not None:
+                    progress(size)
+            return stats
+
+        record = {t: k for k, t in enumerate(grid)}
+        buffer = np.empty((min(cycles, TRAJECTORY_BUFFER), len(grid)))
+        filled = 0
         for i in range(cycles):
-            for i in range(self.bandit.n_arms):
-                self.bandit.pullArm(i)
-
-            for l in range(horizon - self.bandit.n_arms):
-                self.bandit.pullArm(self.alg.giveArm())
+            for t in range(1, horizon + 1):
+                self.bandit.pullArm(t - 1 if t <= self.bandit.n_arms else self.alg.giveArm())
+                if t in record:
+                    buffer[filled, record[t]] = self.bandit.giveRegret()
 
             self.total_regret += self.bandit.giveRegret()
             self.iterations += 1
-
             self.bandit.reset()
+            filled += 1
+            if filled == len(buffer) or i == cycles - 1:
+                stats.add(buffer[:filled])
+                filled = 0
+            if progress is not None:
+                progress(1)
+        return stats
+
+
+    def runStandard(self, horizon, cycles):
+        """
+        A standard experiment-running method.
+
+        Runs the bandit for a certain number of cycles each to a certain
+        horizon, and prints out the result on screen.
+
+        It uses _print_info to print information about the bandit itself upon
+        termination.
+        """
+        self.bandit.horizon = np.full(self.bandit.n_arms, horizon, dtype = int)
+        self.horizon = horizon
+
+        print("-"*50 + "\n")
+        start_time = time.perf_counter()
 
-        with open(out_file, "a") as outfile:
-            outfile.write("{0}\n".format(self.total_regret/self.iterations))
+        for regret in self._runCycles(horizon, cycles):
+            stdout.write(
+                "\r----------  "
+                "{0:d} out of {1} cycles"
+                "----------".format(self.iterations, cycles))
+            stdout.flush()
+
+        stop_time = time.perf_counter()
+        self.runtime = stop_time - start_time
+        self._print_info()
         return None
 
+
     def selfCheck(self):
         """
         Checks the simulation for errors
@@ -218,7 +387,8 @@ class ObjectDict:
     ArmDict = {
         'Bernoulli' : BernoulliArm,
         'Normal' : NormalArm,
-        'Linear' : LinearArm
+        'Linear' : LinearArm,
+        'General' : GeneralArm
     }
     AlgDict = {
         'var_dict' : {},
@@ -231,8 +401,11 @@ class ObjectDict:
         'TS_Gauss' : TS_Gauss,
         'Bayes_Gauss' : Bayes_Gauss,
         'UCB_Lin' : UCB_Lin,
-        'TS_Lin' : TS_Lin
+        'TS_Lin' : TS_Lin,
+        'exp' : exp
     }
+    BatchAlgs = (random, greedy, greedy_ep, UCB, UCB_KL, Bayes_Gauss, TS_Beta, TS_Gauss)
+    AdvBatchAlgs = (exp,)
     IndexDict = {
         'B1' : B1,
         'B2' : B2,
@@ -246,11 +419,17 @@ class ObjectDict:
     }
 
 
-def ReMapSim(sim_dict):
+def ReMapSim(sim_dict, seed=None):
     """
     Takes a simulation dictionary and turns string names into objects. It uses
     the ObjectDict class in order to create references to the actual objects.
+
+    The bandit, its arms and its algorithm all draw from a single numpy
+    Generator built from seed (an int, a SeedSequence or None for fresh
+    entropy).
     """
+    rng = np.random.default_rng(seed)
+    family = arm_family(sim_dict['Bandit'])
     for alg_key in list(sim_dict['Algorithm'].keys()):
         if alg_key == 'incr':
             sim_dict['Algorithm'][alg_key] = \
@@ -260,19 +439,29 @@ def ReMapSim(sim_dict):
                 ObjectDict.AlgDict[sim_dict['Algorithm'][alg_key]]
 
     sim_dict['Algorithm'] = Algorithm(**sim_dict['Algorithm'])
-    sim_dict['arm_object_list'] = [ObjectDict.ArmDict[arm[0]](arm[1])
-        for arm in sim_dict['Bandit']['ArmList']]
+    # stochastic arms are read straight into an ArmSet, without an object per arm
+    if family in ('Bernoulli', 'Normal'):
+        if 'ArmFile' in sim_dict['Bandit']:
+            sim_dict['arm_object_list'] = ArmSet.load(*sim_dict['Bandit']['ArmFile'])
+        else:
+            sim_dict['arm_object_list'] = ArmSet.from_list(sim_dict['Bandit']['ArmList'])
+    else:
+        sim_dict['arm_object_list'] = [ObjectDict.ArmDict[arm[0]](arm[1])
+            for arm in sim_dict['Bandit']['ArmList']]
 
     # different parsing for Linear and non-Linear bandits
-    if sim_dict['Bandit']['ArmList'][0][0] in ('Linear'):
+    if family in ('Linear'):
         sim_dict['vector_mean'] = sim_dict['Bandit']['MeanVector']
         sim_dict['Bandit'] = LinBandit(
             sim_dict['arm_object_list'],
             sim_dict['vector_mean'],
-            normalized=sim_dict['Normalized'])
+            normalized=sim_dict['Normalized'],
+            rng=rng)
         del[sim_dict['vector_mean']]
-    elif sim_dict['Bandit']['ArmList'][0][0] in ('Bernoulli', 'Normal'):
-        sim_dict['Bandit'] = StoBandit(sim_dict['arm_object_list'])
+    elif family in ('Bernoulli', 'Normal'):
+        sim_dict['Bandit'] = StoBandit(sim_dict['arm_object_list'], rng=rng)
+    elif family == 'General':
+        sim_dict['Bandit'] = AdvBandit(sim_dict['arm_object_list'], rng=rng)
 
     sim_dict['Simulation'] = Simulation(
         sim_dict['Bandit'],
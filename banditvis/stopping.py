@@ -0,0 +1,58 @@
+"""
+Sequential stopping of Histogram and Variable runs.
+
+With a Precision or RelativePrecision declared, the cycles of every simulation (Histogram) or sweep
+point (Variable) are run in chunks of at most STOPPING_CHUNK cycles, and the run stops as soon as
+the confidence interval on its mean regret is narrow enough; the declared cycles are an upper
+bound. The chunks do not depend on the number of processes, and are accepted in index order only,
+so the number of cycles used depends on the seed alone, and not on Multiprocess or on the order in
+which the pool finishes the chunks.
+"""
+
+import numpy as np
+from scipy.stats import norm
+
+from .helper import split_cycles
+
+# the largest number of cycles run between two checks of a stopping rule
+STOPPING_CHUNK = 200
+
+
+class StoppingRule:
+    """
+    Stops once the normal confidence interval on the mean regret is narrow enough.
+
+    Keyword Arguments:
+        * precision: the largest half-width of the interval, or False
+        * relative: the largest half-width as a fraction of the mean regret, or False
+        * confidence: the confidence level of the interval
+    Methods:
+        * halfwidth(count, total, square): the half-width of the interval of count cycles whose
+            regrets sum to total, and whose squared regrets sum to square
+        * done(count, total, square): whether the interval is narrow enough for either precision
+        * split(cycles): the chunk sizes of a run of at most cycles cycles, as few as keep every
+            chunk within STOPPING_CHUNK cycles
+    """
+    def __init__(self, precision=False, relative=False, confidence=0.95):
+        self.precision = precision
+        self.relative = relative
+        self.confidence = confidence
+        self.z = norm.ppf(0.5 + confidence / 2)
+
+    def __repr__(self):
+        return "StoppingRule(precision={}, relative={}, confidence={})".format(
+            self.precision, self.relative, self.confidence)
+
+    def halfwidth(self, count, total, square):
+        if count < 2:
+            return np.inf
+        variance = max(square - total**2 / count, 0) / (count - 1)
+        return self.z * np.sqrt(variance / count)
+
+    def done(self, count, total, square):
+        width = self.halfwidth(count, total, square)
+        return bool((self.precision and width <= self.precision)
+            or (self.relative and width <= self.relative * abs(total / count)))
+
+    def split(self, cycles):
+        return split_cycles(cycles, -(-cycles // STOPPING_CHUNK))
@@ -0,0 +1,215 @@
+"""
+The binary result store used for data files.
+
+A result file holds a small header followed by the raw values of every result appended so far:
+    * 4 bytes: the magic string b'BVRS'
+    * 12 bytes: the numpy dtype string of the values (eg. '<f8'), padded with null bytes
+    * the values, appended in chunks as they are produced
+
+Since the values are stored contiguously, the number of results is known from the file size alone,
+and readers can memory-map the file instead of parsing it.
+
+Methods:
+    * result_path(folder, i): the path of the i^th data file in a data folder
+    * cycles_path(folder, i): the path of the number of cycles of each sweep point of the i^th
+        simulation of a Variable run
+    * append_results(path, values): synchronously appends values to a result file
+    * read_results(folder, i): memory-maps the i^th data file of a data folder
+    * load_results(path): memory-maps a result file
+    * count_results(path): the number of results in a result file
+    * ResultTail(path): reads the results appended to a result file since the last read
+    * truncate_results(path, count): cuts a result file back to its first count results
+"""
+
+import os
+import queue
+import threading as th
+import time
+
+import numpy as np
+
+MAGIC = b'BVRS'
+HEADER_SIZE = 16
+# the number of chunks that may wait in a ResultWriter queue before producers block
+QUEUE_SIZE = 64
+
+
+def result_path(folder, i):
+    return "{}/data{}.bin".format(folder, i)
+
+
+def cycles_path(folder, i):
+    return "{}/cycles{}.bin".format(folder, i)
+
+
+def _header(dtype):
+    return MAGIC + np.dtype(dtype).str.encode().ljust(HEADER_SIZE - len(MAGIC), b'\0')
+
+
+def _read_dtype(path):
+    with open(path, 'rb') as file:
+        header = file.read(HEADER_SIZE)
+    if header[:len(MAGIC)] != MAGIC:
+        raise ValueError("'{}' is not a banditvis result file.".format(path))
+    return np.dtype(header[len(MAGIC):].rstrip(b'\0').decode())
+
+
+def _append(file, values, dtype):
+    if file.tell() == 0:
+        file.write(_header(dtype))
+    file.write(np.ascontiguousarray(values, dtype=dtype).tobytes())
+
+
+def append_results(path, values, dtype=np.float64):
+    """
+    Appends an array of values to a result file, creating it if necessary.
+    """
+    with open(path, 'ab') as file:
+        _append(file, values, dtype)
+    return None
+
+
+def count_results(path):
+    """
+    The number of results in a result file, computed from its size; a missing file has none.
+    """
+    try:
+        size = os.path.getsize(path)
+    except FileNotFoundError:
+        return 0
+    if size < HEADER_SIZE:
+        return 0
+    return (size - HEADER_SIZE) // _read_dtype(path).itemsize
+
+
+def truncate_results(path, count):
+    """
+    Cuts a result file back to its first count results, eg. to drop results appended after the
+    last checkpoint of an interrupted run. A missing file is left missing.
+    """
+    if os.path.isfile(path):
+        os.truncate(path, HEADER_SIZE + count * _read_dtype(path).itemsize if count else 0)
+    return None
+
+
+def read_results(folder, i):
+    """
+    Reads the i^th data file of a data folder.
+
+    Binary result files are memory-mapped, so nothing is parsed or copied until the values are
+    used. Data folders written by older versions only contain data{i}.txt, which is loaded as text.
+    """
+    path = result_path(folder, i)
+    if not os.path.isfile(path):
+        return np.atleast_1d(np.loadtxt("{}/data{}.txt".format(folder, i), float))
+    return load_results(path)
+
+
+def load_results(path):
+    """
+    Memory-maps a result file; an empty result file gives a zero-length array.
+    """
+    dtype = _read_dtype(path)
+    count = count_results(path)
+    if count == 0:
+        return np.zeros(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode='r', offset=HEADER_SIZE, shape=(count,))
+
+
+class ResultTail:
+    """
+    Follows a result file which is still being written, eg. by a ResultWriter.
+
+    Each read() returns only the results appended since the previous one, by seeking past the
+    results already read, so the cost of a read does not grow with the size of the file. A file
+    which does not exist yet reads as empty, and a partially written value is left for the next
+    read.
+
+    Positional Arguments:
+        * path: the path of the result file
+    Attributes:
+        * offset: the number of results read so far
+    Methods:
+        * read(): the results appended since the last read
+    """
+    def __init__(self, path):
+        self.path = path
+        self.offset = 0
+        self.dtype = None
+
+    def read(self):
+        count = count_results(self.path)
+        if count <= self.offset:
+            return np.zeros(0)
+        if self.dtype is None:
+            self.dtype = _read_dtype(self.path)
+        with open(self.path, 'rb') as file:
+            file.seek(HEADER_SIZE + self.offset * self.dtype.itemsize)
+            values = np.fromfile(file, self.dtype, count - self.offset)
+        self.offset += len(values)
+        return values
+
+
+class ResultWriter(th.Thread):
+    """
+    A background thread which appends results to result files.
+
+    Producers call write(path, values), which puts the chunk in a bounded queue and returns
+    immediately unless QUEUE_SIZE chunks are already waiting. The thread keeps every file it has
+    written to open until close() is called.
+
+    Keyword Arguments:
+        * dtype: the dtype the values are stored as (float64 or float32)
+    Attributes:
+        * seconds: a dict of {path: seconds spent appending to and flushing path}
+    Methods:
+        * write(path, values, done=None, dtype=None): queue a chunk of values to be appended to
+            path, stored as dtype if given (eg. integer counts) instead of the dtype of the writer;
+            done, if given, is called by the thread once the chunk is written and flushed
+        * close(): write every queued chunk, close the files and stop the thread; re-raises any
+            error raised while writing
+    """
+    def __init__(self, dtype=np.float64):
+        super(ResultWriter, self).__init__()
+        self.daemon = True
+        self.dtype = dtype
+        self.queue = queue.Queue(QUEUE_SIZE)
+        self.error = None
+        self.seconds = {}
+        self.start()
+
+    def run(self):
+        files = {}
+        try:
+            while True:
+                item = self.queue.get()
+                if item is None:
+                    break
+                path, values, done, dtype = item
+                start = time.perf_counter()
+                if path not in files:
+                    files[path] = open(path, 'ab')
+                _append(files[path], values, self.dtype if dtype is None else dtype)
+                files[path].flush()
+                self.seconds[path] = self.seconds.get(path, 0) + time.perf_counter() - start
+                if done is not None:
+                    done()
+        except Exception as e:
+            self.error = e
+            # keep draining so that producers never block on a dead writer
+            while self.queue.get() is not None:
+                pass
+        finally:
+            for file in files.values():
+                file.close()
+
+    def write(self, path, values, done=None, dtype=None):
+        self.queue.put((path, np.asarray(values), done, dtype))
+        return None
+
+    def close(self):
+        self.queue.put(None)
+        self.join()
+        if self.error is not None:
+            raise self.error
+        return None
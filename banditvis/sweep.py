@@ -0,0 +1,128 @@
+"""
+Compiles the '&&' placeholders of a Variable sweep.
+
+A simulation dictionary of a Variable plot contains strings such as '0.3 - &&', which are evaluated
+at every sweep point. A SweepTemplate finds these strings once and compiles each of them into a
+function of the sweep variable, along with the path to the value it sets (its binding). At each
+sweep point the bindings are applied to a Simulation that was built once, so nothing is evaluated
+from source or rebuilt per point.
+
+Bindings that can be applied in place are:
+    * horizon and cycles
+    * algorithm arguments other than algtype and incr (eg. alpha, epsilon, nu)
+    * the mean and variance of Bernoulli and Normal arms
+Any other binding (eg. the vectors of Linear arms) makes the template rebuild the Simulation from
+its compiled values at every point instead.
+"""
+
+import copy
+
+import numpy as np
+
+from .arms import arm_family
+from .simulation import ReMapSim
+
+# the names available to '&&' expressions
+NAMESPACE = {'np': np}
+# the arm attribute set by each position of the attribute list of a stochastic arm
+ARM_ATTRIBUTES = ('mean', 'variance')
+
+
+def _compile(expression):
+    return eval("lambda _x: " + expression.replace("&&", "(_x)"), dict(NAMESPACE))
+
+
+def _find(obj, path=()):
+    """
+    Yields (path, expression) for every string containing '&&' in the nested
+    dicts and lists of obj.
+    """
+    if isinstance(obj, dict):
+        for key, val in obj.items():
+            yield from _find(val, path + (key,))
+    elif isinstance(obj, list):
+        for k, val in enumerate(obj):
+            yield from _find(val, path + (k,))
+    elif isinstance(obj, str) and '&&' in obj:
+        yield (path, obj)
+
+
+class SweepTemplate:
+    """
+    A simulation dictionary with compiled '&&' placeholders.
+
+    Positional Arguments:
+        * sim_dict: a simulation dictionary which may contain '&&' placeholders
+    Attributes:
+        * sim_dict: the simulation dictionary
+        * bindings: a dict of {path: function of the sweep variable}
+        * rebindable: whether every binding can be applied to a built Simulation in place
+        * sim: the Simulation of the last sweep point
+    Methods:
+        * value(num, *path): the value at path for the sweep point num
+        * fill(num): a copy of sim_dict with every placeholder replaced by its value at num
+        * point(num, seed): the Simulation, horizon and cycles for the sweep point num
+    """
+    def __init__(self, sim_dict):
+        self.sim_dict = sim_dict
+        self.bindings = {path: _compile(expression) for path, expression in _find(sim_dict)}
+        self.rebindable = (arm_family(sim_dict['Bandit']) in ('Bernoulli', 'Normal')
+            and all(self._inPlace(path) for path in self.bindings))
+        self.sim = None
+
+    def _inPlace(self, path):
+        if path in (('horizon',), ('cycles',)):
+            return True
+        if path[0] == 'Algorithm':
+            return len(path) == 2 and path[1] not in ('algtype', 'incr')
+        if path[:2] == ('Bandit', 'ArmList'):
+            return (len(path) == 5 and path[3] == 1 and path[4] < len(ARM_ATTRIBUTES)
+                and self.sim_dict['Bandit']['ArmList'][path[2]][0] in ('Bernoulli', 'Normal'))
+        return False
+
+    def value(self, num, *path):
+        if path in self.bindings:
+            return self.bindings[path](num)
+        obj = self.sim_dict
+        for key in path:
+            obj = obj[key]
+        return obj
+
+    def fill(self, num, obj=None, path=()):
+        if path in self.bindings:
+            return self.bindings[path](num)
+        if obj is None:
+            obj = self.sim_dict
+        if isinstance(obj, dict):
+            filled = copy.copy(obj)
+            for key, val in obj.items():
+                filled[key] = self.fill(num, val, path + (key,))
+            return filled
+        elif isinstance(obj, list):
+            return [self.fill(num, val, path + (k,)) for k, val in enumerate(obj)]
+        return copy.deepcopy(obj)
+
+    def _bind(self, num, seed):
+        sim = self.sim
+        for path, func in self.bindings.items():
+            if path[0] == 'Algorithm':
+                sim.alg.var_dict[path[1]] = func(num)
+            elif path[0] == 'Bandit':
+                setattr(sim.bandit.arms[path[2]], ARM_ATTRIBUTES[path[4]], func(num))
+        sim.bandit.refresh(np.random.default_rng(seed))
+        sim.reset()
+        return None
+
+    def point(self, num, seed=None):
+        """
+        The (Simulation, horizon, cycles) of the sweep point num, seeded with
+        seed. The first call builds the Simulation; later calls rebind it in
+        place when the template is rebindable, and rebuild it otherwise.
+        """
+        if self.sim is None or not self.rebindable:
+            temp_dict = self.fill(num)
+            ReMapSim(temp_dict, seed)
+            self.sim = temp_dict['Simulation']
+        else:
+            self._bind(num, seed)
+        return (self.sim, self.value(num, 'horizon'), self.value(num, 'cycles'))
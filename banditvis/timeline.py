@@ -0,0 +1,100 @@
+"""
+Recorded timelines of a single cycle, used to play back and render Visualize animations.
+
+A Timeline holds one snapshot of the bandit per frame: the quantities the animations draw (pulls,
+empirical means, confidence bounds, rewards and, for linear bandits, the inverse Gram matrix),
+along with the regret and the timestep. Every quantity is an array with one row per frame,
+preallocated for the whole timeline, so any frame can be drawn without rerunning the simulation,
+and a range of frames can be sent to another process on its own. Snapshots are only drawn, so they
+are kept in 32 bit floats and integers, and a timeline may record only every few timesteps.
+
+A timeline can be filled by a background thread while it is read: count only grows once a
+snapshot is complete, so every frame below it can be read at any time.
+"""
+
+from types import SimpleNamespace
+
+import numpy as np
+
+# the quantities of a bandit recorded in each snapshot
+FIELDS = ('T', 'U', 'U_conf', 'arm_reward', 'G_inv')
+
+
+def timeline_frames(n_arms, horizon, steps=1):
+    """
+    The number of frames of an animation which starts once every arm was pulled, and shows every
+    steps^th timestep up to the horizon.
+    """
+    return max(horizon - n_arms, 0) // steps + 1
+
+
+def _compact(dtype):
+    return np.float32 if np.issubdtype(dtype, np.floating) else np.int32
+
+
+class Timeline:
+    """
+    Snapshots of a bandit, one per frame.
+
+    Positional Arguments:
+        * arrays: a dict of {name: array with one row per frame} of FIELDS, regret and timestep
+    Keyword Arguments:
+        * count: the number of frames already recorded (all of them if None)
+    Attributes:
+        * arrays: the recorded arrays; a field the bandit does not have (eg. G_inv for a StoBandit)
+            is left out
+        * count: the number of frames recorded so far
+    Methods:
+        * empty(bandit, frames): (classmethod) a timeline of frames snapshots of bandit, none of
+            which are recorded yet
+        * record(sim, frames, horizon, steps=1): (classmethod) an empty timeline, filled
+        * fill(sim, horizon, steps=1, stop=None): records the frames up to stop (every remaining
+            frame if None), stepping sim (as Simulation.runStep does for an animation of that
+            horizon) by steps timesteps between two frames
+        * state(k): the k^th snapshot, with one attribute per recorded quantity
+        * part(start, stop): the timeline of frames start to stop
+    """
+    def __init__(self, arrays, count=None):
+        self.arrays = arrays
+        self.count = len(self) if count is None else count
+
+    def __len__(self):
+        return len(self.arrays['timestep'])
+
+    @classmethod
+    def empty(cls, bandit, frames):
+        names = [name for name in FIELDS if getattr(bandit, name, None) is not None]
+        arrays = {name: np.empty((frames,) + np.shape(getattr(bandit, name)),
+            _compact(np.asarray(getattr(bandit, name)).dtype)) for name in names}
+        arrays['regret'] = np.empty(frames)
+        arrays['timestep'] = np.empty(frames, int)
+        return cls(arrays, 0)
+
+    @classmethod
+    def record(cls, sim, frames, horizon, steps=1):
+        timeline = cls.empty(sim.bandit, frames)
+        timeline.fill(sim, horizon, steps)
+        return timeline
+
+    def fill(self, sim, horizon, steps=1, stop=None):
+        bandit = sim.bandit
+        while self.count < (len(self) if stop is None else stop):
+            if self.count:
+                sim.runStep(steps, horizon)
+            for name, values in self.arrays.items():
+                if name in FIELDS:
+                    values[self.count] = getattr(bandit, name)
+            self.arrays['regret'][self.count] = bandit.giveRegret()
+            self.arrays['timestep'][self.count] = bandit.timestep[0]
+            self.count += 1
+        return None
+
+    def state(self, k):
+        state = SimpleNamespace(**{name: values[k] for name, values in self.arrays.items()})
+        for name in FIELDS:
+            if name not in self.arrays:
+                setattr(state, name, None)
+        return state
+
+    def part(self, start, stop):
+        return Timeline({name: values[start:stop] for name, values in self.arrays.items()})
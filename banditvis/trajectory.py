@@ -0,0 +1,214 @@
+"""
+Streaming statistics of regret trajectories, used by the Trajectory init.
+
+A trajectory is the cumulative regret of a cycle at every time step of a grid. Rather than keeping
+a (cycles x grid) matrix, every trajectory is folded into a TrajectoryStats as soon as it is
+produced, so memory stays proportional to the grid no matter how many cycles are run. Histogram
+runs use the same statistics on a grid of a single point (the horizon), with HISTOGRAM_BINS bins.
+
+Methods:
+    * trajectory_grid(horizon, points): every time step, or a log-spaced grid of them
+    * trajectory_path(folder, i): the path of the i^th trajectory file in a data folder
+    * histogram_path(folder, i): the path of the i^th histogram file in a data folder
+    * histogram_range(core_dict): the range binned by the histograms of a Histogram run
+"""
+
+import numpy as np
+
+# the number of histogram bins used to estimate the quantiles at each grid point
+QUANTILE_BINS = 256
+# the number of bins of the histogram of a Histogram run
+HISTOGRAM_BINS = 90
+# the largest number of grid points of a trajectory, which bounds the (grid, bins) histogram
+MAX_GRID_POINTS = 4096
+
+
+def trajectory_grid(horizon, points=None):
+    """
+    The time steps (number of pulls so far) at which regret is recorded.
+
+    Args:
+        horizon: the horizon of the simulation
+        points: the number of log-spaced grid points, or None for every time step
+    Returns:
+        An increasing integer array ending at horizon
+
+    Examples:
+
+    >>> trajectory_grid(5)
+    array([1, 2, 3, 4, 5])
+    >>> trajectory_grid(1000, 4)
+    array([   1,   10,  100, 1000])
+
+    """
+    if points is None or points >= horizon:
+        return np.arange(1, horizon + 1)
+    return np.unique(np.geomspace(1, horizon, max(points, 2)).round().astype(int))
+
+
+def trajectory_path(folder, i):
+    return "{}/data{}.npz".format(folder, i)
+
+
+def histogram_path(folder, i):
+    return "{}/hist{}.npz".format(folder, i)
+
+
+def histogram_range(core_dict):
+    """
+    The (lower, upper) range binned by every histogram of a Histogram run, so that the bins of all
+    its simulations line up. The bounds of each simulation are worked out by Check.Bins; an empty
+    range is widened to a width of 1.
+    """
+    lower = min(core_dict.get('lower_bins') or [0])
+    upper = np.amax(core_dict['bins'])
+    return (lower, upper if upper > lower else lower + 1)
+
+
+class TrajectoryStats:
+    """
+    Mergeable streaming statistics of the regret at each point of a grid.
+
+    The mean and variance are exact (Welford updates, merged with Chan's formula). Quantiles are
+    estimated from a histogram of QUANTILE_BINS bins per grid point spanning [lower, upper]; values
+    outside that range are counted in the end bins, and estimates are clipped to the exact minimum
+    and maximum seen. Since every statistic is a sum or an extremum, the statistics of independent
+    chunks of cycles can be merged in any order.
+
+    Given a scale, the bins are equally wide in sign(v) log(1 + |v| / scale) rather than in v, so
+    values much larger than scale are binned to a fixed relative error however wide [lower, upper]
+    is, and values near 0 to within a fraction of scale. The typical regret of a run is far below
+    the worst case bounding it, which equal-width bins would lump into the first few bins.
+
+    Positional Arguments:
+        * grid: the time steps at which the regret is recorded
+        * lower: the smallest expected regret at each grid point
+        * upper: the largest expected regret at each grid point
+    Keyword Arguments:
+        * bins: the number of histogram bins per grid point
+        * scale: the scale of log-spaced bins, or 0 for equal-width bins
+    Attributes:
+        * count, mean, minimum, maximum: arrays over the grid
+        * hist: the (grid, bins) array of histogram counts
+    Methods:
+        * add(values, k=None): folds in a (cycles, grid) array of trajectories, or a (cycles,)
+            array of regrets at the k^th grid point
+        * merge(other): folds in the statistics of another TrajectoryStats on the same grid
+        * variance(): the sample variance at each grid point
+        * quantile(q): the estimated q^th quantile at each grid point
+        * save(path) / TrajectoryStats.load(path): writes / reads a .npz file
+        * pack() / TrajectoryStats.unpack(values): converts to / from a flat float array, eg. to
+            store in a ResultCache
+    """
+    def __init__(self, grid, lower, upper, bins=QUANTILE_BINS, scale=0):
+        self.grid = np.asarray(grid)
+        self.scale = float(scale)
+        n = len(self.grid)
+        self.lower = np.broadcast_to(np.asarray(lower, dtype=float), (n,)).copy()
+        self.upper = np.broadcast_to(np.asarray(upper, dtype=float), (n,)).copy()
+        self.count = np.zeros(n, dtype=np.int64)
+        self.mean = np.zeros(n)
+        self.m2 = np.zeros(n)
+        self.minimum = np.full(n, np.inf)
+        self.maximum = np.full(n, -np.inf)
+        self.hist = np.zeros((n, bins), dtype=np.int64)
+
+    def _forward(self, values):
+        if not self.scale:
+            return values
+        return np.sign(values) * np.log1p(np.abs(values) / self.scale)
+
+    def _inverse(self, values):
+        if not self.scale:
+            return values
+        return np.sign(values) * np.expm1(np.abs(values)) * self.scale
+
+    def _width(self):
+        lower, upper = self._forward(self.lower), self._forward(self.upper)
+        return np.where(upper > lower, upper - lower, 1.0) / self.hist.shape[1]
+
+    def _combine(self, cols, count, mean, m2):
+        n_a = self.count[cols]
+        total = n_a + count
+        delta = mean - self.mean[cols]
+        self.mean[cols] += delta * count / total
+        self.m2[cols] += m2 + delta**2 * n_a * count / total
+        self.count[cols] = total
+
+    def add(self, values, k=None):
+        values = np.asarray(values, dtype=float)
+        if k is None:
+            cols = slice(None)
+        else:
+            cols = slice(k, k + 1)
+            values = values[:, None]
+        if len(values) == 0:
+            return None
+
+        mean = values.mean(axis=0)
+        self._combine(cols, len(values), mean, ((values - mean)**2).sum(axis=0))
+        self.minimum[cols] = np.minimum(self.minimum[cols], values.min(axis=0))
+        self.maximum[cols] = np.maximum(self.maximum[cols], values.max(axis=0))
+
+        bins = self.hist.shape[1]
+        index = np.clip(((self._forward(values) - self._forward(self.lower[cols]))
+            / self._width()[cols]).astype(int), 0, bins - 1)
+        index += np.arange(values.shape[1]) * bins
+        self.hist[cols] += np.bincount(index.ravel(),
+            minlength=values.shape[1] * bins).reshape(-1, bins)
+        return None
+
+    def merge(self, other):
+        self._combine(slice(None), other.count, other.mean, other.m2)
+        self.minimum = np.minimum(self.minimum, other.minimum)
+        self.maximum = np.maximum(self.maximum, other.maximum)
+        self.hist += other.hist
+        return self
+
+    def variance(self):
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return self.m2 / (self.count - 1)
+
+    def quantile(self, q):
+        cum = np.cumsum(self.hist, axis=1)
+        target = q * self.count
+        b = np.minimum(np.argmax(cum >= target[:, None], axis=1), self.hist.shape[1] - 1)
+        rows = np.arange(len(b))
+        before = cum[rows, b] - self.hist[rows, b]
+        frac = (target - before) / np.maximum(self.hist[rows, b], 1)
+        estimate = np.clip(self._inverse(self._forward(self.lower) + self._width() * (b + frac)),
+            self.minimum, self.maximum)
+        return np.where(self.count > 0, estimate, np.nan)
+
+    def save(self, path):
+        np.savez(path, grid=self.grid, lower=self.lower, upper=self.upper, scale=self.scale,
+            count=self.count, mean=self.mean, m2=self.m2, minimum=self.minimum,
+            maximum=self.maximum, hist=self.hist)
+        return None
+
+    def pack(self):
+        n, bins = self.hist.shape
+        return np.concatenate([[n, bins, self.scale], self.grid, self.lower, self.upper, self.count,
+            self.mean, self.m2, self.minimum, self.maximum, self.hist.ravel()]).astype(float)
+
+    @classmethod
+    def unpack(cls, values):
+        n, bins, scale = int(values[0]), int(values[1]), values[2]
+        grid, lower, upper, count, mean, m2, minimum, maximum = np.asarray(
+            values[3:3 + 8 * n]).reshape(8, n)
+        stats = cls(grid.astype(int), lower, upper, bins=bins, scale=scale)
+        stats.count = count.astype(np.int64)
+        stats.mean, stats.m2, stats.minimum, stats.maximum = mean, m2, minimum, maximum
+        stats.hist = np.asarray(values[3 + 8 * n:]).astype(np.int64).reshape(n, bins)
+        return stats
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            # files saved before log-spaced bins have equal-width bins
+            scale = data['scale'] if 'scale' in data.files else 0
+            stats = cls(data['grid'], data['lower'], data['upper'], bins=data['hist'].shape[1],
+                scale=scale)
+            for key in ('count', 'mean', 'm2', 'minimum', 'maximum', 'hist'):
+                setattr(stats, key, data[key])
+        return stats
@@ -1,11 +1,846 @@
+import contextlib
+import copy
+import io
+import json
+import multiprocessing as mp
+import os
+import tempfile
 import unittest
+from unittest import mock
+
+import matplotlib
+matplotlib.use('Agg')
+import numpy as np
+from PIL import Image
 
 import banditvis
+from banditvis.simulation import ReMapSim
+from banditvis.helper import split_cycles
+from banditvis.data import HistChunk, VarBlock, SetProgress
+from banditvis import store
+from banditvis.cache import ResultCache, cache_key
+from banditvis.checkpoint import Manifest, manifest_path
+from banditvis.stopping import StoppingRule
+from banditvis import manager
+from banditvis import animation
+from banditvis.parse import CoreDict, Check
+from banditvis.trajectory import TrajectoryStats, HISTOGRAM_BINS, trajectory_grid, histogram_path
+from banditvis.sweep import SweepTemplate
+from banditvis.timeline import Timeline, timeline_frames
+from banditvis.profiling import Profile, ProfileCollector, profile_path
+from banditvis import bench
+from banditvis.simulation import ObjectDict
+
+
+def _build_sim(algorithm, arm_list):
+    sim_dict = {'Algorithm': dict(algorithm), 'Bandit': {'ArmList': arm_list}}
+    ReMapSim(sim_dict)
+    return sim_dict['Simulation']
+
 
 class FirstTest(unittest.TestCase):
     def test_is_string(self):
         s = "superhappystring"
         self.assertTrue(isinstance(s, int))
 
+
+class ArmTest(unittest.TestCase):
+    def test_block_rewards(self):
+        bernoulli = banditvis.BernoulliArm([0.3])
+        rewards = [bernoulli.pull() for i in range(20000)]
+        self.assertTrue(set(rewards) <= {0, 1})
+        self.assertAlmostEqual(np.mean(rewards), 0.3, delta=0.02)
+        self.assertLessEqual(len(bernoulli._buffer), banditvis.arms.BLOCK_SIZE)
+
+        normal = banditvis.NormalArm([0.5, 4])
+        rewards = [normal.pull() for i in range(20000)]
+        self.assertAlmostEqual(np.mean(rewards), 0.5, delta=0.1)
+        self.assertAlmostEqual(np.var(rewards), 4, delta=0.3)
+
+    def test_arm_set(self):
+        arms = banditvis.ArmSet.from_list([['Bernoulli', [0.3]], ['Normal', [0.5, 4]]], rng=2)
+        bernoulli = [arms.pull(0) for i in range(20000)]
+        self.assertTrue(set(bernoulli) <= {0, 1})
+        self.assertAlmostEqual(np.mean(bernoulli), 0.3, delta=0.02)
+        normal = [arms.pull(1) for i in range(20000)]
+        self.assertAlmostEqual(np.mean(normal), 0.5, delta=0.1)
+        self.assertAlmostEqual(np.var(normal), 4, delta=0.3)
+        self.assertEqual([arm.info() for arm in arms], [['Bernoulli', 0.3], ['Normal', 0.5, 4.0]])
+
+        arms[1].variance = 1
+        self.assertEqual(arms.sd[1], 1)
+        with self.assertRaises(IndexError):
+            arms[2]
+
+    def test_arm_file(self):
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, "arms.npy")
+            np.save(path, [[0.2, 1], [0.6, 1], [0.4, 1]])
+            sim_dict = {'Algorithm': {'algtype': 'greedy'},
+                'Bandit': {'ArmFile': ['Normal', path]}, 'Normalized': False}
+            ReMapSim(sim_dict, 0)
+            bandit = sim_dict['Simulation'].bandit
+            self.assertIsInstance(bandit.arms, banditvis.ArmSet)
+            np.testing.assert_array_equal(bandit.mean_list, [0.2, 0.6, 0.4])
+            with self.assertRaises(ValueError):
+                banditvis.ArmSet.load('Bernoulli', path)
+
+        bandit = banditvis.StoBandit([banditvis.BernoulliArm([0.2]), banditvis.BernoulliArm([0.7])])
+        for i in range(5):
+            bandit.pullArm(i % 2)
+        np.testing.assert_array_equal(bandit.timestep, [5])
+        np.testing.assert_array_equal(bandit.T, [3, 2])
+
+
+class RegretTest(unittest.TestCase):
+    def test_running_regret(self):
+        rng = np.random.default_rng(1)
+        bandit = banditvis.StoBandit([banditvis.BernoulliArm([mean]) for mean in (0.1, 0.4, 0.7)])
+        seq = rng.random((3, 40))
+        adversarial = banditvis.core.AdvBandit([banditvis.arms.GeneralArm(row) for row in seq])
+        for t in range(40):
+            arm = rng.integers(3)
+            bandit.pullArm(arm)
+            adversarial.pullArm(arm)
+            self.assertAlmostEqual(bandit.giveRegret(), np.dot(bandit.T, [0.6, 0.3, 0]))
+            self.assertAlmostEqual(adversarial.giveRegret(),
+                np.sum(seq[adversarial.choices[:t + 1], np.arange(t + 1)])
+                - np.amin(np.sum(seq[:, :t + 1], axis=1)))
+        self.assertEqual(adversarial.choices.dtype, np.int8)
+        bandit.reset()
+        adversarial.reset()
+        self.assertEqual(bandit.giveRegret(), 0)
+        self.assertEqual(adversarial.giveRegret(), 0)
+        self.assertTrue(np.all(adversarial.choices == -1))
+
+    def test_best_loss_blocks(self):
+        seq = np.random.default_rng(2).random((5, 103))
+        np.testing.assert_allclose(banditvis.core._best_loss(seq, block=10)[1:],
+            np.amin(np.cumsum(seq, axis=1), axis=0))
+
+
+class BatchStoBanditTest(unittest.TestCase):
+    arm_list = [['Bernoulli', [0.2]], ['Bernoulli', [0.5]], ['Bernoulli', [0.8]]]
+
+    def test_pull_advances_every_replicate(self):
+        bandit = banditvis.BatchStoBandit(
+            [banditvis.BernoulliArm([0.2]), banditvis.NormalArm([0.5, 1])], 4)
+        bandit.pullArm(0)
+        bandit.pullArm(np.array([1, 1, 0, 1]))
+        np.testing.assert_array_equal(bandit.T, [[1, 1], [1, 1], [2, 0], [1, 1]])
+        np.testing.assert_array_equal(bandit.timestep, [2])
+        np.testing.assert_allclose(bandit.giveRegret(), [0.3, 0.3, 0.6, 0.3])
+
+    def test_batch_matches_single_cycle(self):
+        for algorithm in ({'algtype': 'greedy'},
+                          {'algtype': 'greedy_ep', 'epsilon': 0.1},
+                          {'algtype': 'UCB', 'incr': 'B6', 'alpha': 0.5},
+                          {'algtype': 'UCB', 'incr': 'B7', 'alpha': 0.5},
+                          {'algtype': 'TS_Beta'}):
+            sim = _build_sim(algorithm, self.arm_list)
+            regret = sim.runBatch(200, 500)
+            self.assertEqual(regret.shape, (500,))
+            self.assertEqual(sim.iterations, 500)
+            self.assertIs(sim.alg.bandit, sim.bandit)
+
+            sim = _build_sim(algorithm, self.arm_list)
+            sim.bandit.horizon = np.full(sim.bandit.n_arms, 200, dtype=int)
+            single = []
+            for i in range(50):
+                for j in range(sim.bandit.n_arms):
+                    sim.bandit.pullArm(j)
+                for l in range(200 - sim.bandit.n_arms):
+                    sim.bandit.pullArm(sim.alg.giveArm())
+                single.append(sim.bandit.giveRegret())
+                sim.bandit.reset()
+            self.assertLess(abs(np.mean(single) - np.mean(regret)),
+                4 * np.std(regret) / np.sqrt(50) + 1)
+
+    def test_index_solvers_match_across_replicates(self):
+        bandit = banditvis.BatchStoBandit(
+            [banditvis.BernoulliArm([mean]) for mean in (0.2, 0.5, 0.8, 0.9)], 6)
+        bandit.horizon = np.full(bandit.n_arms, 100, dtype=int)
+        for j in range(bandit.n_arms):
+            bandit.pullArm(j)
+        for l in range(40):
+            bandit.pullArm(banditvis.UCB_KL(bandit, {'incr': banditvis.B1}))
+        self.assertTrue(np.all(bandit.U_conf >= bandit.U))
+
+        for algtype in (banditvis.UCB_KL, banditvis.Bayes_Gauss):
+            batch_conf = bandit.U_conf.copy()
+            algtype(bandit, {'incr': banditvis.B4})
+            for row in range(bandit.cycles):
+                single = banditvis.StoBandit(bandit.arms)
+                single.horizon = bandit.horizon
+                single.timestep = bandit.timestep.copy()
+                single.T = bandit.T[row].copy()
+                single.U = bandit.U[row].copy()
+                single.U_conf = batch_conf[row].copy()
+                algtype(single, {'incr': banditvis.B4})
+                np.testing.assert_allclose(single.U_conf, bandit.U_conf[row])
+
+    def test_kl_index_without_exploration(self):
+        # with K T > horizon, log(B8) is negative and the index is the empirical mean
+        arm_list = [['Bernoulli', [mean]] for mean in np.linspace(0.1, 0.9, 20)]
+        sim = _build_sim({'algtype': 'UCB_KL', 'incr': 'B8'}, arm_list)
+        regret = sim.runRegret(200, 2)
+        self.assertTrue(np.all(np.isfinite(regret)))
+        self.assertTrue(np.all(sim.bandit.U_conf >= sim.bandit.U))
+
+    def test_min_sum_indices_match_dense(self):
+        def dense(bandit):
+            return 1 + bandit.timestep / (bandit.T * np.sum(np.minimum(1,
+                bandit.T[..., :, np.newaxis] / bandit.T[..., np.newaxis, :]), -2))
+
+        arms = [banditvis.BernoulliArm([mean]) for mean in np.linspace(0.1, 0.9, 12)]
+        for bandit in (banditvis.StoBandit(arms, rng=3), banditvis.BatchStoBandit(arms, 5, 3)):
+            bandit.horizon = np.full(bandit.n_arms, 300, dtype=int)
+            for cycle in range(2):
+                for j in range(bandit.n_arms):
+                    bandit.pullArm(j)
+                for l in range(150):
+                    np.testing.assert_allclose(banditvis.B6(bandit), dense(bandit))
+                    np.testing.assert_allclose(banditvis.B7(bandit),
+                        np.maximum(np.e, dense(bandit) - 1))
+                    bandit.pullArm(banditvis.UCB(bandit, {'incr': banditvis.B6, 'alpha': 2}))
+                bandit.reset()
+
+
+class LinBanditTest(unittest.TestCase):
+    def test_inverse_gram_matrix_tracks_gram_matrix(self):
+        arms = [banditvis.LinearArm([1., 0., 2.]), banditvis.LinearArm([0., 1., -1.]),
+                banditvis.LinearArm([3., 1., 0.])]
+        bandit = banditvis.LinBandit(arms, [0.3, 0.4, 0.1])
+        for arm in [0, 1, 2, 2, 0, 1, 1]:
+            bandit.pullArm(arm)
+            np.testing.assert_allclose(bandit.G_inv, np.linalg.inv(bandit.G), atol=1e-12)
+        np.testing.assert_allclose(bandit.U, np.linalg.solve(bandit.G, bandit.A))
+
+        bandit.reset()
+        np.testing.assert_array_equal(bandit.G_inv, np.identity(3))
+
+
+class Exp3Test(unittest.TestCase):
+    seq = np.random.default_rng(3).random((4, 3000)) * [[1], [1], [0.3], [1]]
+
+    def test_batch_matches_single_cycle(self):
+        sim = _build_sim({'algtype': 'exp'}, [['General', list(row)] for row in self.seq])
+        self.assertTrue(sim._batchable())
+        regret = sim.runBatch(3000, 200)
+        self.assertEqual(regret.shape, (200,))
+
+        single = []
+        for cycle in range(10):
+            for j in range(sim.bandit.n_arms):
+                sim.bandit.pullArm(j)
+            for l in range(3000 - sim.bandit.n_arms):
+                sim.bandit.pullArm(sim.alg.giveArm())
+            single.append(sim.bandit.giveRegret())
+            sim.bandit.reset()
+        self.assertLess(abs(np.mean(single) - np.mean(regret)),
+            4 * np.std(regret) / np.sqrt(10) + 1)
+        self.assertLess(np.mean(regret), np.sqrt(2 * 3000 * 4 * np.log(4)))
+
+    def test_log_weights_do_not_underflow(self):
+        sim = _build_sim({'algtype': 'exp', 'nu': 5.0},
+            [['General', list(row)] for row in self.seq])
+        regret = sim.runBatch(3000, 20)
+        self.assertTrue(np.all(np.isfinite(regret)))
+        for l in range(3000):
+            sim.bandit.pullArm(sim.alg.giveArm())
+        self.assertTrue(np.isfinite(sim.bandit.log_norm))
+        self.assertAlmostEqual(float(sim.bandit.log_norm),
+            np.logaddexp.reduce(sim.bandit.logW), delta=1e-6)
+
+
+class ChunkTest(unittest.TestCase):
+    sim_dict = {
+        'Algorithm': {'algtype': 'UCB', 'incr': 'B1', 'alpha': 2},
+        'Bandit': {'ArmList': [['Bernoulli', [0.2]], ['Bernoulli', ['0.2 + &&']]]},
+        'horizon': 50,
+        'cycles': 7}
+
+    def test_split_cycles(self):
+        self.assertEqual(split_cycles(10, 4), [3, 3, 2, 2])
+        self.assertEqual(split_cycles(2, 4), [1, 1])
+        self.assertEqual(split_cycles(5, 1), [5])
+
+    def test_split_ignores_processes(self):
+        self.assertEqual(manager._chunks(1024, 2**10), [256] * 4)
+        sim_dict = CoreDict({**self.sim_dict, 'Bandit': {'ArmList': [
+            ['Bernoulli', [0.2]], ['Bernoulli', [0.4]]]}, 'cycles': 60})
+        stats = []
+        for processes in (1, 3):
+            with tempfile.TemporaryDirectory() as folder:
+                core_dict = CoreDict({'init': 'Histogram', 'sim': [sim_dict],
+                    'DataFolder': folder, 'Multiprocess': processes, 'Seed': 2, 'Seeded': True,
+                    'Cache': False, 'RawData': False, 'bins': [10]})
+                progress = mp.Array('q', 1)
+                with mp.Pool(processes, manager._init_worker, (progress,)) as pool, \
+                        mock.patch.object(manager, 'CHUNK_PULLS', 500):
+                    manager._histRun(pool, core_dict, progress)
+                stats.append(TrajectoryStats.load(histogram_path(folder, 0)))
+        np.testing.assert_array_equal(stats[0].hist, stats[1].hist)
+        np.testing.assert_allclose(stats[0].mean, stats[1].mean)
+
+    def test_chunks(self):
+        i, regret = HistChunk(3, {**self.sim_dict, 'Bandit': {'ArmList': [
+            ['Bernoulli', [0.2]], ['Bernoulli', [0.4]]]}}, 7)
+        self.assertEqual(i, 3)
+        self.assertEqual(regret.shape, (7,))
+
+        i, [(j, total_regret, iterations)] = VarBlock(1, self.sim_dict, [(2, 0.5, 4, None)])
+        self.assertEqual((i, j, iterations), (1, 2, 4))
+        self.assertGreater(total_regret, 0)
+
+    def test_seeded_chunks_are_reproducible(self):
+        seed = np.random.SeedSequence(12, spawn_key=(0, 3))
+        for algorithm in ({'algtype': 'UCB', 'incr': 'B1', 'alpha': 2},
+                          {'algtype': 'TS_Beta'}):
+            sim_dict = {**self.sim_dict, 'Algorithm': algorithm}
+            self.assertEqual(VarBlock(0, sim_dict, [(0, 0.3, 20, seed)]),
+                             VarBlock(0, sim_dict, [(0, 0.3, 20, seed)]))
+        i, first = HistChunk(0, {**self.sim_dict, 'Algorithm': {'algtype': 'TS_Beta'},
+            'Bandit': {'ArmList': [['Bernoulli', [0.2]], ['Bernoulli', [0.4]]]}}, 30, seed)
+        i, second = HistChunk(0, {**self.sim_dict, 'Algorithm': {'algtype': 'TS_Beta'},
+            'Bandit': {'ArmList': [['Bernoulli', [0.2]], ['Bernoulli', [0.4]]]}}, 30, seed)
+        np.testing.assert_array_equal(first, second)
+
+    def test_progress(self):
+        progress = mp.Array('q', 2)
+        SetProgress(progress)
+        try:
+            HistChunk(1, {**self.sim_dict, 'Bandit': {'ArmList': [
+                ['Bernoulli', [0.2]], ['Bernoulli', [0.4]]]}}, 7)
+            VarBlock(1, {**self.sim_dict, 'Algorithm': {'algtype': 'TS_Gauss'}},
+                [(0, 0.5, 3, None)])
+        finally:
+            SetProgress(None)
+        self.assertEqual(progress[:], [0, 10 * 50])
+
+
+class TrajectoryTest(unittest.TestCase):
+    def test_stats_match_numpy(self):
+        rng = np.random.default_rng(4)
+        values = rng.gamma(2.0, size=(3000, 4)) * np.arange(1, 5)
+        first = TrajectoryStats(np.arange(1, 5), 0, 8 * np.arange(1, 5))
+        second = TrajectoryStats(np.arange(1, 5), 0, 8 * np.arange(1, 5))
+        first.add(values[:1000])
+        for k in range(4):
+            second.add(values[1000:, k], k)
+        stats = first.merge(second)
+
+        np.testing.assert_allclose(stats.mean, values.mean(axis=0))
+        np.testing.assert_allclose(stats.variance(), values.var(axis=0, ddof=1))
+        for q in (0.05, 0.5, 0.95):
+            np.testing.assert_allclose(stats.quantile(q), np.quantile(values, q, axis=0),
+                atol=0.15)
+
+    def test_log_bins(self):
+        # regret far below the worst case, and negative regret of adversarial bandits
+        rng = np.random.default_rng(5)
+        grid = np.array([10, 1000, 100000])
+        values = np.concatenate([rng.gamma(2.0, size=(3000, 3)) * np.log(grid),
+            -rng.gamma(2.0, size=(1000, 3))])
+        stats = TrajectoryStats(grid, -grid, grid, scale=1)
+        stats.add(values)
+        for q in (0.05, 0.1, 0.5, 0.75, 0.95):
+            np.testing.assert_allclose(stats.quantile(q), np.quantile(values, q, axis=0),
+                rtol=0.05, atol=0.1)
+        for copy in (TrajectoryStats.unpack(stats.pack()), stats.merge(TrajectoryStats(grid,
+                -grid, grid, scale=1))):
+            np.testing.assert_array_equal(copy.quantile(0.5), stats.quantile(0.5))
+
+    def test_grid_points_are_capped(self):
+        for points, horizon, errors in ((100, 10**6, 0), ('all', 1000, 0), ('all', 10**6, 1),
+                (10**5, 10**6, 1)):
+            core_dict = CoreDict({'GridPoints': points, 'sim': [{'horizon': horizon}]})
+            check = Check(core_dict)
+            check.Grid()
+            self.assertEqual(len(check.errors), errors)
+
+    def test_run_trajectory(self):
+        grid = trajectory_grid(60, 10)
+        for algorithm in ({'algtype': 'UCB', 'incr': 'B1', 'alpha': 2}, {'algtype': 'TS_Beta'}):
+            sim = _build_sim(algorithm, [['Bernoulli', [0.2]], ['Bernoulli', [0.6]]])
+            stats = sim.runTrajectory(60, 40, grid)
+            self.assertEqual(list(stats.count), [40] * len(grid))
+            self.assertAlmostEqual(stats.mean[-1], sim.total_regret / 40)
+            self.assertTrue(np.all(np.diff(stats.mean) >= 0))
+            self.assertTrue(np.all(stats.quantile(0.9) <= 0.4 * grid + 1e-9))
+
+    def test_save_and_load(self):
+        stats = TrajectoryStats(trajectory_grid(5), 0, 5)
+        stats.add(np.arange(15.).reshape(3, 5))
+        with tempfile.TemporaryDirectory() as folder:
+            stats.save(os.path.join(folder, "data0.npz"))
+            loaded = TrajectoryStats.load(os.path.join(folder, "data0.npz"))
+        np.testing.assert_array_equal(loaded.hist, stats.hist)
+        np.testing.assert_array_equal(loaded.quantile(0.5), stats.quantile(0.5))
+
+        stats = TrajectoryStats(trajectory_grid(5), 0, 5, scale=0.5)
+        stats.add(np.arange(15.).reshape(3, 5))
+        with tempfile.TemporaryDirectory() as folder:
+            stats.save(os.path.join(folder, "data0.npz"))
+            loaded = TrajectoryStats.load(os.path.join(folder, "data0.npz"))
+        self.assertEqual(loaded.scale, 0.5)
+        np.testing.assert_array_equal(loaded.quantile(0.5), stats.quantile(0.5))
+
+
+class SweepTest(unittest.TestCase):
+    sim_dict = {
+        'Algorithm': {'algtype': 'UCB', 'incr': 'B1', 'alpha': '2 * &&'},
+        'Bandit': {'ArmList': [['Normal', [0.2, 1]], ['Normal', ['0.2 + &&', 'np.sqrt(&&)']]]},
+        'horizon': 'int(100 * &&)',
+        'cycles': 5}
+
+    def test_compiled_values(self):
+        template = SweepTemplate(self.sim_dict)
+        self.assertTrue(template.rebindable)
+        self.assertEqual(template.value(0.5, 'horizon'), 50)
+        self.assertEqual(template.value(0.5, 'cycles'), 5)
+        filled = template.fill(0.25)
+        self.assertEqual(filled['Bandit']['ArmList'][1], ['Normal', [0.45, 0.5]])
+        self.assertEqual(filled['Algorithm']['alpha'], 0.5)
+        self.assertEqual(self.sim_dict['Algorithm']['alpha'], '2 * &&')
+
+    def test_rebinding_matches_rebuilding(self):
+        points = [(j, num, 5, np.random.SeedSequence(7, spawn_key=(j,)))
+            for j, num in enumerate([0.3, 0.6, 0.9])]
+        i, block = VarBlock(0, self.sim_dict, points)
+        for (j, num, cycles, seed), result in zip(points, block):
+            self.assertEqual(VarBlock(0, self.sim_dict, [(j, num, cycles, seed)])[1], [result])
+
+        template = SweepTemplate(self.sim_dict)
+        first = template.point(0.3)[0]
+        sim, horizon, cycles = template.point(0.6)
+        self.assertIs(sim, first)
+        self.assertEqual(sim.bandit.arms[1].mean, 0.8)
+        self.assertEqual(sim.alg.var_dict['alpha'], 1.2)
+
+    def test_linear_arms_are_rebuilt(self):
+        template = SweepTemplate({
+            'Algorithm': {'algtype': 'UCB_Lin'},
+            'Bandit': {'ArmList': [['Linear', [1., 0.]], ['Linear', [0., '&&']]],
+                'MeanVector': [0.3, 0.5]},
+            'Normalized': False, 'horizon': 20, 'cycles': 2})
+        self.assertFalse(template.rebindable)
+        first = template.point(1.0)[0]
+        second = template.point(2.0)[0]
+        self.assertIsNot(first, second)
+        np.testing.assert_array_equal(second.bandit.arm_vecs[1], [0., 2.])
+
+
+class CacheTest(unittest.TestCase):
+    sim_dict = {
+        'Algorithm': {'algtype': 'UCB', 'incr': 'B1', 'alpha': 2},
+        'Bandit': {'ArmList': [['Bernoulli', [0.2]], ['Bernoulli', ['0.2 + &&']]]},
+        'horizon': 40,
+        'cycles': 6,
+        'label': 'UCB'}
+
+    def test_get_put_evict(self):
+        with tempfile.TemporaryDirectory() as folder:
+            cache = ResultCache(folder, max_size=0.01)
+            self.assertIsNone(cache.get('a'))
+            cache.put('a', np.arange(500.))
+            np.testing.assert_array_equal(cache.get('a'), np.arange(500.))
+            os.utime(os.path.join(folder, 'a.bin'), (0, 0))
+            cache.put('b', np.arange(1000.))
+            self.assertIsNone(cache.get('a'))
+            self.assertIsNotNone(cache.get('b'))
+            self.assertEqual((cache.hits, cache.misses), (2, 2))
+
+    def test_keys(self):
+        self.assertEqual(cache_key(sim=self.sim_dict, seed=1),
+            cache_key(sim={**self.sim_dict, 'label': 'other'}, seed=1))
+        self.assertNotEqual(cache_key(sim=self.sim_dict, seed=1), cache_key(sim=self.sim_dict, seed=2))
+        self.assertNotEqual(cache_key(sim=self.sim_dict, seed=1),
+            cache_key(sim={**self.sim_dict, 'horizon': 41}, seed=1))
+
+    def test_runs_reuse_cache(self):
+        hist_dict = CoreDict({**self.sim_dict, 'Bandit': {'ArmList': [
+            ['Bernoulli', [0.2]], ['Bernoulli', [0.4]]]}})
+        var_dict = CoreDict(self.sim_dict)
+        with tempfile.TemporaryDirectory() as folder:
+            settings = {'Multiprocess': 2, 'Seed': 3, 'Seeded': True, 'Cache': True,
+                'CacheFolder': os.path.join(folder, 'cache')}
+            progress = mp.Array('q', 1)
+            with mp.Pool(2, manager._init_worker, (progress,)) as pool:
+                for run in ('first', 'second'):
+                    for init in ('Histogram', 'Variable'):
+                        os.makedirs(os.path.join(folder, run, init))
+                    output = io.StringIO()
+                    with contextlib.redirect_stdout(output), mock.patch.object(pool,
+                            'imap_unordered', wraps=pool.imap_unordered) as imap:
+                        manager._histRun(pool, CoreDict({'init': 'Histogram', 'sim': [hist_dict],
+                            'DataFolder': os.path.join(folder, run, 'Histogram'),
+                            'RawData': True, 'bins': [10], **settings}), progress)
+                        manager._varRun(pool, CoreDict({'init': 'Variable', 'sim': [var_dict],
+                            'DataFolder': os.path.join(folder, run, 'Variable'),
+                            'arg_list': [0.1, 0.3], **settings}), progress)
+                    if run == 'first':
+                        self.assertNotIn("reused", output.getvalue())
+                    else:
+                        self.assertIn(" 1 of 1 results reused", output.getvalue())
+                        self.assertIn(" 2 of 2 results reused", output.getvalue())
+                        # nothing is left to run, not even an empty task
+                        self.assertEqual([list(call.args[1]) for call in imap.call_args_list],
+                            [[], []])
+            self.assertEqual(len(os.listdir(os.path.join(folder, 'cache'))), 3)
+            for init in ('Histogram', 'Variable'):
+                np.testing.assert_array_equal(
+                    store.read_results(os.path.join(folder, 'first', init), 0),
+                    store.read_results(os.path.join(folder, 'second', init), 0))
+
+    def test_format(self):
+        key = cache_key(sim=self.sim_dict, seed=1)
+        banditvis.cache.CACHE_FORMAT += 1
+        try:
+            self.assertNotEqual(cache_key(sim=self.sim_dict, seed=1), key)
+        finally:
+            banditvis.cache.CACHE_FORMAT -= 1
+
+
+class CheckpointTest(unittest.TestCase):
+    def test_manifest(self):
+        with tempfile.TemporaryDirectory() as folder:
+            manifest = Manifest(folder)
+            self.assertIsNone(manifest.header)
+            manifest.start(init='Histogram', parts=4)
+            manifest.record(0, 1, count=10)
+            with open(manifest_path(folder), 'a') as file:
+                file.write('{"key": [0, 2], "co')  # killed while appending
+            manifest = Manifest(folder)
+            self.assertEqual(manifest.header, {'init': 'Histogram', 'parts': 4})
+            self.assertEqual(manifest.done(0, 1), {'count': 10})
+            self.assertIsNone(manifest.done(0, 2))
+            manifest.record(0, 2, count=20)
+            self.assertEqual(Manifest(folder).done(0, 2), {'count': 20})
+
+    def test_resume(self):
+        sim_dict = CoreDict({
+            'Algorithm': {'algtype': 'UCB', 'incr': 'B1', 'alpha': 2},
+            'Bandit': {'ArmList': [['Bernoulli', [0.3]], ['Bernoulli', [0.5]]]},
+            'horizon': 50,
+            'cycles': 40,
+            'label': 'UCB'})
+        with tempfile.TemporaryDirectory() as folder:
+            with open(os.path.join(folder, 'input.txt'), 'w') as file:
+                file.write('init: Histogram')
+            core_dict = CoreDict({'init': 'Histogram', 'sim': [sim_dict], 'DataFolder': folder,
+                'Multiprocess': 2, 'Seed': 1, 'Seeded': True, 'Cache': False, 'RawData': True,
+                'bins': [10]})
+            progress = mp.Array('q', 1)
+            with mp.Pool(2, manager._init_worker, (progress,)) as pool, \
+                    mock.patch.object(manager, 'CHUNK_PULLS', 250):
+                manifest = manager._checkpoint(core_dict, os.path.join(folder, 'input.txt'), {})
+                manager._histRun(pool, core_dict, progress, manifest)
+                full = np.sort(store.read_results(folder, 0))
+                # keeps the first two chunks, and leaves a partial chunk in the data file
+                with open(manifest_path(folder)) as file:
+                    lines = file.readlines()
+                with open(manifest_path(folder), 'w') as file:
+                    file.writelines(lines[:3])
+                store.append_results(store.result_path(folder, 0), [1., 2.])
+
+                manifest = manager._checkpoint(core_dict, os.path.join(folder, 'input.txt'), {})
+                self.assertEqual(len(manifest.records), 2)
+                manager._histRun(pool, core_dict, progress, manifest)
+            np.testing.assert_array_equal(np.sort(store.read_results(folder, 0)), full)
+            self.assertEqual(len(Manifest(folder).records), 8)
+
+
+class HistogramTest(unittest.TestCase):
+    def test_binned(self):
+        sim_dict = CoreDict({
+            'Algorithm': {'algtype': 'UCB', 'incr': 'B1', 'alpha': 2},
+            'Bandit': {'ArmList': [['Bernoulli', [0.3]], ['Bernoulli', [0.5]]]},
+            'horizon': 50,
+            'cycles': 300,
+            'label': 'UCB'})
+        stats = []
+        for raw in (True, False):
+            with tempfile.TemporaryDirectory() as folder:
+                core_dict = CoreDict({'init': 'Histogram', 'sim': [sim_dict], 'DataFolder': folder,
+                    'Multiprocess': 2, 'Seed': 1, 'Seeded': True, 'Cache': False,
+                    'RawData': raw, 'bins': [10]})
+                progress = mp.Array('q', 1)
+                with mp.Pool(2, manager._init_worker, (progress,)) as pool:
+                    manager._histRun(pool, core_dict, progress)
+                self.assertEqual(os.path.isfile(store.result_path(folder, 0)), raw)
+                stats.append(TrajectoryStats.load(histogram_path(folder, 0)))
+        np.testing.assert_array_equal(stats[0].hist, stats[1].hist)
+        np.testing.assert_array_equal(stats[0].count, [300])
+        np.testing.assert_allclose(stats[0].mean, stats[1].mean)
+        np.testing.assert_allclose(stats[0].variance(), stats[1].variance())
+        np.testing.assert_array_equal(TrajectoryStats.unpack(stats[1].pack()).hist, stats[1].hist)
+
+    def test_adversarial_range(self):
+        # loss sequences with equal means, whose regret is often negative
+        seq = np.random.default_rng(6).random((2, 40))
+        seq[1] = seq[1] - seq[1].mean() + seq[0].mean()
+        sim_dict = CoreDict({'Algorithm': {'algtype': 'exp'},
+            'Bandit': {'ArmList': [['General', list(row)] for row in seq]},
+            'horizon': 40, 'cycles': 200, 'label': 'Exp3'})
+        check = Check(CoreDict({'sim': [sim_dict]}))
+        check.Bins()
+        self.assertEqual((check.core_dict['lower_bins'], check.core_dict['bins']), ([-40], [40]))
+        with tempfile.TemporaryDirectory() as folder:
+            core_dict = CoreDict({'init': 'Histogram', 'sim': [sim_dict], 'DataFolder': folder,
+                'Multiprocess': 1, 'Seed': 1, 'Seeded': True, 'Cache': False, 'RawData': True,
+                **check.core_dict})
+            progress = mp.Array('q', 1)
+            with mp.Pool(1, manager._init_worker, (progress,)) as pool:
+                manager._histRun(pool, core_dict, progress)
+            regret = np.array(store.read_results(folder, 0))
+            stats = TrajectoryStats.load(histogram_path(folder, 0))
+        self.assertTrue(np.any(regret < 0))
+        self.assertEqual((stats.lower[0], stats.upper[0]), (-40, 40))
+        edges = np.linspace(-40, 40, HISTOGRAM_BINS + 1)
+        np.testing.assert_array_equal(stats.hist[0], np.histogram(regret, edges)[0])
+
+
+class ProfileTest(unittest.TestCase):
+    sim_dict = {
+        'Algorithm': {'algtype': 'UCB', 'incr': 'B1', 'alpha': 2},
+        'Bandit': {'ArmList': [['Bernoulli', [0.3]], ['Bernoulli', [0.5]]]},
+        'horizon': 50,
+        'cycles': 300,
+        'label': 'UCB'}
+
+    def test_quantiles(self):
+        profile = Profile()
+        profile.buffer = [1000] * 990 + [10**6] * 10
+        self.assertLessEqual(1e-6, profile.quantile(0.5))
+        self.assertLess(profile.quantile(0.5), 1.2e-6)
+        self.assertLessEqual(1e-3, profile.quantile(0.999))
+        self.assertIsNone(Profile().quantile(0.5))
+        merged = Profile().merge(profile).merge(profile)
+        self.assertEqual(merged.latency.sum(), 2000)
+
+    def test_instrument(self):
+        regret = []
+        for profiled in (False, True):
+            temp_dict = copy.deepcopy(self.sim_dict)
+            ReMapSim(temp_dict, 4)
+            sim = temp_dict['Simulation']
+            if profiled:
+                sim.instrument(Profile())
+            else:
+                self.assertNotIn('giveArm', vars(sim.alg))
+            regret.append(sim.runRegret(50, 7))
+        np.testing.assert_array_equal(regret[0], regret[1])
+        report = sim.profile.report()
+        self.assertEqual(report['phases']['giveArm']['calls'], 48)
+        self.assertEqual(report['phases']['pullArm']['calls'], 50)
+        self.assertEqual(sum(report['latency']['counts'].values()), 48)
+
+    def test_collected(self):
+        with tempfile.TemporaryDirectory() as folder:
+            core_dict = CoreDict({'init': 'Histogram', 'sim': [CoreDict(self.sim_dict)],
+                'DataFolder': folder, 'Multiprocess': 2, 'Seed': 1, 'Seeded': True,
+                'Cache': False, 'RawData': True, 'bins': [10]})
+            progress = mp.Array('q', 1)
+            reports = mp.Queue()
+            collector = ProfileCollector(reports, 1)
+            with mp.Pool(2, manager._init_worker, (progress, reports)) as pool:
+                manager._histRun(pool, core_dict, progress, collector=collector)
+                pool.close()
+                pool.join()
+            manager._collect(core_dict, collector)
+            with open(profile_path(folder, 0)) as file:
+                phases = json.load(file)['phases']
+        chunks = len(manager._chunks(300, 50))
+        self.assertEqual(phases['pullArm']['calls'], 50 * chunks)
+        self.assertEqual(phases['giveArm']['calls'], 48 * chunks)
+        self.assertGreater(phases['write']['seconds'], 0)
+
+
+class AnimationTest(unittest.TestCase):
+    def _view(self, view_class, sim_dict):
+        core_dict = CoreDict({'sim': [sim_dict], 'Seed': 1, 'NoAxesTick': False,
+            'LevelCurves': False, 'HelpLines': True})
+        fig, sim, view = animation._setup(core_dict, view_class)
+        fig.canvas.draw()
+        return fig, sim, view
+
+    def test_conf_view(self):
+        fig, sim, view = self._view(animation._ConfView, {
+            'Algorithm': {'algtype': 'UCB', 'incr': 'B1', 'alpha': 2},
+            'Bandit': {'ArmList': [['Bernoulli', [p]] for p in np.linspace(0.1, 0.9, 30)]}})
+        artists = view.artists
+        for _ in range(5):
+            sim.runStep(1, 100)
+            self.assertEqual(view.update(animation._state(sim.bandit)), artists)
+        heights = [np.amax(path.vertices[:,1]) for path in view.bars.get_paths()]
+        np.testing.assert_allclose(heights, sim.bandit.U_conf)
+        picked = np.argmax(sim.bandit.U_conf)
+        chosen = (view.bars.get_facecolor() == matplotlib.colors.to_rgba(view.picked_color))
+        np.testing.assert_array_equal(np.flatnonzero(chosen.all(axis=1)), [picked])
+        np.testing.assert_allclose(view.means.get_segments()[3][:,1], sim.bandit.U[3])
+
+    def test_dist_view(self):
+        fig, sim, view = self._view(animation._DistView, {
+            'Algorithm': {'algtype': 'TS_Beta'},
+            'Bandit': {'ArmList': [['Bernoulli', [0.2]], ['Bernoulli', [0.8]]]}})
+        limits = []
+        for _ in range(200):
+            sim.runStep(1, 1000)
+            view.update(animation._state(sim.bandit))
+            limits.append(view.ax.get_ylim()[1])
+        self.assertEqual(sorted(limits), limits)
+        self.assertGreater(limits[-1], 3)
+        self.assertEqual(view.legend.get_texts()[1].get_text(),
+            "Arm 2: Pulls: {}".format(int(sim.bandit.T[1])))
+
+
+    def test_timeline(self):
+        sim_dict = {'Algorithm': {'algtype': 'UCB', 'incr': 'B1', 'alpha': 2},
+            'Bandit': {'ArmList': [['Bernoulli', [0.2]], ['Bernoulli', [0.8]]]}}
+        sims = [animation._simulation(CoreDict({'sim': [copy.deepcopy(sim_dict)], 'Seed': 4}))
+            for i in range(2)]
+        frames = timeline_frames(2, 62, 3)
+        self.assertEqual(frames, 21)
+        timeline = Timeline.empty(sims[0].bandit, frames)
+        timeline.fill(sims[0], 62, 3, stop=5)
+        self.assertEqual(timeline.count, 5)
+        timeline.fill(sims[0], 62, 3)
+        self.assertEqual(timeline.count, frames)
+        np.testing.assert_array_equal(timeline.arrays['timestep'], np.arange(2, 63, 3))
+        self.assertEqual(timeline.arrays['U_conf'].dtype, np.float32)
+        self.assertIsNone(timeline.state(0).G_inv)
+
+        sims[1].runStep(9, 62)
+        state = timeline.part(3, 6).state(0)
+        np.testing.assert_array_equal(state.T, sims[1].bandit.T)
+        np.testing.assert_allclose(state.U, sims[1].bandit.U, rtol=1e-6)
+        self.assertEqual(state.regret, sims[1].bandit.giveRegret())
+
+    def test_render(self):
+        sim_dict = {'Algorithm': {'algtype': 'TS_Beta'},
+            'Bandit': {'ArmList': [['Bernoulli', [0.2]], ['Bernoulli', [0.8]]]}}
+        with tempfile.TemporaryDirectory() as folder, mp.Pool(2) as pool:
+            for save in ("frames/", "animation.gif"):
+                core_dict = CoreDict({'init': 'Visualize', 'visual': 'distribution', 'horizon': 31,
+                    'FPS': 10, 'sim': [CoreDict(copy.deepcopy(sim_dict))], 'Seed': 1,
+                    'PlotSave': os.path.join(folder, save), 'Render': True})
+                animation.RenderAnimation(pool, core_dict)
+            self.assertEqual(len(os.listdir(os.path.join(folder, "frames"))), 30)
+            with Image.open(os.path.join(folder, "animation.gif")) as video:
+                self.assertEqual(video.n_frames, 30)
+            self.assertEqual(sorted(os.listdir(folder)), ["animation.gif", "frames"])
+
+
+class BenchTest(unittest.TestCase):
+    def test_cases(self):
+        cases = bench.bench_cases()
+        self.assertEqual({case['algtype'] for case in cases}, set(ObjectDict.AlgDict) - {'var_dict'})
+        names = [bench.case_name(case) for case in cases]
+        self.assertEqual(len(names), len(set(names)))
+
+    def test_run_case(self):
+        case = {'algtype': 'UCB', 'extra': {'incr': 'B1', 'alpha': 2}, 'family': 'Bernoulli',
+            'n_arms': 5, 'dim': None, 'horizon': 50}
+        result = bench.run_case(case, 0.1)
+        for path in ('single', 'batch'):
+            self.assertEqual(result[path]['steps'], 45 * (1 if path == 'single' else bench.BENCH_CYCLES))
+            self.assertGreater(result[path]['steps_per_second'], 0)
+            self.assertGreater(result[path]['peak_memory'], 0)
+        self.assertIn('skipped', bench.run_case(dict(case, horizon=5), 0.1))
+
+        results = {'results': {bench.case_name(case): result}}
+        lines = bench.compare(results, results)
+        self.assertEqual(len(lines), 3)
+        self.assertTrue(lines[1].split()[-2:] == ['1', '1'])
+
+
+class StoppingTest(unittest.TestCase):
+    def test_rule(self):
+        rule = StoppingRule(precision=0.1)
+        regret = np.random.default_rng(0).normal(5, 1, 1000)
+        self.assertAlmostEqual(rule.halfwidth(1000, regret.sum(), regret @ regret),
+            1.96 * regret.std(ddof=1) / np.sqrt(1000), places=3)
+        self.assertTrue(rule.done(1000, regret.sum(), regret @ regret))
+        self.assertFalse(rule.done(100, regret[:100].sum(), regret[:100] @ regret[:100]))
+        self.assertTrue(StoppingRule(relative=0.02).done(1000, regret.sum(), regret @ regret))
+        self.assertEqual(rule.split(1000), [200] * 5)
+        self.assertEqual(rule.split(250), [125, 125])
+
+    def _varRun(self, cycles, processes):
+        sim_dict = CoreDict({
+            'Algorithm': {'algtype': 'UCB', 'incr': 'B1', 'alpha': 2},
+            'Bandit': {'ArmList': [['Bernoulli', [0.3]], ['Bernoulli', ['0.5 + &&']]]},
+            'horizon': 50,
+            'cycles': cycles,
+            'label': 'UCB'})
+        with tempfile.TemporaryDirectory() as folder:
+            core_dict = CoreDict({'init': 'Variable', 'sim': [sim_dict], 'DataFolder': folder,
+                'Multiprocess': processes, 'Seed': 1, 'Seeded': True, 'Cache': False,
+                'arg_list': [0, 0.2], 'Precision': 0.5, 'RelativePrecision': False,
+                'Confidence': 0.95})
+            progress = mp.Array('q', 1)
+            with mp.Pool(processes, manager._init_worker, (progress,)) as pool:
+                manager._varRun(pool, core_dict, progress)
+            return (np.array(store.read_results(folder, 0)),
+                np.array(store.load_results(store.cycles_path(folder, 0))))
+
+    def test_sequential(self):
+        results = [self._varRun(5000, processes) for processes in (1, 2)]
+        np.testing.assert_array_equal(results[0][0], results[1][0])
+        np.testing.assert_array_equal(results[0][1], results[1][1])
+        self.assertTrue(np.all(results[0][1] < 5000))
+
+    def test_chunks_ignore_processes(self):
+        # with few cycles, splitting by the number of processes would give smaller chunks
+        results = [self._varRun(1000, processes) for processes in (1, 2, 8)]
+        for regret, cycles in results[1:]:
+            np.testing.assert_array_equal(regret, results[0][0])
+            np.testing.assert_array_equal(cycles, results[0][1])
+        self.assertEqual(results[0][1].dtype, np.int64)
+        self.assertTrue(np.all(results[0][1] % 200 == 0))
+
+
+class StoreTest(unittest.TestCase):
+    def test_append_and_read(self):
+        with tempfile.TemporaryDirectory() as folder:
+            path = store.result_path(folder, 0)
+            self.assertEqual(store.count_results(path), 0)
+            store.append_results(path, [1.5, 2.5])
+            store.append_results(path, np.arange(3))
+            self.assertEqual(store.count_results(path), 5)
+            np.testing.assert_array_equal(store.read_results(folder, 0), [1.5, 2.5, 0, 1, 2])
+
+    def test_writer(self):
+        with tempfile.TemporaryDirectory() as folder:
+            writer = store.ResultWriter(np.float32)
+            for k in range(200):
+                writer.write(store.result_path(folder, k % 2), np.full(10, k))
+            writer.close()
+            data = store.read_results(folder, 1)
+            self.assertEqual(data.dtype, np.float32)
+            self.assertEqual(len(data), 1000)
+            np.testing.assert_array_equal(data[::10], np.arange(1, 200, 2))
+
+    def test_tail(self):
+        with tempfile.TemporaryDirectory() as folder:
+            path = store.result_path(folder, 0)
+            tail = store.ResultTail(path)
+            self.assertEqual(len(tail.read()), 0)
+            store.append_results(path, [1.5, 2.5])
+            np.testing.assert_array_equal(tail.read(), [1.5, 2.5])
+            with open(path, 'ab') as file:
+                file.write(np.array([3.5]).tobytes() + b'\0')  # a partially written value
+            np.testing.assert_array_equal(tail.read(), [3.5])
+            self.assertEqual(len(tail.read()), 0)
+            self.assertEqual(tail.offset, 3)
+
+    def test_text_fallback(self):
+        with tempfile.TemporaryDirectory() as folder:
+            with open(os.path.join(folder, "data0.txt"), "w") as file:
+                file.write("1.0\n")
+            np.testing.assert_array_equal(store.read_results(folder, 0), [1.0])
+
+
 if __name__ == "__main__":
-    unittest.main()
\ No newline at end of file
+    unittest.main()